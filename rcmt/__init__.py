@@ -5,7 +5,7 @@
 import importlib.metadata
 
 from .context import Context
-from .rcmt import execute, options_from_config
+from .rcmt import execute, execute_serve, execute_worker, options_from_config
 from .task import Task, register_task
 from .validate import validate
 from .verify import execute as execute_verify
@@ -14,7 +14,9 @@ __all__ = [
     "Context",
     "Task",
     "execute",
+    "execute_serve",
     "execute_verify",
+    "execute_worker",
     "options_from_config",
     "register_task",
     "validate",
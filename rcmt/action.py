@@ -12,7 +12,7 @@ from typing import Optional, Union
 
 import jinja2
 
-from rcmt import Context, util
+from rcmt import Context, context, fs, util
 
 
 def absent(target: str) -> None:
@@ -31,12 +31,15 @@ def absent(target: str) -> None:
                 absent("file.txt")
         ```
     """
-    if os.path.isfile(target):
-        os.remove(target)
+    path = os.path.join(fs.checkout_dir(), target)
+    if os.path.isfile(path):
+        os.remove(path)
+        _record_change(path)
         return
 
-    if os.path.isdir(target):
-        shutil.rmtree(target)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+        _record_change(path)
 
 
 def own(ctx: Context, content: str, target: str) -> None:
@@ -63,13 +66,16 @@ def own(ctx: Context, content: str, target: str) -> None:
                 own(content=content, target=".flake8")
         ```
     """
-    dir = os.path.dirname(target)
-    if dir != "" and os.path.exists(dir) is False:
+    path = ctx.path(target)
+    dir = os.path.dirname(path)
+    if os.path.exists(dir) is False:
         os.makedirs(name=dir)
 
-    with open(target, "w+") as f:
+    with open(path, "w+") as f:
         f.write(string.Template(content).substitute(ctx.template_data))
 
+    ctx.add_changed_path(path)
+
 
 def seed(ctx: Context, content: str, target: str) -> None:
     """Seed ensures that a file in a repository is present.
@@ -95,7 +101,7 @@ def seed(ctx: Context, content: str, target: str) -> None:
                 seed(content="foo:\n\t# foo", target="Makefile")
         ```
     """
-    if os.path.isfile(target):
+    if os.path.isfile(ctx.path(target)):
         return None
 
     own(ctx=ctx, content=content, target=target)
@@ -105,7 +111,7 @@ def exec(executable: str, args: Optional[list[str]] = None, timeout: int = 120)
     """exec calls an executable with the given arguments. The executable can then modify
     files. A common use case are code formatters such as black, prettier or "go fmt".
 
-    The current working directory is set to the checkout of a repository.
+    The working directory of the executable is set to the checkout of a repository.
 
     This action expects the executable it calls to have been installed already. It does
     not install the executable.
@@ -127,11 +133,16 @@ def exec(executable: str, args: Optional[list[str]] = None, timeout: int = 120)
                 exec(executable="black", args=["--line-length", "120", "."])
         ```
     """
+    ctx = context.active()
+    if ctx is not None:
+        # The executable can change any file.
+        ctx.add_unknown_changes()
+
     _args: list[str] = args if args else []
     result = subprocess.run(
         args=[executable] + _args,
         capture_output=True,
-        cwd=os.getcwd(),
+        cwd=fs.checkout_dir(),
         shell=False,
         timeout=timeout,
     )
@@ -163,7 +174,7 @@ def line_in_file(line: str, target: str) -> None:
                 line_in_file(line="The line", target="file.txt")
         ```
     """
-    repo_file_paths = util.iglob(os.getcwd(), target)
+    repo_file_paths = util.iglob(fs.checkout_dir(), target)
     for path in repo_file_paths:
         with open(path, "r") as f:
             for current_line in f:
@@ -174,6 +185,8 @@ def line_in_file(line: str, target: str) -> None:
             f.write(line)
             f.write("\n")
 
+        _record_change(path)
+
 
 def delete_line_in_file(
     search: str, target: str, re_flags: Union[int, re.RegexFlag] = 0
@@ -198,7 +211,7 @@ def delete_line_in_file(
         ```
     """
     regex = re.compile(pattern=search, flags=re_flags)
-    repo_file_paths = util.iglob(os.getcwd(), target)
+    repo_file_paths = util.iglob(fs.checkout_dir(), target)
     for path in repo_file_paths:
         with open(path, "r") as f:
             with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmpf:
@@ -212,6 +225,7 @@ def delete_line_in_file(
 
         if line_deleted:
             shutil.move(tmp_file_path, path)
+            _record_change(path)
 
 
 def replace_in_line(
@@ -251,7 +265,7 @@ def replace_in_line(
     """
     search_tpl = jinja2.Template(search)
     replace_tpl = jinja2.Template(replace)
-    repo_file_paths = util.iglob(os.getcwd(), target)
+    repo_file_paths = util.iglob(ctx.checkout_dir, target)
     for repo_file_path in repo_file_paths:
         search = search_tpl.render(ctx.template_data)
         replace = replace_tpl.render(ctx.template_data)
@@ -261,3 +275,10 @@ def replace_in_line(
                     tmpf.write(re.sub(search, replace, line, flags=re_flags))
 
         shutil.move(tmpf.name, repo_file_path)
+        ctx.add_changed_path(repo_file_path)
+
+
+def _record_change(path: str) -> None:
+    ctx = context.active()
+    if ctx is not None:
+        ctx.add_changed_path(path)
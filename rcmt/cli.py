@@ -3,12 +3,14 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 import sys
+from typing import Optional
 
 import click
 
 import rcmt
 from rcmt.log import configure as configure_logging
 from rcmt.log import get_logger
+from rcmt.rcmt import Shard
 
 # Default logging settings before any configuration has been read.
 configure_logging(log_format=None, level="error")
@@ -35,26 +37,107 @@ Apply Task "task.py" to a single repository.
 ```
 rcmt run --config ./config.yaml --repository github.com/wndhydrnt/rcmt-test ./task.py
 ```
+
+Resume a run that did not finish, e.g. because rcmt crashed.
+
+\b
+```
+rcmt run --config ./config.yaml --resume ./task.py
+```
+
+Stop after 45 minutes, e.g. before Kubernetes kills the Pod of a CronJob. The next run
+continues where this run stopped.
+
+\b
+```
+rcmt run --config ./config.yaml --max-duration 2700 ./task.py
+```
+
+Queue repositories in the database and let `rcmt worker` process them.
+
+\b
+```
+rcmt run --config ./config.yaml --enqueue ./task.py
+```
 """
 
 
+def _parse_shard(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[Shard]:
+    if value is None:
+        return None
+
+    try:
+        return Shard.from_string(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 @click.command(
     help=run_help,
     short_help="Apply a Task to all matching repositories of a remote Git host.",
 )
+@click.option(
+    "--concurrency",
+    help="Number of repositories to process concurrently. Overrides setting `workers` of the configuration file.",
+    default=None,
+    type=int,
+)
 @click.option("--config", help="Path to configuration file.", default="", type=str)
+@click.option(
+    "--enqueue",
+    help="Queue repositories in the database instead of processing them. Queues a repository only for the Tasks that need to process it, like a run without the flag. Processes started via `rcmt worker` process the queue. Waits until the queue is empty and records failed Tasks to retry them during the next run.",
+    default=False,
+    is_flag=True,
+)
+@click.option(
+    "--max-duration",
+    help="Time budget of the run in seconds. rcmt stops starting new repositories once the budget is nearly used up, finishes the repositories it is processing and exits. The next run continues where this run stopped. Receiving SIGTERM has the same effect.",
+    default=None,
+    type=float,
+)
 @click.option(
     "--repository",
     help="Name of a repository to which to apply the Task. Can be passed multiple times. rcmt will not query for all repositories if this option is set.",
     default=[],
     multiple=True,
 )
+@click.option(
+    "--resume",
+    help="Skip repositories that a Task has already processed during the previous run, if that run did not finish. Skips a repository only if the Task has not changed since.",
+    default=False,
+    is_flag=True,
+)
+@click.option(
+    "--shard",
+    help="Process only the repositories of one shard, in format <index>/<count>. The index starts at 0. Use to split a run across multiple nodes, e.g. run `--shard 0/2` and `--shard 1/2`.",
+    default=None,
+    type=str,
+    callback=_parse_shard,
+)
 @click.argument("task_file", nargs=-1)
-def run(config: str, repository: tuple[str], task_file: list[str]):
+def run(
+    concurrency: Optional[int],
+    config: str,
+    enqueue: bool,
+    max_duration: Optional[float],
+    repository: tuple[str],
+    resume: bool,
+    shard: Optional[Shard],
+    task_file: list[str],
+):
     try:
         opts = rcmt.options_from_config(config)
         opts.task_paths = task_file
         opts.repositories = list(repository)
+        opts.enqueue = enqueue
+        opts.max_duration = max_duration
+        opts.resume = resume
+        opts.shard = shard
+        if concurrency is not None:
+            opts.config.workers = concurrency
+
         configure_logging(
             log_format=opts.config.log_format,
             level=opts.config.log_level,
@@ -67,6 +150,75 @@ def run(config: str, repository: tuple[str], task_file: list[str]):
         exit(1)
 
 
+serve_help = """Apply Tasks to repositories when GitHub or GitLab send events.
+
+rcmt listens for webhooks at `/webhook` and applies all Tasks to the repository of an
+event. It processes a repository once no new event for it has arrived for
+`serve.debounce_seconds`. Tasks, clients of Sources and checkouts stay loaded between
+events. The `change_limit` of a Task applies to each period of
+`serve.change_limit_seconds`.
+
+GitHub: Send events "Pushes", "Pull requests", "Check suites" and "Statuses". Set
+`github.webhook_secret` to the secret of the webhook.
+
+GitLab: Send events "Push events", "Merge request events" and "Pipeline events". Set
+`gitlab.webhook_token` to the secret token of the webhook.
+
+rcmt rejects events of a Source without a secret and refuses to start if no secret is
+set.
+
+Examples
+
+Listen on port 8080 of localhost.
+
+\b
+```
+rcmt serve --config ./config.yaml ./task.py
+```
+
+Send an event.
+
+\b
+```
+curl -X POST -H 'X-Gitlab-Event: Merge Request Hook' \\
+  -H 'X-Gitlab-Token: <gitlab.webhook_token>' \\
+  -d '{"project": {"path_with_namespace": "wandhydrant/rcmt-test", "web_url": "https://gitlab.com/wandhydrant/rcmt-test"}}' \\
+  http://localhost:8080/webhook
+```
+"""
+
+
+@click.command(
+    help=serve_help,
+    short_help="Apply Tasks to repositories when GitHub or GitLab send events.",
+)
+@click.option("--config", help="Path to configuration file.", default="", type=str)
+@click.option(
+    "--port",
+    help="Port to listen on. Overrides setting `serve.port` of the configuration file.",
+    default=None,
+    type=int,
+)
+@click.argument("task_file", nargs=-1)
+def serve(config: str, port: Optional[int], task_file: list[str]):
+    try:
+        opts = rcmt.options_from_config(config)
+        opts.task_paths = task_file
+        if port is not None:
+            opts.config.serve.port = port
+
+        configure_logging(
+            log_format=opts.config.log_format,
+            level=opts.config.log_level,
+        )
+        result = rcmt.execute_serve(opts)
+        if result is False:
+            exit(1)
+    except Exception:
+        log.exception("Unexpected error")
+        exit(1)
+
+
 validate_help = """Validate Task files.
 
 Test that rcmt can load a task file. Useful during CI/CD before rolling out a change to
@@ -196,6 +348,52 @@ def verify(
         exit(1)
 
 
+worker_help = """Process repositories queued by `rcmt run --enqueue`.
+
+Start any number of workers, on one or more nodes. All workers and the process that
+queues repositories need to use the same database and the same Task files. Change limits
+of Tasks apply to all workers combined. If a worker stops, other workers process its
+repositories once its lease has expired.
+
+Examples
+
+Process queued repositories and stop after the queue has been empty for 60 seconds.
+
+\b
+```
+rcmt worker --config ./config.yaml --idle-timeout 60 ./task.py
+```
+"""
+
+
+@click.command(
+    help=worker_help,
+    short_help="Process repositories queued by `rcmt run --enqueue`.",
+)
+@click.option("--config", help="Path to configuration file.", default="", type=str)
+@click.option(
+    "--idle-timeout",
+    help="Stop after the queue has been empty for this number of seconds. Runs until stopped if not set.",
+    default=None,
+    type=float,
+)
+@click.argument("task_file", nargs=-1)
+def worker(config: str, idle_timeout: Optional[float], task_file: list[str]):
+    try:
+        opts = rcmt.options_from_config(config)
+        opts.task_paths = task_file
+        configure_logging(
+            log_format=opts.config.log_format,
+            level=opts.config.log_level,
+        )
+        result = rcmt.execute_worker(opts, idle_timeout=idle_timeout)
+        if result is False:
+            exit(1)
+    except Exception:
+        log.exception("Unexpected error")
+        exit(1)
+
+
 @click.command(
     help="Display version information",
     short_help="Display version information",
@@ -210,6 +408,8 @@ def main():
 
 
 main.add_command(run)
+main.add_command(serve)
 main.add_command(validate)
 main.add_command(verify)
 main.add_command(version)
+main.add_command(worker)
@@ -16,6 +16,12 @@ from pydantic_settings import (
 )
 
 
+class Apply(pydantic.BaseModel):
+    isolate: bool = False
+    memory_limit: int = 0
+    timeout: int = 600
+
+
 class Database(pydantic.BaseModel):
     connection: str = "sqlite:///:memory:"
     migrate: bool = True
@@ -25,18 +31,31 @@ class Git(pydantic.BaseModel):
     branch_prefix: str = "rcmt/"
     clone_options: dict[str, Any] = {"filter": "blob:none"}
     data_dir: str = os.path.join(tempfile.gettempdir(), "rcmt", "data")
+    fsmonitor: bool = False
     user_name: str = "rcmt"
     user_email: str = ""
 
 
+class RateLimit(pydantic.BaseModel):
+    enabled: bool = True
+    max_retries: int = 3
+    spread_below: float = 0.1
+
+
 class Github(pydantic.BaseModel):
     access_token: str = ""
     base_url: str = "https://api.github.com"
+    pool_size: int = 10
+    rate_limit: RateLimit = RateLimit()
+    webhook_secret: str = ""
 
 
 class Gitlab(pydantic.BaseModel):
+    pool_size: int = 10
     private_token: str = ""
+    rate_limit: RateLimit = RateLimit()
     url: str = "https://gitlab.com"
+    webhook_token: str = ""
 
 
 class Json(pydantic.BaseModel):
@@ -44,12 +63,34 @@ class Json(pydantic.BaseModel):
     extensions: list[str] = [".json"]
 
 
+class Pipeline(pydantic.BaseModel):
+    fetch_workers: int = 0
+    filter_workers: int = 0
+    queue_size: int = 0
+    sync_workers: int = 0
+    task_workers: int = 1
+
+
 class Pushgateway(pydantic.BaseModel):
     address: str = "localhost:9091"
     enabled: bool = False
     job_label: str = "rcmt"
 
 
+class Queue(pydantic.BaseModel):
+    lease_seconds: int = 300
+    max_attempts: int = 3
+    poll_interval: float = 5.0
+    retention_seconds: int = 604800
+
+
+class Serve(pydantic.BaseModel):
+    address: str = "127.0.0.1"
+    change_limit_seconds: int = 86400
+    debounce_seconds: float = 30.0
+    port: int = 8080
+
+
 class Toml(pydantic.BaseModel):
     extensions: list[str] = [".toml"]
 
@@ -64,6 +105,7 @@ class Config(BaseSettings):
         env_nested_delimiter="__", env_prefix="rcmt_", extra="allow"
     )
 
+    apply: Apply = Apply()
     custom: dict[str, Any] = {}
     database: Database = Database()
     dry_run: bool = False
@@ -74,11 +116,16 @@ class Config(BaseSettings):
     json_: Json = Field(alias="json", default=Json())
     log_format: Optional[str] = None
     log_level: str = "info"
+    pipeline: Pipeline = Pipeline()
     pr_title_prefix: str = "rcmt:"
     pr_title_body: str = "apply task {matcher_name}"
     pr_title_suffix: str = ""
     pushgateway: Pushgateway = Pushgateway()
+    queue: Queue = Queue()
+    serve: Serve = Serve()
+    skip_unchanged: bool = False
     toml: Toml = Toml()
+    workers: int = 1
     yaml: Yaml = Yaml()
 
     @classmethod
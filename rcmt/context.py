@@ -2,15 +2,30 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from typing import Any, Optional
+import contextlib
+import contextvars
+import os.path
+from typing import Any, Iterator, Optional
 
-from rcmt import source
+from rcmt import fs, source
+
+_active: contextvars.ContextVar[Optional["Context"]] = contextvars.ContextVar(
+    "rcmt_context", default=None
+)
 
 
 class Context:
     def __init__(
-        self, repo: source.Repository, custom_config: Optional[dict[str, Any]] = None
+        self,
+        repo: source.Repository,
+        custom_config: Optional[dict[str, Any]] = None,
+        checkout_dir: Optional[str] = None,
     ):
+        self._changed_paths: Optional[set[str]] = set()
+        self._checkout_dir: Optional[str] = None
+        if checkout_dir is not None:
+            self.checkout_dir = checkout_dir
+
         self._custom_config = custom_config if custom_config is not None else {}
         self._tpl_data: dict[str, Any] = {
             "repo_name": repo.name,
@@ -19,6 +34,49 @@ class Context:
         }
         self.repo = repo
 
+    def add_changed_path(self, path: str) -> None:
+        """
+        Records that an Action has changed the file or directory at `path`. Does nothing
+        once the changes are unknown.
+        """
+        if self._changed_paths is None:
+            return
+
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.checkout_dir)
+
+        self._changed_paths.add(path)
+
+    def add_unknown_changes(self) -> None:
+        """
+        Records that files have been changed that no Action can name, e.g. by an
+        executable.
+        """
+        self._changed_paths = None
+
+    @property
+    def changed_paths(self) -> Optional[set[str]]:
+        """
+        Paths relative to the checkout that Actions have changed. `None` if the changes
+        are unknown and rcmt needs to scan the whole checkout.
+        """
+        return self._changed_paths
+
+    @property
+    def checkout_dir(self) -> str:
+        """
+        Directory of the checkout of the repository. Actions resolve paths relative to
+        this directory.
+        """
+        if self._checkout_dir is None:
+            return fs.checkout_dir()
+
+        return self._checkout_dir
+
+    @checkout_dir.setter
+    def checkout_dir(self, value: str) -> None:
+        self._checkout_dir = os.path.abspath(value)
+
     @property
     def custom_config(self) -> dict[str, Any]:
         return self._custom_config
@@ -26,6 +84,12 @@ class Context:
     def get_template_data(self) -> dict[str, Any]:
         return self._tpl_data
 
+    def path(self, target: str) -> str:
+        """
+        Returns the absolute path of `target` in the checkout of the repository.
+        """
+        return os.path.join(self.checkout_dir, target)
+
     def set_template_key(self, key: str, value: Any):
         self._tpl_data[key] = value
 
@@ -35,3 +99,23 @@ class Context:
 
     def update_template_data(self, d: dict[str, Any]):
         self._tpl_data.update(d)
+
+
+def active() -> Optional[Context]:
+    """
+    Returns the Context of the Task that the current thread applies. Actions that do
+    not receive a Context record their changes on it.
+    """
+    return _active.get()
+
+
+@contextlib.contextmanager
+def use_context(ctx: Context) -> Iterator[None]:
+    """
+    Makes `ctx` the active Context of the current thread while a Task is applied.
+    """
+    token = _active.set(ctx)
+    try:
+        yield
+    finally:
+        _active.reset(token)
@@ -2,23 +2,68 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from datetime import datetime, timezone
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 import alembic.command
 from alembic.config import Config as AlembicConfig
-from sqlalchemy import Column, DateTime, Integer, String, create_engine, select
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    String,
+    UniqueConstraint,
+    and_,
+    create_engine,
+    delete,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from ..config import Database as DatabaseConfig
 
 Base = declarative_base()
 
 
+class Checkpoint(Base):
+    __tablename__ = "checkpoints"
+    __table_args__ = (UniqueConstraint("repository", "task"),)
+
+    id = Column(Integer, primary_key=True)
+    checksum = Column(String(length=32), nullable=False)
+    completed_at = Column(DateTime, nullable=False)
+    repository = Column(String(length=255), nullable=False)
+    task = Column(String(length=255), nullable=False)
+
+
 class Execution(Base):
     __tablename__ = "executions"
 
     id = Column(Integer, primary_key=True)
     executed_at = Column(DateTime, nullable=False)
+    shard = Column(String(length=32), nullable=True)
+
+
+class Failure(Base):
+    """
+    Failure records that a Task has failed to process a repository. The next run
+    retries the repository.
+    """
+
+    __tablename__ = "failures"
+    __table_args__ = (UniqueConstraint("repository", "task"),)
+
+    id = Column(Integer, primary_key=True)
+    failed_at = Column(DateTime, nullable=False)
+    repository = Column(String(length=255), nullable=False)
+    task = Column(String(length=255), nullable=False)
 
 
 class Run(Base):
@@ -27,15 +72,111 @@ class Run(Base):
     id = Column(Integer, primary_key=True)
     checksum = Column(String(length=32), nullable=False)
     name = Column(String(length=255), nullable=False)
+    shard = Column(String(length=32), nullable=True)
+    # Tasks have processed all repositories updated before this time.
+    since = Column(DateTime, nullable=True)
+
+
+class Snapshot(Base):
+    """
+    Snapshot records the inputs and the result of the last time a Task has processed a
+    repository.
+    """
+
+    __tablename__ = "snapshots"
+    __table_args__ = (UniqueConstraint("repository", "task"),)
+
+    id = Column(Integer, primary_key=True)
+    base_sha = Column(String(length=40), nullable=False)
+    branch_sha = Column(String(length=40), nullable=True)
+    fingerprint = Column(String(length=32), nullable=False)
+    repository = Column(String(length=255), nullable=False)
+    result = Column(String(length=32), nullable=False)
+    task = Column(String(length=255), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class WorkItem(Base):
+    """
+    WorkItem is a repository that a Task of a queued run needs to process.
+    """
+
+    __tablename__ = "work_items"
+
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_LEASED = "leased"
+    STATUS_PENDING = "pending"
+
+    id = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    checksum = Column(String(length=32), nullable=False)
+    lease_expires_at = Column(DateTime, nullable=True)
+    leased_by = Column(String(length=255), nullable=True)
+    queue_id = Column(String(length=32), nullable=False, index=True)
+    repository = Column(String(length=255), nullable=False)
+    reserved_change = Column(Boolean, nullable=False, default=False)
+    status = Column(String(length=16), nullable=False, index=True)
+    task = Column(String(length=255), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class WorkTask(Base):
+    """
+    WorkTask tracks the changes of a Task across all workers of a queued run.
+    """
+
+    __tablename__ = "work_tasks"
+    __table_args__ = (UniqueConstraint("queue_id", "task"),)
+
+    id = Column(Integer, primary_key=True)
+    change_limit = Column(Integer, nullable=True)
+    changes = Column(Integer, nullable=False, default=0)
+    changes_in_flight = Column(Integer, nullable=False, default=0)
+    checksum = Column(String(length=32), nullable=False)
+    failures = Column(Integer, nullable=False, default=0)
+    queue_id = Column(String(length=32), nullable=False)
+    task = Column(String(length=255), nullable=False)
+
+
+def _utcnow() -> datetime:
+    # Columns store UTC without a timezone.
+    return datetime.now(tz=timezone.utc).replace(tzinfo=None)
 
 
 class Database:
     def __init__(self, engine) -> None:
         self.session: sessionmaker = sessionmaker(engine, expire_on_commit=False)
+        # Workers of a run save checkpoints concurrently.
+        self._lock = threading.Lock()
+
+    def get_checkpoints(self, completed_after: datetime) -> dict[tuple[str, str], str]:
+        """
+        Returns the checkpoints saved after `completed_after`.
+
+        :return: Checksums of Tasks, keyed by name of the repository and name of the
+                 Task.
+        """
+        stmt = select(Checkpoint).where(
+            Checkpoint.completed_at > completed_after.replace(tzinfo=None)
+        )
+        with self._lock, self.session() as session:
+            return {
+                (checkpoint.repository, checkpoint.task): checkpoint.checksum
+                for checkpoint in session.scalars(stmt)
+            }
 
-    def get_last_execution(self) -> Execution:
-        stmt = select(Execution).order_by(Execution.executed_at.desc())
-        with self.session() as session:
+    def get_last_execution(self, shard: Optional[str] = None) -> Execution:
+        """
+        :param shard: Return the last Execution of this shard. `None` returns the last
+                      Execution of all repositories.
+        """
+        stmt = (
+            select(Execution)
+            .where(Execution.shard == shard)
+            .order_by(Execution.executed_at.desc())
+        )
+        with self._lock, self.session() as session:
             execution = session.scalars(stmt).first()
             if execution:
                 if execution.executed_at.tzinfo is None:
@@ -47,11 +188,14 @@ class Database:
             else:
                 ex = Execution()
                 ex.executed_at = datetime.fromtimestamp(0.0, tz=timezone.utc)
+                ex.shard = shard
                 return ex
 
-    def get_or_create_task(self, name: str, checksum: str = "") -> Run:
-        stmt = select(Run).where(Run.name == name)
-        with self.session() as session, session.begin():
+    def get_or_create_task(
+        self, name: str, checksum: str = "", shard: Optional[str] = None
+    ) -> Run:
+        stmt = select(Run).where(Run.name == name, Run.shard == shard)
+        with self._lock, self.session() as session, session.begin():
             run = session.scalars(stmt).first()
             if run:
                 return run
@@ -59,25 +203,534 @@ class Database:
             run = Run()
             run.checksum = checksum
             run.name = name
+            run.shard = shard
             session.add(run)
             return run
 
-    def update_task(self, name: str, checksum: str) -> None:
-        stmt = select(Run).where(Run.name == name)
-        with self.session() as session, session.begin():
+    def merge_shards(self, shards: list[str]) -> None:
+        """
+        Merges the results of sharded runs into the results of all repositories.
+
+        Saves an Execution for all repositories once every shard has finished an
+        Execution. Uses the time of the oldest of these Executions. Updates the checksum
+        of a Task once it is the same in every shard. Uses the oldest watermark of the
+        Task of all shards.
+
+        :param shards: Identifiers of all shards that together process all
+                       repositories.
+        """
+        with self._lock, self.session() as session, session.begin():
+            executed_at: list[datetime] = []
+            for shard in shards:
+                stmt = (
+                    select(Execution)
+                    .where(Execution.shard == shard)
+                    .order_by(Execution.executed_at.desc())
+                )
+                execution = session.scalars(stmt).first()
+                if execution is None:
+                    break
+
+                executed_at.append(execution.executed_at)
+
+            if len(executed_at) == len(shards):
+                merged_at = min(executed_at)
+                stmt = (
+                    select(Execution)
+                    .where(Execution.shard.is_(None))
+                    .order_by(Execution.executed_at.desc())
+                )
+                last = session.scalars(stmt).first()
+                if last is None or last.executed_at < merged_at:
+                    session.add(Execution(executed_at=merged_at))
+
+            checksums: dict[str, dict[str, str]] = {}
+            since: dict[str, list[Optional[datetime]]] = {}
+            for run in session.scalars(select(Run).where(Run.shard.in_(shards))):
+                checksums.setdefault(run.name, {})[run.shard] = run.checksum
+                since.setdefault(run.name, []).append(run.since)
+
+            for name, by_shard in checksums.items():
+                values = set(by_shard.values())
+                if len(by_shard) != len(shards) or len(values) != 1:
+                    continue
+
+                run_stmt = select(Run).where(Run.name == name, Run.shard.is_(None))
+                run = session.scalars(run_stmt).first()
+                if run is None:
+                    run = Run(name=name)
+
+                run.checksum = values.pop()
+                shard_since = [value for value in since[name] if value is not None]
+                run.since = (
+                    min(shard_since) if len(shard_since) == len(shards) else None
+                )
+                session.add(run)
+
+    def update_task(
+        self,
+        name: str,
+        checksum: str,
+        shard: Optional[str] = None,
+        since: Optional[datetime] = None,
+    ) -> None:
+        """
+        :param since: The Task has processed all repositories updated before this
+                      time. Keeps the current value if `None`.
+        """
+        stmt = select(Run).where(Run.name == name, Run.shard == shard)
+        with self._lock, self.session() as session, session.begin():
             run = session.scalars(stmt).first()
             run.checksum = checksum
+            if since is not None:
+                run.since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
             session.add(run)
             return
 
+    def delete_failures(self, repository: str) -> None:
+        with self._lock, self.session() as session, session.begin():
+            session.execute(delete(Failure).where(Failure.repository == repository))
+
+    def delete_failures_of_other_tasks(self, tasks: list[str]) -> int:
+        """
+        Deletes the failures of all Tasks except `tasks`.
+
+        :return: Number of failures deleted.
+        """
+        with self._lock, self.session() as session, session.begin():
+            result = session.execute(delete(Failure).where(Failure.task.not_in(tasks)))
+            return result.rowcount  # type: ignore[attr-defined]
+
+    def get_failures(self) -> dict[str, set[str]]:
+        """
+        :return: Names of the Tasks that have failed, keyed by name of the repository.
+        """
+        with self._lock, self.session() as session:
+            result: dict[str, set[str]] = {}
+            for failure in session.scalars(select(Failure).order_by(Failure.id)):
+                result.setdefault(failure.repository, set()).add(failure.task)
+
+            return result
+
+    def save_checkpoints(
+        self,
+        repository: str,
+        checksums: dict[str, str],
+        failed: Optional[list[str]] = None,
+    ) -> None:
+        """
+        Records that Tasks have processed a repository.
+
+        :param repository: Name of the repository.
+        :param checksums: Checksums of the Tasks that have processed the repository,
+                          keyed by name of the Task. Removes earlier failures of these
+                          Tasks.
+        :param failed: Names of the Tasks that have failed to process the repository.
+        """
+        failed = failed or []
+        if len(checksums) == 0 and len(failed) == 0:
+            return
+
+        # Strip the timezone to store the same value as other columns in UTC.
+        now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        stmt = select(Checkpoint).where(
+            Checkpoint.repository == repository,
+            Checkpoint.task.in_(checksums.keys()),
+        )
+        failure_stmt = select(Failure.task).where(
+            Failure.repository == repository, Failure.task.in_(failed)
+        )
+        with self._lock, self.session() as session, session.begin():
+            existing = {c.task: c for c in session.scalars(stmt)}
+            for task_name, checksum in checksums.items():
+                checkpoint = existing.get(task_name)
+                if checkpoint is None:
+                    checkpoint = Checkpoint(repository=repository, task=task_name)
+
+                checkpoint.checksum = checksum
+                checkpoint.completed_at = now
+                session.add(checkpoint)
+
+            if len(checksums) > 0:
+                session.execute(
+                    delete(Failure).where(
+                        Failure.repository == repository,
+                        Failure.task.in_(checksums.keys()),
+                    )
+                )
+
+            existing_failures = set(session.scalars(failure_stmt))
+            for task_name in failed:
+                if task_name not in existing_failures:
+                    session.add(
+                        Failure(failed_at=now, repository=repository, task=task_name)
+                    )
+
+    def get_snapshot(self, repository: str, task: str) -> Optional[Snapshot]:
+        stmt = select(Snapshot).where(
+            Snapshot.repository == repository, Snapshot.task == task
+        )
+        with self._lock, self.session() as session:
+            return session.scalars(stmt).first()
+
+    def save_snapshot(self, snapshot: Snapshot) -> None:
+        """
+        Replaces the Snapshot of the same repository and Task.
+        """
+        stmt = select(Snapshot).where(
+            Snapshot.repository == snapshot.repository, Snapshot.task == snapshot.task
+        )
+        with self._lock, self.session() as session, session.begin():
+            existing = session.scalars(stmt).first()
+            if existing is None:
+                existing = Snapshot(repository=snapshot.repository, task=snapshot.task)
+
+            existing.base_sha = snapshot.base_sha
+            existing.branch_sha = snapshot.branch_sha
+            existing.fingerprint = snapshot.fingerprint
+            existing.result = snapshot.result
+            existing.updated_at = _utcnow()
+            session.add(existing)
+
     def save_execution(self, execution: Execution):
-        with self.session() as session, session.begin():
+        with self._lock, self.session() as session, session.begin():
             session.add(execution)
             session.commit()
 
+    def add_work_items(
+        self, queue_id: str, repository: str, checksums: dict[str, str]
+    ) -> None:
+        """
+        Queues a repository for each Task.
+
+        :param queue_id: Identifier of the queued run.
+        :param repository: Name of the repository.
+        :param checksums: Checksums of the Tasks, keyed by name of the Task.
+        """
+        now = _utcnow()
+        with self._lock, self.session() as session, session.begin():
+            for task_name, checksum in checksums.items():
+                session.add(
+                    WorkItem(
+                        attempts=0,
+                        checksum=checksum,
+                        queue_id=queue_id,
+                        repository=repository,
+                        reserved_change=False,
+                        status=WorkItem.STATUS_PENDING,
+                        task=task_name,
+                        updated_at=now,
+                    )
+                )
+
+    def add_work_tasks(self, queue_id: str, tasks: list[WorkTask]) -> None:
+        with self._lock, self.session() as session, session.begin():
+            for work_task in tasks:
+                work_task.queue_id = queue_id
+                work_task.changes = 0
+                work_task.changes_in_flight = 0
+                work_task.failures = 0
+                session.add(work_task)
+
+    def claim_work_item(
+        self, worker: str, lease: timedelta, checksums: dict[str, str]
+    ) -> Optional[WorkItem]:
+        """
+        Leases the oldest pending WorkItem of one of the Tasks in `checksums`.
+
+        Multiple workers can call this method at the same time. Each WorkItem is leased
+        to only one of them.
+
+        :param worker: Name of the worker.
+        :param lease: Duration of the lease.
+        :param checksums: Checksums of the Tasks that the worker can process, keyed by
+                          name of the Task. The worker does not lease WorkItems of
+                          other versions of a Task.
+        :return: The leased WorkItem or None if no WorkItem is pending.
+        """
+        if len(checksums) == 0:
+            return None
+
+        matches_task = or_(
+            *[
+                and_(WorkItem.task == name, WorkItem.checksum == checksum)
+                for name, checksum in checksums.items()
+            ]
+        )
+        while True:
+            now = _utcnow()
+            with self._lock, self.session() as session, session.begin():
+                stmt = (
+                    select(WorkItem.id)
+                    .where(WorkItem.status == WorkItem.STATUS_PENDING, matches_task)
+                    .order_by(WorkItem.id)
+                    .limit(1)
+                )
+                item_id = session.scalars(stmt).first()
+                if item_id is None:
+                    return None
+
+                # Only one worker can change the status from "pending".
+                result = session.execute(
+                    update(WorkItem)
+                    .where(
+                        WorkItem.id == item_id,
+                        WorkItem.status == WorkItem.STATUS_PENDING,
+                    )
+                    .values(
+                        lease_expires_at=now + lease,
+                        leased_by=worker,
+                        status=WorkItem.STATUS_LEASED,
+                        updated_at=now,
+                    )
+                )
+                if result.rowcount == 1:  # type: ignore[attr-defined]
+                    return session.get(WorkItem, item_id)
+
+    def complete_work_item(self, item: WorkItem, worker: str, success: bool) -> bool:
+        """
+        Marks a WorkItem leased by `worker` as done or failed.
+
+        :return: False if the lease of the worker has expired in the meantime.
+        """
+        status = WorkItem.STATUS_DONE if success is True else WorkItem.STATUS_FAILED
+        with self._lock, self.session() as session, session.begin():
+            result = session.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.id == item.id,
+                    WorkItem.leased_by == worker,
+                    WorkItem.status == WorkItem.STATUS_LEASED,
+                )
+                .values(lease_expires_at=None, status=status, updated_at=_utcnow())
+            )
+            if result.rowcount != 1:  # type: ignore[attr-defined]
+                return False
+
+            if success is False:
+                session.execute(
+                    update(WorkTask)
+                    .where(
+                        WorkTask.queue_id == item.queue_id, WorkTask.task == item.task
+                    )
+                    .values(failures=WorkTask.failures + 1)
+                )
+
+            return True
+
+    def count_work_items(
+        self, statuses: list[str], queue_id: Optional[str] = None
+    ) -> int:
+        stmt = select(func.count(WorkItem.id)).where(WorkItem.status.in_(statuses))
+        if queue_id is not None:
+            stmt = stmt.where(WorkItem.queue_id == queue_id)
+
+        with self._lock, self.session() as session:
+            return session.scalars(stmt).one()
+
+    def delete_work_items(self, finished_before: datetime) -> int:
+        """
+        Deletes WorkItems that are done or have failed before `finished_before`. Also
+        deletes the WorkTasks of queues that have no WorkItems left.
+
+        :return: Number of WorkItems deleted.
+        """
+        with self._lock, self.session() as session, session.begin():
+            result = session.execute(
+                delete(WorkItem).where(
+                    WorkItem.status.in_([WorkItem.STATUS_DONE, WorkItem.STATUS_FAILED]),
+                    WorkItem.updated_at < finished_before.replace(tzinfo=None),
+                )
+            )
+            session.execute(
+                delete(WorkTask).where(
+                    WorkTask.queue_id.not_in(select(WorkItem.queue_id).distinct())
+                )
+            )
+            return result.rowcount  # type: ignore[attr-defined]
+
+    def extend_lease(self, item: WorkItem, worker: str, lease: timedelta) -> bool:
+        """
+        Extends the lease of a WorkItem.
+
+        :return: False if the lease has expired and another worker might have leased
+                 the WorkItem.
+        """
+        now = _utcnow()
+        with self._lock, self.session() as session, session.begin():
+            result = session.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.id == item.id,
+                    WorkItem.leased_by == worker,
+                    WorkItem.status == WorkItem.STATUS_LEASED,
+                )
+                .values(lease_expires_at=now + lease, updated_at=now)
+            )
+            return result.rowcount == 1  # type: ignore[attr-defined]
+
+    def get_finished_work_items(self, queue_id: str) -> list[WorkItem]:
+        """
+        :return: WorkItems of a queue that are done or have failed.
+        """
+        stmt = (
+            select(WorkItem)
+            .where(
+                WorkItem.queue_id == queue_id,
+                WorkItem.status.in_([WorkItem.STATUS_DONE, WorkItem.STATUS_FAILED]),
+            )
+            .order_by(WorkItem.id)
+        )
+        with self._lock, self.session() as session:
+            return list(session.scalars(stmt))
+
+    def get_work_task_failures(self, queue_id: str) -> dict[str, int]:
+        """
+        :return: Number of failed WorkItems of a queue, keyed by name of the Task.
+        """
+        stmt = select(WorkTask).where(WorkTask.queue_id == queue_id)
+        with self._lock, self.session() as session:
+            return {
+                work_task.task: work_task.failures
+                for work_task in session.scalars(stmt)
+            }
+
+    def release_work_change(self, item: WorkItem, changed: bool) -> None:
+        """
+        Returns a change reserved by reserve_work_change().
+
+        :param changed: Indicates if the worker created or merged a pull request.
+        """
+        with self._lock, self.session() as session, session.begin():
+            result = session.execute(
+                update(WorkItem)
+                .where(WorkItem.id == item.id, WorkItem.reserved_change.is_(True))
+                .values(reserved_change=False)
+            )
+            if result.rowcount != 1:  # type: ignore[attr-defined]
+                # Already released because the lease has expired.
+                return
+
+            session.execute(
+                update(WorkTask)
+                .where(WorkTask.queue_id == item.queue_id, WorkTask.task == item.task)
+                .values(
+                    changes=WorkTask.changes + (1 if changed is True else 0),
+                    changes_in_flight=WorkTask.changes_in_flight - 1,
+                )
+            )
+
+    def requeue_expired_work_items(self, max_attempts: int) -> int:
+        """
+        Returns WorkItems with an expired lease to the queue. Releases the changes
+        reserved by them. Marks a WorkItem as failed once it has been leased
+        `max_attempts` times.
+
+        :return: Number of WorkItems with an expired lease.
+        """
+        now = _utcnow()
+        stmt = select(WorkItem).where(
+            WorkItem.status == WorkItem.STATUS_LEASED, WorkItem.lease_expires_at < now
+        )
+        with self._lock, self.session() as session, session.begin():
+            items = list(session.scalars(stmt))
+            for item in items:
+                item.attempts += 1
+                item.lease_expires_at = None
+                item.leased_by = None
+                item.updated_at = now
+                if item.attempts >= max_attempts:
+                    item.status = WorkItem.STATUS_FAILED
+                    session.execute(
+                        update(WorkTask)
+                        .where(
+                            WorkTask.queue_id == item.queue_id,
+                            WorkTask.task == item.task,
+                        )
+                        .values(failures=WorkTask.failures + 1)
+                    )
+                else:
+                    item.status = WorkItem.STATUS_PENDING
+
+                if item.reserved_change is True:
+                    item.reserved_change = False
+                    session.execute(
+                        update(WorkTask)
+                        .where(
+                            WorkTask.queue_id == item.queue_id,
+                            WorkTask.task == item.task,
+                        )
+                        .values(changes_in_flight=WorkTask.changes_in_flight - 1)
+                    )
+
+                session.add(item)
+
+            return len(items)
+
+    def reserve_work_change(self, item: WorkItem) -> Optional[bool]:
+        """
+        Reserves one of the changes left until the Task of `item` reaches its change
+        limit. Counts the changes of all workers.
+
+        :return: True if the change has been reserved. False if the change limit has
+                 been reached. None if changes reserved by other workers could still
+                 use up the limit.
+        """
+        with self._lock, self.session() as session, session.begin():
+            work_task = session.scalars(
+                select(WorkTask).where(
+                    WorkTask.queue_id == item.queue_id, WorkTask.task == item.task
+                )
+            ).first()
+            if work_task is None or work_task.change_limit is None:
+                return True
+
+            if work_task.changes >= work_task.change_limit:
+                return False
+
+            result = session.execute(
+                update(WorkTask)
+                .where(
+                    WorkTask.id == work_task.id,
+                    WorkTask.changes + WorkTask.changes_in_flight
+                    < WorkTask.change_limit,
+                )
+                .values(changes_in_flight=WorkTask.changes_in_flight + 1)
+            )
+            if result.rowcount != 1:  # type: ignore[attr-defined]
+                return None
+
+            session.execute(
+                update(WorkItem)
+                .where(WorkItem.id == item.id)
+                .values(reserved_change=True)
+            )
+            return True
+
+    def work_change_limit_reached(self, item: WorkItem) -> bool:
+        stmt = select(WorkTask).where(
+            WorkTask.queue_id == item.queue_id, WorkTask.task == item.task
+        )
+        with self._lock, self.session() as session:
+            work_task = session.scalars(stmt).first()
+            if work_task is None or work_task.change_limit is None:
+                return False
+
+            return work_task.changes >= work_task.change_limit
+
 
 def new_database(cfg: DatabaseConfig) -> Database:
-    engine = create_engine(cfg.connection)
+    url = make_url(cfg.connection)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Share the in-memory database between all threads. By default, each thread
+        # would create its own, empty database.
+        engine = create_engine(
+            url, connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+    else:
+        engine = create_engine(url)
+
     if cfg.migrate is True:
         with engine.begin() as connection:
             alembic_config = AlembicConfig()
@@ -2,15 +2,60 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 import contextlib
+import contextvars
 import os
-from typing import Iterator
+import threading
+from typing import Iterator, Optional
+
+# Directory of the checkout that Actions resolve paths against. Stored in a
+# ContextVar so that each thread can work on its own checkout.
+_checkout_dir: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "rcmt_checkout_dir", default=None
+)
+
+# The current working directory is shared by all threads of the process.
+# Callers of in_checkout_dir() take turns changing it.
+_chdir_lock = threading.RLock()
+
+
+def checkout_dir() -> str:
+    """
+    checkout_dir returns the directory of the checkout that Actions operate on.
+
+    Falls back to the current working directory if no checkout has been set.
+    """
+    d = _checkout_dir.get()
+    if d is None:
+        return os.getcwd()
+
+    return d
 
 
 @contextlib.contextmanager
-def in_checkout_dir(d: str) -> Iterator[None]:
-    current = os.getcwd()
-    os.chdir(d)
+def use_checkout_dir(d: str) -> Iterator[None]:
+    """
+    use_checkout_dir sets the directory of the checkout for the current thread
+    without changing the current working directory of the process.
+    """
+    token = _checkout_dir.set(os.path.abspath(d))
     try:
         yield
     finally:
-        os.chdir(current)
+        _checkout_dir.reset(token)
+
+
+@contextlib.contextmanager
+def in_checkout_dir(d: str) -> Iterator[None]:
+    """
+    in_checkout_dir sets the directory of the checkout and changes the current working
+    directory to it. Kept for code that expects the current working directory to be
+    the checkout. Prefer use_checkout_dir().
+    """
+    with _chdir_lock:
+        current = os.getcwd()
+        os.chdir(d)
+        try:
+            with use_checkout_dir(d):
+                yield
+        finally:
+            os.chdir(current)
@@ -2,15 +2,19 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import contextlib
+import fcntl
+import hashlib
 import os.path
 import shutil
-from typing import Any, Mapping, Tuple, Union
+import threading
+from typing import Any, Iterable, Iterator, Mapping, Optional, Tuple
 
 import git
 from git.exc import GitCommandError
 
 import rcmt.log
-from rcmt import source
+from rcmt import metric, source
 
 log = rcmt.log.get_logger(__name__)
 
@@ -20,7 +24,155 @@ class BranchModifiedError(RuntimeError):
         self.checksums = checksums
 
 
+class PushResult:
+    """
+    PushResult is the outcome of pushing one branch via Checkout.push().
+
+    :param branch: Name of the branch.
+    :param pushed: `True` if the remote has accepted the branch.
+    :param rejected: `True` if the remote has rejected the branch itself. `False` if
+                     the branch has not been pushed because the remote rejected another
+                     branch of the same atomic push.
+    :param summary: Outcome as reported by git, e.g. "[rejected] (stale info)".
+    """
+
+    def __init__(self, branch: str, pushed: bool, rejected: bool, summary: str):
+        self.branch = branch
+        self.pushed = pushed
+        self.rejected = rejected
+        self.summary = summary
+
+
+class Checkout:
+    """
+    Checkout tracks if the mirror of a repository has been updated during the current
+    run. All Tasks that process a repository share one Checkout. The first Task to
+    prepare its work tree fetches from the remote. All other Tasks work from the local
+    refs.
+
+    The mirror is a bare clone of the repository. Each Task works in its own work tree
+    of the mirror, added via `git worktree`. All work trees share the objects of the
+    mirror. Tasks of the same repository can prepare their work trees at the same time.
+
+    A Checkout also owns the command wrapper of the mirror. Call close() once all Tasks
+    have processed the repository.
+
+    Other processes of rcmt that share the data directory can work with the same mirror
+    at the same time. locked() serializes changes to the mirror between them.
+
+    :param branches: Names of branches to fetch in addition to the base branch.
+                     Supports a single "*" as a wildcard, e.g. "rcmt/*".
+    """
+
+    def __init__(self, branches: list[str]):
+        self.branches = branches
+        self.fetched = False
+        self.heads: Optional[dict[str, str]] = None
+        self.configured = False
+        self.lock = threading.Lock()
+        self.lock_path: Optional[str] = None
+        self.mirror: Optional[git.Git] = None
+
+    def close(self) -> None:
+        """
+        Closes the command wrapper of the mirror. This stops the `git cat-file`
+        processes that GitPython keeps running for the wrapper.
+        """
+        with self.lock:
+            if self.mirror is not None:
+                self.mirror.clear_cache()
+                self.mirror = None
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Locks the mirror for the threads of this process. Also locks the file at
+        `lock_path`, if set, to lock the mirror for other processes.
+        """
+        with self.lock:
+            if self.lock_path is None:
+                yield
+                return
+
+            with file_lock(self.lock_path):
+                yield
+
+    def push(self, branches: list[str]) -> dict[str, PushResult]:
+        """
+        Pushes `branches` from the mirror in one atomic call to `git push`. Either the
+        remote accepts all branches or none of them. A branch replaces the branch on the
+        remote only if the remote branch still points to the commit fetched during this
+        run.
+
+        :return: Outcome of the push keyed by name of the branch.
+        """
+        with self.locked():
+            if self.mirror is None:
+                raise RuntimeError("mirror has not been fetched")
+
+            refs = list_refs(self.mirror)
+            args: list[str] = ["--atomic", "--porcelain"]
+            refspecs: list[str] = []
+            for branch in branches:
+                # An empty value expects that the branch does not exist on the remote.
+                expected = refs.get(f"refs/remotes/origin/{branch}", "")
+                args.append(f"--force-with-lease=refs/heads/{branch}:{expected}")
+                refspecs.append(f"refs/heads/{branch}:refs/heads/{branch}")
+
+            error: Optional[GitCommandError] = None
+            try:
+                output = self.mirror.push(*args, "origin", *refspecs)
+            except GitCommandError as e:
+                output = str(e.stdout)
+                error = e
+
+            results = parse_push_porcelain(output)
+            for branch in branches:
+                result = results.get(branch)
+                if result is None:
+                    # git has not reported the branch, e.g. because the remote could
+                    # not be reached.
+                    if error is not None:
+                        log.warning(
+                            "Pushing branch failed branch=%s", branch, exc_info=error
+                        )
+
+                    results[branch] = PushResult(
+                        branch=branch,
+                        pushed=False,
+                        rejected=False,
+                        summary="push failed" if error is not None else "not pushed",
+                    )
+                elif result.pushed is True:
+                    # The mirror does not configure a fetch refspec. Keep the
+                    # remote-tracking branch in line with the remote manually.
+                    self.mirror.update_ref(
+                        f"refs/remotes/origin/{branch}", refs[f"refs/heads/{branch}"]
+                    )
+
+            return results
+
+    def refspecs(self, base_branch: str) -> list[str]:
+        refspecs = [f"+refs/heads/{base_branch}:refs/remotes/origin/{base_branch}"]
+        for branch in self.branches:
+            # `git fetch` fails if a branch without a wildcard does not exist on the
+            # remote, which is the case before rcmt pushes a branch for the first time.
+            if "*" not in branch:
+                branch = f"{branch}*"
+
+            refspecs.append(f"+refs/heads/{branch}:refs/remotes/origin/{branch}")
+
+        return refspecs
+
+
 class Git:
+    """
+    Git prepares the work tree of one Task in a repository.
+
+    :param paths: Directories to check out. `None` checks out all files.
+    :param fsmonitor: Enable the builtin file system monitor of git in the mirror.
+    """
+
     def __init__(
         self,
         branch_name: str,
@@ -28,20 +180,92 @@ class Git:
         data_dir: str,
         user_name: str,
         user_email: str,
+        checkout: Optional[Checkout] = None,
+        paths: Optional[list[str]] = None,
+        fsmonitor: bool = False,
     ):
         self.branch_name = branch_name
         self.clone_opts = clone_opts
         self.data_dir = data_dir
+        self.fsmonitor = fsmonitor
+        self.paths = normalize_paths(paths) if paths is not None else None
+        self.repo: Optional[git.Repo] = None
         self.user_email = user_email
         self.user_name = user_name
+        if checkout is None:
+            self.checkout = Checkout([branch_name])
+            self._owns_checkout = True
+        else:
+            self.checkout = checkout
+            self._owns_checkout = False
 
     def checkout_dir(self, repo: source.Repository) -> str:
-        return os.path.join(self.data_dir, repo.source, repo.project, repo.name)
+        """
+        :return: Path to the work tree of the Task. The name of the directory is unique
+                 for each branch, e.g. "rcmt/foo" and "rcmt-foo" use different work
+                 trees.
+        """
+        checksum = hashlib.sha256(self.branch_name.encode("utf-8")).hexdigest()
+        return os.path.join(
+            self.data_dir,
+            "worktrees",
+            repo.source,
+            repo.project,
+            repo.name,
+            f"{self.branch_name.replace('/', '-')}-{checksum[:12]}",
+        )
 
-    def commit_changes(self, repo_dir: str, msg: str):
-        git_repo = git.Repo(path=repo_dir)
-        git_repo.git.add(all=True)
-        git_repo.index.commit(msg)
+    def mirror_dir(self, repo: source.Repository) -> str:
+        return os.path.join(
+            self.data_dir, "mirrors", repo.source, repo.project, f"{repo.name}.git"
+        )
+
+    def close(self) -> None:
+        """
+        Closes the handle of the work tree. Also closes the Checkout if no other Task
+        shares it.
+        """
+        if self.repo is not None:
+            self.repo.close()
+            self.repo = None
+
+        if self._owns_checkout is True:
+            self.checkout.close()
+
+    def open(self, repo_dir: str) -> git.Repo:
+        """
+        Returns the handle of the work tree in `repo_dir`. Reuses the handle opened by
+        prepare().
+        """
+        if self.repo is None:
+            self.repo = git.Repo(path=repo_dir)
+
+        if os.path.realpath(self.repo.working_dir) == os.path.realpath(repo_dir):
+            return self.repo
+
+        return git.Repo(path=repo_dir)
+
+    def commit_changes(
+        self, repo_dir: str, msg: str, targets: Optional[Iterable[str]] = None
+    ):
+        """
+        Commits all changes in the work tree.
+
+        :param targets: Stage only these paths instead of all files in the work tree.
+        """
+        git_repo = self.open(repo_dir)
+        args: list[str] = []
+        if targets is not None:
+            args = ["--", *literal_pathspecs(targets)]
+
+        if self.paths is None:
+            git_repo.git.add(*args, all=True)
+        else:
+            # Also add files that an Action has created outside of the sparse checkout.
+            git_repo.git.add(*args, all=True, sparse=True)
+
+        # The index of GitPython cannot read a sparse index. Let git commit.
+        git_repo.git.commit(message=msg)
 
     def _detect_modified_branch(
         self,
@@ -59,144 +283,319 @@ class Git:
         if len(foreign_commits) > 0:
             raise BranchModifiedError(foreign_commits)
 
-    @staticmethod
-    def has_changes_origin(branch: str, repo_dir: str) -> bool:
-        git_repo = git.Repo(path=repo_dir)
+    def has_changes_origin(self, branch: str, repo_dir: str) -> bool:
+        """
+        Checks if the commit checked out in `repo_dir` contains other files than the
+        branch on the remote. Compares the hashes of the trees of both commits. This
+        does not depend on the number of files in the repository. Expects that all
+        changes have been committed.
+        """
+        git_repo = self.open(repo_dir)
         try:
-            return len(git_repo.index.diff(f"origin/{branch}")) > 0
-        except git.BadName:
-            # git.BadName thrown if "origin/<branch>" does not exist.
-            # That means that this is the first time the Task is executed for this
-            # repository. Always push in this case, thus return True here.
-            return True
+            output = git_repo.git.rev_parse(
+                "HEAD^{tree}", f"origin/{branch}^{{tree}}", "--"
+            )
+        except GitCommandError as e:
+            # "origin/<branch>" does not exist. That means that this is the first time
+            # the Task is executed for this repository. Always push in this case, thus
+            # return True here.
+            if "bad revision" in str(e.stderr):
+                return True
+
+            raise e
+
+        trees = output.splitlines()
+        return trees[0] != trees[1]
 
     @staticmethod
-    def has_changes_local(repo_dir: str) -> bool:
-        git_repo = git.Repo(path=repo_dir)
-        return len(git_repo.index.diff(None)) > 0 or len(git_repo.untracked_files) > 0
-
-    def prepare(
-        self, repo: source.Repository, force_rebase: bool, iteration: int = 0
-    ) -> Tuple[str, bool]:
-        """
-        1. Clone repository
-        2. Checkout base branch
-        3. Update base branch
-        4. Create task branch
-        5. Reset task branch to base branch
+    def changed_paths(
+        repo_dir: str, targets: Optional[Iterable[str]] = None
+    ) -> set[str]:
         """
-        checkout_dir = self.checkout_dir(repo)
-        if os.path.exists(checkout_dir) is False:
-            log.debug("Cloning repository")
-            os.makedirs(checkout_dir)
-            git_repo = git.Repo.clone_from(
-                repo.clone_url, checkout_dir, **self.clone_opts
-            )
-        else:
-            git_repo = git.Repo(path=checkout_dir)
-            self.reset(git_repo)
+        Returns the paths of all files in the work tree that have been modified, added
+        or deleted, including untracked files. Paths are relative to `repo_dir`.
 
-        if self.validate_branch_name(git_repo) is False:
-            raise RuntimeError(f"Branch name '{self.branch_name}' is not valid")
+        :param targets: Check only these paths instead of all files in the work tree.
+        """
+        return status(git.Git(repo_dir), targets)
 
-        git_repo.config_writer().set_value("user", "email", self.user_email).release()
-        git_repo.config_writer().set_value("user", "name", self.user_name).release()
-        log.debug("Checking out base branch branch=%s", repo.base_branch)
-        try:
-            git_repo.heads[repo.base_branch].checkout()
-        except IndexError as e:
-            # Protection against infinite loops
-            if iteration != 0:
-                log.error(
-                    "Base branch does not exist on second iteration - stopping processing of repository and re-raising exception"
+    def local_changes(
+        self, repo_dir: str, targets: Optional[Iterable[str]] = None
+    ) -> set[str]:
+        """
+        Returns the paths of all files in the work tree that have been modified, added
+        or deleted.
+
+        :param targets: Check only these paths instead of all files in the work tree.
+        """
+        paths = status(self.open(repo_dir).git, targets)
+        log.debug("Task changed files count=%d", len(paths))
+        metric.run_files_changed.inc(len(paths))
+        return paths
+
+    def has_changes_local(self, repo_dir: str) -> bool:
+        return len(self.local_changes(repo_dir)) > 0
+
+    def remote_heads(self, repo: source.Repository) -> dict[str, str]:
+        """
+        Returns the commits that the base branch and the branches of all Tasks point to
+        on the remote, keyed by name of the branch. Calls `git ls-remote` once per
+        Checkout. Does not need a local clone.
+        """
+        with self.checkout.lock:
+            if self.checkout.heads is None:
+                patterns = [f"refs/heads/{repo.base_branch}"] + [
+                    f"refs/heads/{branch}" for branch in self.checkout.branches
+                ]
+                output = str(git.cmd.Git().ls_remote(repo.clone_url, *patterns))
+                heads: dict[str, str] = {}
+                for line in output.splitlines():
+                    sha, _, ref = line.partition("\t")
+                    heads[ref.removeprefix("refs/heads/")] = sha
+
+                self.checkout.heads = heads
+
+            return self.checkout.heads
+
+    def fetch(self, repo: source.Repository) -> git.Git:
+        """
+        Clones the mirror if it does not exist. Otherwise, fetches the base branch and
+        the branches of all Tasks in one call to `git fetch`, once per Checkout.
+
+        :return: Command wrapper that runs git in the mirror.
+        """
+        mirror_dir = self.mirror_dir(repo)
+        self.checkout.lock_path = f"{mirror_dir}.lock"
+        with self.checkout.locked():
+            if self.checkout.mirror is None and os.path.exists(mirror_dir):
+                candidate = git.Git(mirror_dir)
+                if is_mirror(candidate) is True:
+                    self.checkout.mirror = candidate
+                else:
+                    log.warning("Removing broken mirror of repository")
+                    shutil.rmtree(mirror_dir)
+
+            if os.path.exists(mirror_dir) is False:
+                log.debug("Cloning repository")
+                os.makedirs(mirror_dir)
+                git.Repo.clone_from(
+                    repo.clone_url, mirror_dir, bare=True, **self.clone_opts
+                ).close()
+                self.checkout.mirror = git.Git(mirror_dir)
+
+            mirror = self.checkout.mirror
+            assert mirror is not None
+            if self.checkout.fetched is False:
+                log.debug("Fetching changes base_branch=%s", repo.base_branch)
+                mirror.fetch(
+                    "origin", *self.checkout.refspecs(repo.base_branch), prune=True
                 )
-                raise e
+                self.checkout.fetched = True
 
-            log.debug(
-                "Base branch does not exist - deleting local repository and triggering another clone branch=%s",
-                repo.base_branch,
-            )
-            shutil.rmtree(checkout_dir)
-            return self.prepare(force_rebase=force_rebase, iteration=1, repo=repo)
+            if self.checkout.configured is False:
+                # Work trees read the configuration of the mirror.
+                self.configure(mirror)
+                self.checkout.configured = True
 
-        hash_before_pull = str(git_repo.head.commit)
-        log.debug(
-            "Pulling changes into base branch base_branch=%s",
-            repo.base_branch,
-        )
-        git_repo.remotes["origin"].pull()
-        git_repo.git.remote("prune", "origin")
-        hash_after_pull = str(git_repo.head.commit)
-        has_base_branch_update = hash_before_pull != hash_after_pull
-        if has_base_branch_update is True:
-            log.debug(
-                "Base branch contains new commits base_branch=%s",
-                repo.base_branch,
-            )
+            return mirror
+
+    def configure(self, mirror: git.Git) -> None:
+        """
+        Sets the identity used to commit. Also enables the untracked cache and the
+        index format for large repositories. Both speed up `git status` in work trees
+        that contain many files.
+        """
+        mirror.config("user.email", self.user_email)
+        mirror.config("user.name", self.user_name)
+        mirror.config("core.untrackedCache", "true")
+        mirror.config("feature.manyFiles", "true")
+        # git ignores the setting on platforms that do not support the builtin file
+        # system monitor.
+        mirror.config("core.fsmonitor", "true" if self.fsmonitor else "false")
+
+    def add_worktree(self, repo: source.Repository, mirror: git.Git) -> git.Repo:
+        """
+        Adds the work tree of the Task to the mirror if it does not exist.
+        """
+        worktree_dir = self.checkout_dir(repo)
+        if os.path.exists(worktree_dir) is False:
+            with self.checkout.locked():
+                # Forget work trees whose directories have been removed.
+                mirror.worktree("prune")
+                log.debug("Adding work tree branch=%s", self.branch_name)
+                mirror.worktree(
+                    "add",
+                    "--detach",
+                    "--no-checkout",
+                    worktree_dir,
+                    f"origin/{repo.base_branch}",
+                )
+
+        if self.repo is None:
+            self.repo = git.Repo(path=worktree_dir)
+
+        return self.repo
+
+    def configure_sparse_checkout(self, git_repo: git.Repo) -> None:
+        """
+        Restricts the work tree to the paths of the Task. Uses sparse checkout in cone
+        mode and a sparse index. This keeps the time to check out files and to query
+        the status of the work tree proportional to the paths. Disables sparse checkout
+        if the Task needs all paths.
+        """
+        current = sparse_checkout_paths(git_repo)
+        if current == self.paths:
+            return
+
+        # The first call to `git sparse-checkout` changes the configuration shared by
+        # all work trees.
+        with self.checkout.locked():
+            if self.paths is None:
+                log.debug("Disabling sparse checkout")
+                git_repo.git.sparse_checkout("disable")
+                return
+
+            log.debug("Setting up sparse checkout paths=%s", ",".join(self.paths))
+            git_repo.git.sparse_checkout("set", "--cone", "--sparse-index", *self.paths)
+
+    def prepare(self, repo: source.Repository, force_rebase: bool) -> Tuple[str, bool]:
+        """
+        1. Clone or fetch mirror of repository
+        2. Add work tree of task
+        3. Create task branch
+        4. Check if task branch conflicts with base branch
+        5. Reset task branch to base branch
+
+        Only the first call for a Checkout talks to the remote. All other steps work
+        with local refs in the work tree of the Task.
+        """
+        checkout_dir = self.checkout_dir(repo)
+        mirror = self.fetch(repo)
+        git_repo = self.add_worktree(repo, mirror)
+        self.configure_sparse_checkout(git_repo)
+        self.reset(git_repo)
+        if self.validate_branch_name(git_repo) is False:
+            raise RuntimeError(f"Branch name '{self.branch_name}' is not valid")
+
+        refs = list_refs(git_repo.git)
+        base_ref = f"origin/{repo.base_branch}"
+        exists_local = f"refs/heads/{self.branch_name}" in refs
+        remote_branch: Optional[str] = None
+        if f"refs/remotes/origin/{self.branch_name}" in refs:
+            remote_branch = f"origin/{self.branch_name}"
 
-        exists_local = branch_exists_local(self.branch_name, git_repo)
-        remote_branch = get_remote_branch(self.branch_name, git_repo)
         if exists_local is False:
             log.debug("Creating branch branch=%s", self.branch_name)
-            if remote_branch is None:
-                git_repo.create_head(self.branch_name)
-            else:
-                git_repo.create_head(self.branch_name, remote_branch)
+            git_repo.git.branch(self.branch_name, remote_branch or base_ref)
 
         has_conflict = False
         if remote_branch is not None:
-            try:
-                # Try to merge. Errors if there is a merge conflict.
-                git_repo.git.merge(self.branch_name, no_ff=True, no_commit=True)
-            except GitCommandError as e:
-                # Exit codes "1" or "2" indicate that a merge is not successful
-                if e.status != 1 and e.status != 2:
-                    raise e
-
+            has_conflict = self.has_conflict(git_repo, base_ref)
+            if has_conflict is True:
                 log.debug(
                     "Merge conflict with base branch branch=%s base_branch=%s",
                     self.branch_name,
                     repo.base_branch,
                 )
-                has_conflict = True
-
-            try:
-                # Abort the merge to not leave the branch in a conflicted state
-                git_repo.git.merge(abort=True)
-            except GitCommandError as e:
-                # "128" is the exit code of the git command if no abort was needed
-                if e.status != 128:
-                    raise e
 
         log.debug("Checking out work branch branch=%s", self.branch_name)
-        git_repo.heads[self.branch_name].checkout()
+        git_repo.git.checkout(self.branch_name)
         if remote_branch is not None:
-            log.debug("Pulling changes into work branch branch=%s", self.branch_name)
-            # `rebase=True` to end up with a clean history.
+            log.debug("Rebasing work branch onto remote branch=%s", self.branch_name)
+            # Rebase to end up with a clean history, like `git pull --rebase`.
             # `strategy_option="theirs"` to always prefer changes from the remote.
             # Commits by someone else will be preserved with this strategy and there
             # will be no conflict.
-            git_repo.remotes["origin"].pull(
-                self.branch_name, rebase=True, strategy_option="theirs"
+            git_repo.git.rebase(
+                remote_branch, fork_point=True, strategy_option="theirs"
             )
 
-        merge_base = git_repo.git.merge_base(repo.base_branch, self.branch_name)
+        merge_base = git_repo.git.merge_base(base_ref, self.branch_name)
         if force_rebase is False:
             self._detect_modified_branch(merge_base=merge_base, repo=git_repo)
 
         log.debug("Resetting to merge base branch=%s", self.branch_name)
         git_repo.git.reset(merge_base, hard=True)
         log.debug("Rebasing onto work branch branch=%s", self.branch_name)
-        git_repo.git.rebase(repo.base_branch)
+        git_repo.git.rebase(base_ref)
 
         return checkout_dir, has_conflict
 
-    def push(self, repo_dir):
-        git_repo = git.Repo(path=repo_dir)
-        git_repo.git.push("origin", self.branch_name, force=True, set_upstream=True)
+    def has_conflict(self, git_repo: git.Repo, base_ref: str) -> bool:
+        """
+        Checks if merging the task branch into `base_ref` results in a conflict. Merges
+        in the object store via `git merge-tree`, without touching the index or the
+        work tree. Falls back to a merge in the work tree if git is older than 2.38.
+        """
+        try:
+            git_repo.git.merge_tree(base_ref, self.branch_name, write_tree=True)
+            return False
+        except GitCommandError as e:
+            # Exit code "1" indicates that the merge has conflicts.
+            if e.status == 1:
+                return True
+
+            # Exit code "129" indicates that git does not know the flag.
+            if e.status != 129:
+                raise e
+
+        return self._has_conflict_worktree(git_repo, base_ref)
+
+    def _has_conflict_worktree(self, git_repo: git.Repo, base_ref: str) -> bool:
+        has_conflict = False
+        # Detach instead of checking out the base branch. git refuses to check out one
+        # branch in more than one work tree.
+        git_repo.git.checkout(base_ref, detach=True)
+        try:
+            # Try to merge. Errors if there is a merge conflict.
+            git_repo.git.merge(self.branch_name, no_ff=True, no_commit=True)
+        except GitCommandError as e:
+            # Exit codes "1" or "2" indicate that a merge is not successful
+            if e.status != 1 and e.status != 2:
+                raise e
+
+            has_conflict = True
+
+        try:
+            # Abort the merge to not leave the branch in a conflicted state
+            git_repo.git.merge(abort=True)
+        except GitCommandError as e:
+            # "128" is the exit code of the git command if no abort was needed
+            if e.status != 128:
+                raise e
+
+        return has_conflict
+
+    def head_sha(self, repo_dir: str) -> str:
+        return self.open(repo_dir).head.commit.hexsha
+
+    def push(self, repo_dir: str) -> None:
+        """
+        Pushes the task branch. Replaces the branch on the remote only if nobody else
+        has pushed to it since the repository has been fetched.
+
+        :raises RuntimeError: If the remote has not accepted the branch.
+        """
+        result = self.checkout.push([self.branch_name])[self.branch_name]
+        if result.pushed is False:
+            raise RuntimeError(
+                f"Pushing branch {self.branch_name} failed: {result.summary}"
+            )
 
     @staticmethod
     def reset(repo: git.Repo) -> None:
+        # A run that has been killed can leave a rebase or merge in progress.
+        git_dir = str(repo.git_dir)
+        if os.path.isdir(os.path.join(git_dir, "rebase-merge")) or os.path.isdir(
+            os.path.join(git_dir, "rebase-apply")
+        ):
+            log.warning("Aborting rebase of previous run")
+            repo.git.rebase(abort=True)
+
+        if os.path.isfile(os.path.join(git_dir, "MERGE_HEAD")):
+            log.warning("Aborting merge of previous run")
+            repo.git.merge(abort=True)
+
         repo.git.reset("HEAD", hard=True)
         repo.git.clean("-d", "--force")
 
@@ -208,18 +607,143 @@ class Git:
             return False
 
 
-def branch_exists_local(name: str, repo: git.Repo) -> bool:
-    for b in repo.heads:
-        if b.name == name:
-            return True
-
-    return False
-
-
-def get_remote_branch(name: str, repo: git.Repo) -> Union[git.RemoteReference, None]:
-    remote = repo.remote()
-    for r in remote.refs:
-        if r.name == f"{remote.name}/{name}":
-            return r
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on the file at `path`. Creates the file if it does not
+    exist. Waits until no other process holds the lock. The operating system releases
+    the lock if the process exits.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def is_mirror(mirror: git.Git) -> bool:
+    """
+    :return: `True` if the directory of `mirror` contains a bare repository.
+    """
+    try:
+        # Prints "." in the top-level directory of a bare repository.
+        return mirror.rev_parse(git_dir=True) == "."
+    except GitCommandError:
+        return False
+
+
+def list_refs(cmd: git.Git) -> dict[str, str]:
+    """
+    Lists local branches and branches of the remote "origin" in one call to
+    `git for-each-ref`.
+
+    :return: Commits keyed by full name of the ref, e.g. "refs/heads/main".
+    """
+    output = cmd.for_each_ref(
+        "refs/heads", "refs/remotes/origin", format="%(objectname) %(refname)"
+    )
+    refs: dict[str, str] = {}
+    for line in output.splitlines():
+        sha, _, ref = line.partition(" ")
+        refs[ref] = sha
+
+    return refs
+
+
+def parse_push_porcelain(output: str) -> dict[str, PushResult]:
+    """
+    Parses the output of `git push --porcelain`.
+
+    :return: Outcome of the push keyed by name of the branch.
+    """
+    results: dict[str, PushResult] = {}
+    for line in output.splitlines():
+        parts = line.split("\t")
+        if len(parts) != 3:
+            continue
+
+        flag, refspec, summary = parts
+        branch = refspec.partition(":")[2].removeprefix("refs/heads/")
+        results[branch] = PushResult(
+            branch=branch,
+            # "!" marks a rejected branch. All other flags mark a branch that the
+            # remote has accepted or that has been up to date.
+            pushed=flag != "!",
+            # git rejects all other branches of an atomic push if it rejects one.
+            rejected=flag == "!" and "atomic push failed" not in summary,
+            summary=summary,
+        )
 
-    return None
+    return results
+
+
+def literal_pathspecs(paths: Iterable[str]) -> list[str]:
+    """
+    Turns paths into pathspecs that git does not expand, e.g. if a path contains "*".
+    """
+    return [f":(literal){p}" for p in sorted(paths)]
+
+
+def status(cmd: git.Git, targets: Optional[Iterable[str]] = None) -> set[str]:
+    """
+    Returns the paths of all files in the work tree that have been modified, added or
+    deleted, including untracked files. Scans the work tree once via
+    `git status --porcelain=v2`.
+
+    :param targets: Scan only these paths. `None` scans the whole work tree.
+    """
+    args: list[str] = []
+    if targets is not None:
+        args = ["--", *literal_pathspecs(targets)]
+        if len(args) == 1:
+            # Nothing to check.
+            return set()
+
+    output = cmd.status(*args, porcelain="v2", z=True, untracked_files="all")
+    paths: set[str] = set()
+    entries = iter(output.split("\0"))
+    for entry in entries:
+        if entry == "":
+            continue
+
+        kind = entry[0]
+        if kind == "1":
+            # "1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>"
+            paths.add(entry.split(" ", 8)[8])
+        elif kind == "2":
+            # "2 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <X><score> <path>", followed by an
+            # entry that contains the original path.
+            paths.add(entry.split(" ", 9)[9])
+            paths.add(next(entries))
+        elif kind == "u":
+            # "u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>"
+            paths.add(entry.split(" ", 10)[10])
+        elif kind == "?":
+            paths.add(entry[2:])
+
+    return paths
+
+
+def normalize_paths(paths: Iterable[str]) -> list[str]:
+    return sorted({p.strip("/") for p in paths if p.strip("/") not in ("", ".")})
+
+
+def sparse_checkout_paths(repo: git.Repo) -> Optional[list[str]]:
+    """
+    :return: Directories of the sparse checkout or `None` if sparse checkout is not
+             enabled.
+    """
+    try:
+        # git stores the setting in the configuration of the work tree, which
+        # GitPython does not read.
+        enabled = repo.git.config("core.sparseCheckout", get=True)
+    except GitCommandError:
+        # Exit code "1" indicates that the setting does not exist.
+        return None
+
+    if enabled != "true":
+        return None
+
+    return normalize_paths(repo.git.sparse_checkout("list").splitlines())
@@ -2,12 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import contextvars
 import logging
 import logging.config
 import sys
 from typing import Any, MutableMapping, Optional
 
-_CONTEXT_VARS: dict[str, Any] = {}
+# Stored in a ContextVar to keep the values of concurrent workers apart.
+_CONTEXT_VARS: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar(
+    "rcmt_log_context_vars", default={}
+)
 
 
 logging_config: dict[str, Any] = {
@@ -90,20 +94,22 @@ class ContextAwareAdapter(logging.LoggerAdapter):
         except KeyError:
             pass
 
-        for k, v in _CONTEXT_VARS.items():
+        for k, v in _CONTEXT_VARS.get().items():
             msg = f"{msg} {k}={v}"
 
         return msg, kwargs
 
 
 def bind_contextvars(**kwargs) -> None:
+    context_vars = _CONTEXT_VARS.get().copy()
     for k, v in kwargs.items():
-        _CONTEXT_VARS[k] = v
+        context_vars[k] = v
+
+    _CONTEXT_VARS.set(context_vars)
 
 
 def clear_contextvars() -> None:
-    global _CONTEXT_VARS
-    _CONTEXT_VARS.clear()
+    _CONTEXT_VARS.set({})
 
 
 def get_logger(name: str) -> ContextAwareAdapter:
@@ -15,6 +15,9 @@ The following metrics are recorded:
 - `rcmt_run_repositories_processed` - Repositories processed by the latest run of rcmt.
 - `rcmt_run_error` - Result of the latest run of rcmt.
    0 indicates success, 1 indicates an error.
+- `rcmt_run_files_changed` - Files changed by Tasks during the latest run of rcmt.
+- `rcmt_source_rate_limit_remaining` - Requests left in the current rate limit window
+   of the API of a Source. Label `source` contains the name of the Source.
 
 On each run, a unique label `run_id` is created and attached to each of the metrics.
 The label can be used to differentiate between runs when querying metrics via Prometheus.
@@ -63,6 +66,20 @@ run_error = Gauge(
     registry=registry,
 ).labels(label_run)
 
+run_files_changed = Gauge(
+    name="rcmt_run_files_changed",
+    documentation="Files changed by Tasks during the latest run of rcmt.",
+    labelnames=["run_id"],
+    registry=registry,
+).labels(label_run)
+
+source_rate_limit_remaining = Gauge(
+    name="rcmt_source_rate_limit_remaining",
+    documentation="Requests left in the current rate limit window of the API of a Source.",
+    labelnames=["run_id", "source"],
+    registry=registry,
+)
+
 
 def push(cfg: config.Pushgateway) -> None:
     if cfg.enabled is False:
@@ -0,0 +1,131 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+import rcmt.log
+
+log = rcmt.log.get_logger(__name__)
+
+# Signals the workers of a stage that no more items will arrive.
+_DONE = object()
+
+
+class Stage:
+    """
+    Stage is one step of a Pipeline.
+
+    :param name: Name of the stage. Used in log messages and names of threads.
+    :param func: Function that processes an item. The value it returns is passed to the
+                 next stage. Returning `None` drops the item.
+    :param workers: Number of threads that call `func` concurrently.
+    :param on_error: Function that gets called with an item and the exception that
+                     `func` raised while processing it. Cleans up after the item before
+                     the Pipeline drops it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Optional[Any]],
+        workers: int = 1,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ):
+        self.func = func
+        self.name = name
+        self.on_error = on_error
+        self.workers = max(workers, 1)
+
+
+class Pipeline:
+    """
+    Pipeline passes items through a sequence of Stages. The stages are connected by
+    bounded queues. A stage that produces items faster than the next stage consumes
+    them blocks once the queue between them is full. This keeps the number of items
+    in memory at `(len(stages) * queue_size) + workers of all stages`, no matter how
+    many items the input yields.
+
+    :param stages: Stages in the order in which they process an item.
+    :param queue_size: Maximum number of items that wait in front of a stage.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 1):
+        self.queue_size = max(queue_size, 1)
+        self.stages = stages
+
+    def run(self, items: Iterable[Any]) -> int:
+        """
+        Feeds `items` into the first stage and blocks until the last stage has
+        processed all of them.
+
+        An exception raised by a stage is logged and passed to `on_error` of the stage.
+        The item that caused it is dropped.
+
+        :return: Number of items read from `items`.
+        """
+        queues: list[queue.Queue] = [
+            queue.Queue(maxsize=self.queue_size) for _ in self.stages
+        ]
+        threads: list[list[threading.Thread]] = []
+        for idx, stage in enumerate(self.stages):
+            out = queues[idx + 1] if idx + 1 < len(queues) else None
+            stage_threads = []
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[idx], out),
+                    daemon=True,
+                    name=f"rcmt-{stage.name}-{n}",
+                )
+                t.start()
+                stage_threads.append(t)
+
+            threads.append(stage_threads)
+
+        count = 0
+        try:
+            for item in items:
+                count += 1
+                queues[0].put(item)
+        finally:
+            # Shut down the stages one after another. Every stage processes all items
+            # it has received before the next stage gets notified.
+            for idx, stage_threads in enumerate(threads):
+                queues[idx].put(_DONE)
+                for t in stage_threads:
+                    t.join()
+
+        return count
+
+    @staticmethod
+    def _work(
+        stage: Stage, in_queue: queue.Queue, out_queue: Optional[queue.Queue]
+    ) -> None:
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                # Let the other workers of this stage know.
+                in_queue.put(_DONE)
+                return
+
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                log.exception("Stage failed stage=%s", stage.name, exc_info=e)
+                if stage.on_error is not None:
+                    try:
+                        stage.on_error(item, e)
+                    except Exception as cleanup_error:
+                        log.exception(
+                            "Cleaning up after stage failed stage=%s",
+                            stage.name,
+                            exc_info=cleanup_error,
+                        )
+
+                continue
+
+            if result is not None and out_queue is not None:
+                out_queue.put(result)
@@ -0,0 +1,143 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import signal
+import traceback
+from typing import Any, Optional
+
+import rcmt.log
+from rcmt import config, context, fs, git
+from rcmt.context import Context
+from rcmt.task import Task
+
+log = rcmt.log.get_logger(__name__)
+
+
+class ApplyPool:
+    """
+    ApplyPool applies Tasks in child processes.
+
+    Each call to apply() forks a new process and waits for it. This ensures that a Task
+    that exceeds its timeout can be killed and that the memory it allocated is returned
+    to the system. ApplyPool isolates Tasks, it does not apply them in parallel.
+
+    Only use ApplyPool while rcmt processes one repository at a time (`workers` is 1).
+    A child inherits the locks of all threads of the parent in the state they were in
+    at the time of the fork. It can deadlock if another thread held one of them, e.g.
+    the lock of a pool of HTTP connections. Tasks can not be passed to a process that
+    has been spawned instead, because they are loaded from files at runtime.
+
+    :param timeout: Seconds after which to kill a child process.
+    :param memory_limit: Maximum size of the address space of a child process, in MiB.
+                         0 disables the limit.
+    """
+
+    def __init__(self, timeout: int, memory_limit: int = 0):
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+
+        self._mp = multiprocessing.get_context("fork")
+
+    def apply(self, task: Task, ctx: Context) -> set[str]:
+        """
+        Applies a Task to the checkout at `ctx.checkout_dir` in a child process.
+
+        Changes to the template data of the Context made by the Task are copied back
+        to `ctx`.
+
+        :return: Paths of all files the Task has changed, relative to the checkout.
+        """
+        receiver, sender = self._mp.Pipe(duplex=False)
+        child = self._mp.Process(
+            target=_apply_in_child,
+            kwargs={
+                "conn": sender,
+                "ctx": ctx,
+                "memory_limit": self.memory_limit,
+                "task": task,
+            },
+            daemon=True,
+        )
+        child.start()
+        # Close the sending end in the parent to get notified if the child exits
+        # without sending a result.
+        sender.close()
+        try:
+            if receiver.poll(self.timeout) is False:
+                log.warning(
+                    "Killing process that applies task timeout=%d pid=%s",
+                    self.timeout,
+                    child.pid,
+                )
+                _kill(child)
+                raise RuntimeError(
+                    f"Applying task did not finish within {self.timeout} seconds"
+                )
+
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                child.join()
+                raise RuntimeError(
+                    f"Process that applies task exited unexpectedly with code {child.exitcode}"
+                )
+        finally:
+            receiver.close()
+
+        child.join()
+        if status == "error":
+            raise RuntimeError(f"Applying task failed in child process:\n{payload}")
+
+        changed_paths, template_data = payload
+        ctx.update_template_data(template_data)
+        return changed_paths
+
+
+def new_apply_pool(cfg: config.Apply) -> ApplyPool:
+    return ApplyPool(timeout=cfg.timeout, memory_limit=cfg.memory_limit)
+
+
+def _apply_in_child(
+    conn: multiprocessing.connection.Connection,
+    ctx: Context,
+    memory_limit: int,
+    task: Task,
+) -> None:
+    # Start a new process group to be able to kill processes started by the Task,
+    # like the executable called by the "exec" Action.
+    os.setpgid(0, 0)
+    try:
+        if memory_limit > 0:
+            limit = memory_limit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        # The child is the only user of its working directory.
+        os.chdir(ctx.checkout_dir)
+        with context.use_context(ctx), fs.use_checkout_dir(ctx.checkout_dir):
+            task.apply(ctx=ctx)
+
+        targets: Optional[set[str]] = None
+        if task.only_actions is True:
+            targets = ctx.changed_paths
+
+        changed_paths = git.Git.changed_paths(ctx.checkout_dir, targets)
+        conn.send(("ok", (changed_paths, ctx.template_data)))
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def _kill(child: Any) -> None:
+    try:
+        os.killpg(child.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # The child has not created its process group yet.
+        child.kill()
+
+    child.join()
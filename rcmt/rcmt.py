@@ -2,17 +2,39 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import json
+import os
 import shutil
+import signal
+import threading
+import time
 from enum import Enum
-from typing import Any, Iterator, Optional
+from typing import Any, Callable, Iterable, Iterator, Optional
 
 import jinja2
 from git.exc import GitCommandError
 
 import rcmt.log
 
-from . import config, context, database, fs, git, metric, source, task
+from . import (
+    config,
+    context,
+    database,
+    fs,
+    git,
+    metric,
+    pipeline,
+    process,
+    server,
+    source,
+    task,
+    workqueue,
+)
+from .source import ratelimit
 
 log = rcmt.log.get_logger(__name__)
 
@@ -35,9 +57,67 @@ The commit(s) that modified the pull request:
 )
 
 
+class Shard:
+    """
+    Shard selects the repositories that one of multiple nodes processes during a run.
+
+    Assigns each repository to exactly one shard by hashing its full name. A repository
+    stays in the same shard between runs, which lets a node keep the checkouts of its
+    repositories.
+
+    :param index: Index of the shard, starting at 0.
+    :param count: Number of shards.
+    """
+
+    def __init__(self, index: int, count: int):
+        if count < 1:
+            raise ValueError("count of shards must be greater than 0")
+
+        if index < 0 or index >= count:
+            raise ValueError(f"index of shard must be between 0 and {count - 1}")
+
+        self.count = count
+        self.index = index
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @classmethod
+    def from_string(cls, value: str) -> "Shard":
+        """
+        Creates a Shard from a string in the format `<index>/<count>`, e.g. `0/3`.
+        """
+        index, sep, count = value.partition("/")
+        if sep == "" or index.isdigit() is False or count.isdigit() is False:
+            raise ValueError(
+                f"shard '{value}' has to be in format <index>/<count>, e.g. 0/3"
+            )
+
+        return cls(index=int(index), count=int(count))
+
+    def contains(self, repository: source.Repository) -> bool:
+        digest = hashlib.sha1(repository.full_name.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], byteorder="big") % self.count == self.index
+
+    def names(self) -> list[str]:
+        """
+        :return: Names of all shards of the run.
+        """
+        return [str(Shard(index=i, count=self.count)) for i in range(self.count)]
+
+
 class Options:
     def __init__(self, cfg: config.Config):
         self.config = cfg
+        self.apply_pool: Optional[process.ApplyPool] = None
+        if cfg.apply.isolate is True:
+            self.apply_pool = process.new_apply_pool(cfg.apply)
+
+        self.enqueue: bool = False
+        self.max_duration: Optional[float] = None
+        self.snapshots: Optional[Snapshots] = None
+        self.resume: bool = False
+        self.shard: Optional[Shard] = None
         self.task_paths: list[str] = []
         self.repositories: list[str] = []
         self.sources: dict[str, source.Base] = {}
@@ -78,25 +158,463 @@ class RunResult(Enum):
     PR_OPEN = 11
 
 
+class Checkpoints:
+    """
+    Checkpoints records the Tasks that have processed a repository successfully.
+
+    A run in resume mode skips a Task if it has already processed a repository during
+    the previous, unfinished run and the checksum of the Task has not changed since.
+
+    :param db: Database that stores checkpoints.
+    :param completed: Checksums of Tasks of the previous run, keyed by name of the
+                      repository and name of the Task.
+    """
+
+    def __init__(
+        self,
+        db: database.Database,
+        completed: Optional[dict[tuple[str, str], str]] = None,
+    ):
+        self.completed = completed if completed is not None else {}
+        self.db = db
+        # False if a failure could not be recorded. The next run would not retry it.
+        self.saved_all = True
+
+    def pending(
+        self, repository: source.Repository, tasks: list[task.TaskWrapper]
+    ) -> list[task.TaskWrapper]:
+        """
+        Returns the Tasks that have not processed `repository` yet.
+        """
+        if len(self.completed) == 0:
+            return tasks
+
+        result: list[task.TaskWrapper] = []
+        for task_ in tasks:
+            key = (repository.full_name, task_.name)
+            if self.completed.get(key) == task_.checksum:
+                log.debug(
+                    "Task has processed repository during previous run repository=%s task=%s",
+                    repository.full_name,
+                    task_.name,
+                )
+                continue
+
+            result.append(task_)
+
+        return result
+
+    def save(
+        self,
+        repository: source.Repository,
+        tasks: list[task.TaskWrapper],
+        failed: Optional[list[task.TaskWrapper]] = None,
+    ) -> None:
+        """
+        Records the Tasks that have processed `repository` and the Tasks that have
+        failed to process it. The next run retries failed Tasks.
+        """
+        # A Task that has reached its change limit skipped the repository.
+        checksums = {
+            task_.name: task_.checksum
+            for task_ in tasks
+            if task_.has_reached_change_limit() is False
+        }
+        try:
+            self.db.save_checkpoints(
+                repository.full_name,
+                checksums,
+                failed=[task_.name for task_ in failed or []],
+            )
+        except Exception as e:
+            if failed:
+                self.saved_all = False
+
+            # Do not fail the run. Resuming only processes the repository again.
+            log.warning(
+                "Saving checkpoint failed repository=%s",
+                repository.full_name,
+                exc_info=e,
+            )
+
+
+def new_checkpoints(
+    db: database.Database, resume: bool, shard: Optional[str] = None
+) -> Checkpoints:
+    if resume is False:
+        return Checkpoints(db=db)
+
+    execution = db.get_last_execution(shard=shard)
+    completed_after = execution.executed_at
+    if completed_after is None:
+        completed_after = datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+
+    completed = db.get_checkpoints(completed_after=completed_after)
+    log.info("Resuming previous run checkpoints=%d", len(completed))
+    return Checkpoints(db=db, completed=completed)
+
+
+class Snapshots:
+    """
+    Snapshots let a Task skip preparing the checkout and applying its Actions if
+    nothing that affects the result has changed since the last time the Task has
+    processed a repository. This is the case if the base branch and the branch of the
+    Task point to the same commits, the Task and the configuration of rcmt have not
+    changed and the last result was `NO_CHANGES` or `PR_OPEN`. The Task then only
+    syncs the state of its pull request.
+
+    :param db: Database that stores the Snapshots.
+    :param tasks: Tasks of the current run.
+    :param cfg: Configuration of the current run.
+    """
+
+    # Results that do not require another look at the repository.
+    STABLE_RESULTS = (RunResult.NO_CHANGES, RunResult.PR_OPEN)
+
+    def __init__(
+        self,
+        db: database.Database,
+        tasks: list[task.TaskWrapper],
+        cfg: config.Config,
+    ):
+        self.db = db
+        self.fingerprints = {t.name: self._fingerprint(t, cfg) for t in tasks}
+
+    def unchanged(
+        self,
+        repository: str,
+        task_name: str,
+        base_branch: str,
+        branch: str,
+        heads: dict[str, str],
+    ) -> bool:
+        fingerprint = self.fingerprints.get(task_name)
+        if fingerprint is None:
+            return False
+
+        snapshot = self.db.get_snapshot(repository, task_name)
+        if snapshot is None:
+            return False
+
+        return (
+            snapshot.fingerprint == fingerprint
+            and snapshot.result in [r.name for r in self.STABLE_RESULTS]
+            and snapshot.base_sha == heads.get(base_branch)
+            and snapshot.branch_sha == heads.get(branch)
+        )
+
+    def save(
+        self,
+        repository: str,
+        task_name: str,
+        base_branch: str,
+        branch: str,
+        heads: dict[str, str],
+        result: RunResult,
+    ) -> None:
+        fingerprint = self.fingerprints.get(task_name)
+        base_sha = heads.get(base_branch)
+        if fingerprint is None or base_sha is None:
+            return
+
+        try:
+            self.db.save_snapshot(
+                database.Snapshot(
+                    base_sha=base_sha,
+                    branch_sha=heads.get(branch),
+                    fingerprint=fingerprint,
+                    repository=repository,
+                    result=result.name,
+                    task=task_name,
+                )
+            )
+        except Exception as e:
+            # Do not fail the run. The next run only takes the slow path.
+            log.warning("Saving snapshot failed", exc_info=e)
+
+    @staticmethod
+    def _fingerprint(task_wrapper: task.TaskWrapper, cfg: config.Config) -> str:
+        checksum = hashlib.md5()
+        checksum.update(task_wrapper.checksum.encode("utf-8"))
+        # Custom configuration and titles of pull requests can change the result.
+        checksum.update(json.dumps(cfg.custom, sort_keys=True, default=str).encode())
+        checksum.update(cfg.pr_title_prefix.encode("utf-8"))
+        checksum.update(cfg.pr_title_body.encode("utf-8"))
+        checksum.update(cfg.pr_title_suffix.encode("utf-8"))
+        return checksum.hexdigest()
+
+
+def new_snapshots(
+    db: database.Database, tasks: list[task.TaskWrapper], cfg: config.Config
+) -> Optional[Snapshots]:
+    if cfg.skip_unchanged is False or cfg.dry_run is True:
+        # A dry run does not push changes or create pull requests. Its results must not
+        # let the next run skip a repository.
+        return None
+
+    return Snapshots(db=db, tasks=tasks, cfg=cfg)
+
+
+class Watermarks:
+    """
+    Watermarks skip a Task if a repository has not been updated since the Task has last
+    processed all repositories. A Task whose checksum has changed processes all
+    repositories. Adding a Task does not make the other Tasks process all repositories.
+
+    Every Task processes repositories with open pull requests, so that it can merge
+    or update its pull request. A Task also processes repositories it has failed to
+    process during a previous run.
+
+    :param failures: Names of the Tasks that have failed, keyed by name of the
+                     repository.
+    """
+
+    def __init__(self, failures: Optional[dict[str, set[str]]] = None) -> None:
+        self.failures = failures if failures is not None else {}
+        self.open_pull_requests: set[str] = set()
+
+    def pending(
+        self, repository: source.Repository, tasks: list[task.TaskWrapper]
+    ) -> list[task.TaskWrapper]:
+        """
+        Returns the Tasks that need to process `repository`.
+        """
+        updated_at = repository.updated_at
+        if updated_at is None or repository.full_name in self.open_pull_requests:
+            return tasks
+
+        failed = self.failures.get(repository.full_name, set())
+        result: list[task.TaskWrapper] = []
+        for task_ in tasks:
+            if task_.name in failed:
+                log.debug(
+                    "Retrying task that failed during previous run repository=%s task=%s",
+                    repository.full_name,
+                    task_.name,
+                )
+                result.append(task_)
+                continue
+
+            if task_.since is not None and updated_at <= task_.since:
+                log.debug(
+                    "Repository not updated since task has processed it repository=%s task=%s",
+                    repository.full_name,
+                    task_.name,
+                )
+                continue
+
+            result.append(task_)
+
+        return result
+
+
+class Deadline:
+    """
+    Deadline stops a run from starting to process new repositories once its time budget
+    is nearly used up. Repositories already being processed are processed to the end.
+
+    Deadline estimates the time a repository takes from the repositories started so far.
+    It stops if starting one more repository would exceed `max_duration`.
+
+    :param max_duration: Time budget of the run in seconds. `None` disables the budget.
+    """
+
+    def __init__(
+        self,
+        max_duration: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_duration = max_duration
+        self.stopped = False
+        self._cancelled = threading.Event()
+        self._clock = clock
+        self._started_at = clock()
+
+    def cancel(self) -> None:
+        """
+        Stops the run from starting new repositories, regardless of the time left.
+        """
+        self._cancelled.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the Deadline has been cancelled or `timeout` seconds have passed.
+
+        :return: True if the Deadline has been cancelled.
+        """
+        return self._cancelled.wait(timeout)
+
+    def expired(self, repositories_started: int) -> bool:
+        if self._cancelled.is_set():
+            self.stopped = True
+            return True
+
+        if self.max_duration is None:
+            return False
+
+        elapsed = self._clock() - self._started_at
+        average = elapsed / repositories_started if repositories_started > 0 else 0.0
+        if elapsed + average >= self.max_duration:
+            self.stopped = True
+            return True
+
+        return False
+
+
+class ChangeWindow:
+    """
+    ChangeWindow resets the changes of Tasks once a period has passed. `rcmt serve`
+    runs for a long time. Without a reset, a Task that has reached its change limit
+    would not change any repository until the process restarts.
+
+    :param seconds: Length of the period. `0` never resets the changes.
+    """
+
+    def __init__(
+        self,
+        tasks: list[task.TaskWrapper],
+        seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.seconds = seconds
+        self.tasks = tasks
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._started_at = clock()
+
+    def check(self) -> None:
+        """
+        Resets the changes of all Tasks if the current period has passed.
+        """
+        if self.seconds <= 0:
+            return
+
+        with self._lock:
+            now = self._clock()
+            if now - self._started_at < self.seconds:
+                return
+
+            self._started_at = now
+
+        log.info("Resetting changes of tasks")
+        for task_ in self.tasks:
+            task_.reset_changes()
+
+
+def until_deadline(
+    repositories: Iterator[source.Repository], deadline: Deadline
+) -> Iterator[source.Repository]:
+    """
+    Stops reading from `repositories` once `deadline` has expired.
+    """
+    started = 0
+    iterator = iter(repositories)
+    while True:
+        if deadline.expired(started):
+            log.warning("Time budget of run used up - not starting new repositories")
+            return
+
+        repository = next(iterator, None)
+        if repository is None:
+            return
+
+        started += 1
+        yield repository
+
+
+@contextlib.contextmanager
+def _cancel_on_sigterm(deadline: Deadline) -> Iterator[None]:
+    """
+    Cancels `deadline` when the process receives SIGTERM, e.g. because Kubernetes stops
+    the Pod. This lets rcmt finish the repositories it is processing and save its
+    progress during the grace period.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Python allows signal handlers only in the main thread.
+        yield
+        return
+
+    def handle(signum: int, frame: Any) -> None:
+        log.warning("Received SIGTERM - finishing repositories already started")
+        deadline.cancel()
+
+    previous = signal.signal(signal.SIGTERM, handle)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+class RunState:
+    """
+    RunState carries the intermediate results of a RepoRun from one phase to the next.
+    """
+
+    def __init__(self) -> None:
+        self.force_rebase: bool = False
+        self.has_changes: bool = False
+        self.has_changes_base: bool = True
+        self.has_conflict: bool = False
+        self.has_local_changes: bool = False
+        self.heads: Optional[dict[str, str]] = None
+        self.pr_identifier: Any = None
+        # Set if the branch has been pushed together with the branches of other Tasks.
+        self.push_result: Optional[git.PushResult] = None
+        self.result: Optional[RunResult] = None
+        self.unchanged: bool = False
+        self.work_dir: str = ""
+
+
 class RepoRun:
+    """
+    RepoRun applies a Task to a repository in three phases:
+
+    1. plan() queries the state of the pull request from the Source.
+    2. work() prepares the checkout, applies the Task and commits the changes.
+    3. sync() pushes changes and creates, updates, merges or closes the pull request.
+
+    A phase sets `RunState.result` if the run is complete and the next phases must be
+    skipped. execute() runs all phases in order.
+    """
+
     def __init__(self, g: git.Git, opts: Options):
         self.git = g
         self.opts = opts
 
+    def close(self) -> None:
+        """
+        Closes the handle of the work tree of the Task.
+        """
+        self.git.close()
+
     def execute(
         self,
         ctx: context.Context,
         matcher: task.Task,
     ) -> RunResult:
+        state = self.plan(ctx=ctx, matcher=matcher)
+        if state.result is not None:
+            return state.result
+
+        self.work(ctx=ctx, matcher=matcher, state=state)
+        if state.result is not None:
+            return state.result
+
+        return self.sync(ctx=ctx, matcher=matcher, state=state)
+
+    def plan(self, ctx: context.Context, matcher: task.Task) -> RunState:
+        state = RunState()
         repo = ctx.repo
         pr_identifier = repo.find_pull_request(self.git.branch_name)
+        state.pr_identifier = pr_identifier
         if (
             pr_identifier is not None
             and repo.is_pr_closed(pr_identifier) is True
             and matcher.merge_once is True
         ):
             log.info("Existing PR has been closed branch=%s", self.git.branch_name)
-            return RunResult.PR_CLOSED_BEFORE
+            state.result = RunResult.PR_CLOSED_BEFORE
+            return state
 
         if (
             pr_identifier is not None
@@ -104,12 +622,41 @@ class RepoRun:
             and matcher.merge_once is True
         ):
             log.info("Existing PR has been merged branch=%s", self.git.branch_name)
-            return RunResult.PR_MERGED_BEFORE
+            state.result = RunResult.PR_MERGED_BEFORE
+            return state
 
         if pr_identifier is not None and matcher.create_only is True:
-            return RunResult.PR_OPEN
+            state.result = RunResult.PR_OPEN
+            return state
+
+        state.force_rebase = self._has_rebase_checked(pr=pr_identifier, repo=repo)
+        if self.opts.snapshots is not None and state.force_rebase is False:
+            try:
+                state.heads = dict(self.git.remote_heads(repo))
+            except GitCommandError as e:
+                log.warning("Listing remote branches failed", exc_info=e)
+            else:
+                state.unchanged = self.opts.snapshots.unchanged(
+                    repository=repo.full_name,
+                    task_name=matcher.name,
+                    base_branch=repo.base_branch,
+                    branch=self.git.branch_name,
+                    heads=state.heads,
+                )
+
+        return state
+
+    def work(self, ctx: context.Context, matcher: task.Task, state: RunState) -> None:
+        if state.unchanged is True:
+            log.info("Repository unchanged since last run - skipping checkout")
+            state.has_changes = False
+            state.has_changes_base = True
+            state.has_local_changes = False
+            return
 
-        force_rebase = self._has_rebase_checked(pr=pr_identifier, repo=repo)
+        repo = ctx.repo
+        pr_identifier = state.pr_identifier
+        force_rebase = state.force_rebase
         try:
             work_dir, has_conflict = self.git.prepare(
                 force_rebase=force_rebase, repo=repo
@@ -134,32 +681,101 @@ class RepoRun:
                     pr=pr_identifier,
                 )
 
-            return RunResult.BRANCH_MODIFIED
+            state.result = RunResult.BRANCH_MODIFIED
+            return
         except GitCommandError as e:
             # Catch any error raised by the git client, delete the repository and
             # initialize it again
             log.warning(
-                msg="generic git error detected - cloning repository again",
+                msg="generic git error detected - adding work tree again",
                 exc_info=e,
             )
             checkout_dir = self.git.checkout_dir(repo)
-            shutil.rmtree(checkout_dir)
+            self.git.close()
+            # The error can occur before the work tree has been added.
+            if os.path.exists(checkout_dir):
+                shutil.rmtree(checkout_dir)
             work_dir, has_conflict = self.git.prepare(
                 force_rebase=force_rebase, repo=repo
             )
 
-        with fs.in_checkout_dir(work_dir):
-            matcher.apply(ctx=ctx)
+        state.work_dir = work_dir
+        state.has_conflict = has_conflict
+        ctx.checkout_dir = work_dir
+        # Paths to check and commit. `None` checks and commits the whole checkout.
+        targets: Optional[set[str]] = None
+        if self.opts.apply_pool is not None:
+            changed_paths = self.opts.apply_pool.apply(task=matcher, ctx=ctx)
+            log.debug("Task changed files count=%d", len(changed_paths))
+            metric.run_files_changed.inc(len(changed_paths))
+            has_local_changes = len(changed_paths) > 0
+            if matcher.only_actions is True:
+                targets = changed_paths
+        else:
+            with context.use_context(ctx):
+                if self.opts.config.workers > 1:
+                    # Other workers apply Tasks at the same time. Do not change the
+                    # working directory of the process.
+                    with fs.use_checkout_dir(work_dir):
+                        matcher.apply(ctx=ctx)
+                else:
+                    with fs.in_checkout_dir(work_dir):
+                        matcher.apply(ctx=ctx)
+
+            if matcher.only_actions is True and ctx.changed_paths is not None:
+                targets = self.git.local_changes(work_dir, ctx.changed_paths)
+                has_local_changes = len(targets) > 0
+            else:
+                has_local_changes = self.git.has_changes_local(work_dir)
 
-        has_local_changes = self.git.has_changes_local(work_dir)
         if has_local_changes is True:
-            self.git.commit_changes(work_dir, matcher.commit_msg)
+            if targets is None:
+                self.git.commit_changes(work_dir, matcher.commit_msg)
+            else:
+                self.git.commit_changes(work_dir, matcher.commit_msg, targets=targets)
         else:
             log.info("No changes after applying actions")
 
+        state.has_local_changes = has_local_changes
+        state.has_changes_base = self.git.has_changes_origin(
+            branch=repo.base_branch, repo_dir=work_dir
+        )
+        # Rebasing onto the base branch always creates new commits. Push only if the
+        # files differ from the branch on the remote to not trigger checks of the pull
+        # request again.
+        has_changes_branch = has_local_changes and self.git.has_changes_origin(
+            branch=self.git.branch_name, repo_dir=work_dir
+        )
+        if has_local_changes is True and has_changes_branch is False:
+            log.debug(
+                "Remote branch contains all changes branch=%s", self.git.branch_name
+            )
+
+        state.has_changes = has_changes_branch or has_conflict
+
+    def sync(
+        self, ctx: context.Context, matcher: task.Task, state: RunState
+    ) -> RunResult:
+        result = self._sync(ctx=ctx, matcher=matcher, state=state)
+        if self.opts.snapshots is not None and state.heads is not None:
+            self.opts.snapshots.save(
+                repository=ctx.repo.full_name,
+                task_name=matcher.name,
+                base_branch=ctx.repo.base_branch,
+                branch=self.git.branch_name,
+                heads=state.heads,
+                result=result,
+            )
+
+        return result
+
+    def _sync(
+        self, ctx: context.Context, matcher: task.Task, state: RunState
+    ) -> RunResult:
+        repo = ctx.repo
+        pr_identifier = state.pr_identifier
         if (
-            self.git.has_changes_origin(branch=repo.base_branch, repo_dir=work_dir)
-            is False
+            state.has_changes_base is False
             and pr_identifier is not None
             and repo.is_pr_open(pr_identifier) is True
         ):
@@ -183,18 +799,22 @@ class RepoRun:
 
             return RunResult.PR_CLOSED
 
-        has_changes = (
-            has_local_changes
-            and self.git.has_changes_origin(
-                branch=self.git.branch_name, repo_dir=work_dir
-            )
-        ) or has_conflict
+        has_changes = state.has_changes
         if has_changes is True:
             if self.opts.config.dry_run:
                 log.warning("DRY RUN: Not pushing changes")
+            elif state.push_result is not None and state.push_result.pushed is True:
+                log.debug("Pushed changes together with other branches")
+            elif state.push_result is not None and state.push_result.rejected is True:
+                raise RuntimeError(
+                    f"Remote rejected branch {self.git.branch_name}: {state.push_result.summary}"
+                )
             else:
                 log.debug("Pushing changes")
-                self.git.push(work_dir)
+                self.git.push(state.work_dir)
+
+            if self.opts.config.dry_run is False and state.heads is not None:
+                state.heads[self.git.branch_name] = self.git.head_sha(state.work_dir)
 
         pr = source.PullRequest(
             matcher.auto_merge,
@@ -273,124 +893,883 @@ class RepoRun:
         return "[x] If you want to rebase this PR" in desc
 
 
+def check_isolate(cfg: config.Config) -> None:
+    """
+    Ensures that rcmt does not fork child processes to apply Tasks while other threads
+    process repositories. See ApplyPool.
+    """
+    if cfg.apply.isolate is True and cfg.workers > 1:
+        raise RuntimeError(
+            f"Setting apply.isolate requires workers to be 1, got {cfg.workers}"
+        )
+
+
 def execute(opts: Options) -> bool:
     if len(opts.sources) < 1:
         raise RuntimeError(
             "No Source has been configured. Configure access credentials for GitHub or GitLab."
         )
 
+    check_isolate(opts.config)
+
     metric.run_start_timestamp.set_to_current_time()
+    started_at = datetime.datetime.now(tz=datetime.timezone.utc)
     db = database.new_database(opts.config.database)
-    tasks, needs_all_repositories, reads_succeeded = read_tasks(
-        db=db, task_paths=opts.task_paths
-    )
+    shard = str(opts.shard) if opts.shard is not None else None
+    tasks, reads_succeeded = read_tasks(db=db, task_paths=opts.task_paths, shard=shard)
+    opts.snapshots = new_snapshots(db=db, tasks=tasks, cfg=opts.config)
+    watermarks: Optional[Watermarks] = None
     if len(opts.repositories) > 0:
         log.info("Reading repositories passed in from command-line")
         cli_repositories: list[source.Repository] = []
         for repository_name in opts.repositories:
-            for s in opts.sources.values():
-                repository = s.create_from_name(name=repository_name)
-                if repository is not None:
-                    cli_repositories.append(repository)
+            repository = create_repository(repository_name, opts)
+            if repository is not None:
+                cli_repositories.append(repository)
 
         repositories: Iterator[source.Repository] = (
             repository for repository in cli_repositories
         )
 
     else:
-        execution = db.get_last_execution()
-        if needs_all_repositories is True or execution.executed_at is None:
-            since = datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
-        else:
-            since = execution.executed_at
+        epoch = datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+        execution = db.get_last_execution(shard=shard)
+        last_executed_at = execution.executed_at or epoch
+        for task_ in tasks:
+            if task_.since is None:
+                # Versions of rcmt before watermarks only recorded the Execution.
+                task_.since = last_executed_at
 
+        since = min([t.since or epoch for t in tasks], default=last_executed_at)
         log.debug(
             "Searching for updated repositories since %s",
             str(since),
         )
+        failures = db.get_failures()
+        if reads_succeeded is True:
+            # Forget failures of Tasks that have been removed or renamed. A Task file
+            # that could not be read does not remove its Tasks.
+            failures = prune_failures(db, failures, [t.name for t in tasks])
+
+        if len(failures) > 0:
+            log.info("Retrying repositories that failed count=%d", len(failures))
+
+        watermarks = Watermarks(failures=failures)
         repositories = list_repositories(
-            all_repositories=needs_all_repositories,
+            all_repositories=len(tasks) > 0 and all(t.since == epoch for t in tasks),
             since=since,
             sources=list(opts.sources.values()),
+            open_pull_requests=watermarks.open_pull_requests,
+            retry=find_failed_repositories(db, failures.keys(), opts),
         )
 
-    repository_count: int = 0
-    success = reads_succeeded
-    for repository in repositories:
-        repository_count += 1
-        for task_ in tasks:
-            rcmt.log.clear_contextvars()
-            rcmt.log.bind_contextvars(repository=repository.full_name, task=task_.name)
-            task_success = execute_task(task_, repository, opts)
-            rcmt.log.clear_contextvars()
-            if task_success is False:
-                task_.failure_count += 1
-                success = False
+    if opts.shard is not None:
+        log.info("Processing repositories of shard shard=%s", shard)
+        repositories = filter(opts.shard.contains, repositories)
+
+    deadline = Deadline(max_duration=opts.max_duration)
+    failures_recorded = False
+    if opts.enqueue is True:
+        repository_count, repositories_succeeded, failures_recorded = execute_queue(
+            db=db,
+            repositories=repositories,
+            tasks=tasks,
+            opts=opts,
+            watermarks=watermarks,
+        )
+    else:
+        # A run with a time budget continues where the previous run stopped.
+        resume = opts.resume or opts.max_duration is not None
+        with _cancel_on_sigterm(deadline):
+            checkpoints = new_checkpoints(db=db, resume=resume, shard=shard)
+            repository_count, repositories_succeeded = execute_repositories(
+                repositories=until_deadline(repositories, deadline),
+                tasks=tasks,
+                opts=opts,
+                checkpoints=checkpoints,
+                watermarks=watermarks,
+            )
+            # The next run retries the repositories that have failed.
+            failures_recorded = checkpoints.saved_all
 
+    success = reads_succeeded and repositories_succeeded
     log.info("Finished processing of %d repositories", repository_count)
     metric.run_repositories_processed.set(repository_count)
+    metric.run_error.set(0)
+    if success is False:
+        log.error("Errors during execution - check previous log messages")
+        metric.run_error.set(1)
+
+    if deadline.stopped is True:
+        # Checkpoints record the progress of this run. Not saving the Execution lets
+        # the next run list the same repositories again and skip the ones processed.
+        log.warning(
+            "Run stopped before all repositories have been processed - next run continues from here"
+        )
+        metric.run_finish_timestamp.set_to_current_time()
+        metric.push(opts.config.pushgateway)
+        return success
 
     if repository_count > 0:
         for task_ in tasks:
-            if task_.failure_count == 0:
-                # Only update the checksum if the task did not fail.
+            if task_.failure_count == 0 or failures_recorded is True:
+                # Only update the checksum if the task did not fail or if its failures
+                # have been recorded.
                 # Without an updated checksum, on the next run, rcmt ensures that all
                 # repositories are visited by the task again.
                 # This logic guarantees that, if a new task fails, it is able to visit
                 # the failed repositories again.
-                db.update_task(task_.name, task_.checksum)
-
-    metric.run_error.set(0)
-    if success is False:
-        log.error("Errors during execution - check previous log messages")
-        metric.run_error.set(1)
+                # Repositories passed in from the command-line do not advance the
+                # watermark because the Task has not seen all updated repositories.
+                db.update_task(
+                    task_.name,
+                    task_.checksum,
+                    shard=shard,
+                    since=started_at if watermarks is not None else None,
+                )
 
     ex = database.Execution()
     ex.executed_at = datetime.datetime.now(tz=datetime.timezone.utc)
+    ex.shard = shard
     db.save_execution(ex)
+    if opts.shard is not None:
+        # The last shard to finish updates the results of all repositories.
+        db.merge_shards(opts.shard.names())
+
     metric.run_finish_timestamp.set_to_current_time()
     metric.push(opts.config.pushgateway)
     return success
 
 
-def execute_task(
-    task_wrapper: task.TaskWrapper,
-    repo: source.Repository,
+def execute_queue(
+    db: database.Database,
+    repositories: Iterator[source.Repository],
+    tasks: list[task.TaskWrapper],
     opts: Options,
-) -> bool:
-    gitc = git.Git(
-        task_wrapper.branch(opts.config.git.branch_prefix),
-        opts.config.git.clone_options,
-        opts.config.git.data_dir,
-        opts.config.git.user_name,
-        opts.config.git.user_email,
+    watermarks: Optional[Watermarks] = None,
+) -> tuple[int, bool, bool]:
+    """
+    Queues each repository for the Tasks that need to process it in the database and
+    waits until processes started by `rcmt worker` have processed all of them. Records
+    the failures of Tasks, so that the next run retries them.
+
+    :return: Number of repositories queued, if all Tasks succeeded and if all failures
+             have been recorded.
+    """
+    workqueue.prune(db=db, cfg=opts.config.queue)
+    queue_id, repository_count = workqueue.enqueue(
+        db=db,
+        repositories=repositories,
+        tasks=tasks,
+        pending=watermarks.pending if watermarks is not None else None,
     )
-    runner = RepoRun(gitc, opts)
+    failures = workqueue.wait(db=db, queue_id=queue_id, cfg=opts.config.queue)
     success = True
+    for task_ in tasks:
+        failure_count = failures.get(task_.name, 0)
+        if failure_count > 0:
+            task_.failure_count += failure_count
+            success = False
+
+    failures_recorded = True
     try:
-        if task_wrapper.has_reached_change_limit():
+        workqueue.save_failures(db=db, queue_id=queue_id)
+    except Exception as e:
+        failures_recorded = False
+        log.warning("Saving failures of queue failed queue=%s", queue_id, exc_info=e)
+
+    return repository_count, success, failures_recorded
+
+
+def execute_worker(
+    opts: Options, idle_timeout: Optional[float] = None, name: Optional[str] = None
+) -> bool:
+    """
+    Processes WorkItems queued by `rcmt run --enqueue` until `idle_timeout` seconds
+    have passed without a WorkItem to process. Runs forever if `idle_timeout` is None.
+
+    :return: False if a Task failed.
+    """
+    check_isolate(opts.config)
+    db = database.new_database(opts.config.database)
+    tasks, success = read_tasks(db=db, task_paths=opts.task_paths)
+    opts.snapshots = new_snapshots(db=db, tasks=tasks, cfg=opts.config)
+    worker = name or workqueue.new_worker_name()
+    log.info("Worker started worker=%s", worker)
+    idle_since = time.monotonic()
+    while True:
+        item = workqueue.claim(db=db, worker=worker, tasks=tasks, cfg=opts.config.queue)
+        if item is None:
+            if (
+                idle_timeout is not None
+                and time.monotonic() - idle_since >= idle_timeout
+            ):
+                log.info("No work items left - stopping worker worker=%s", worker)
+                return success
+
+            time.sleep(opts.config.queue.poll_interval)
+            continue
+
+        if execute_work_item(db, item, tasks, opts, worker) is False:
+            success = False
+
+        idle_since = time.monotonic()
+
+
+def execute_work_item(
+    db: database.Database,
+    item: database.WorkItem,
+    tasks: list[task.TaskWrapper],
+    opts: Options,
+    worker: str,
+) -> bool:
+    success = False
+    task_wrapper = next(t for t in tasks if t.name == item.task)
+    try:
+        repository = create_repository(str(item.repository), opts)
+        if repository is None:
+            log.error(
+                "Repository of work item not found repository=%s", item.repository
+            )
+        else:
+            wrapper = workqueue.DatabaseTaskWrapper(
+                wrapper=task_wrapper,
+                db=db,
+                item=item,
+                poll_interval=opts.config.queue.poll_interval,
+            )
+            lease = workqueue.lease_duration(opts.config.queue)
+            with _log_context(repository, wrapper), workqueue.Heartbeat(
+                db=db, item=item, worker=worker, lease=lease
+            ):
+                success = execute_task(wrapper, repository, opts)
+    except Exception as e:
+        log.exception("Processing work item failed", exc_info=e)
+
+    if db.complete_work_item(item=item, worker=worker, success=success) is False:
+        log.warning(
+            "Lease of work item expired before it completed repository=%s task=%s",
+            item.repository,
+            item.task,
+        )
+
+    return success
+
+
+def execute_serve(opts: Options, deadline: Optional[Deadline] = None) -> bool:
+    """
+    Receives events from GitHub and GitLab and applies Tasks to the repositories of the
+    events. Runs until the process receives SIGTERM or `deadline` gets cancelled.
+
+    :return: False if a Task file could not be read.
+    """
+    check_isolate(opts.config)
+    db = database.new_database(opts.config.database)
+    tasks, success = read_tasks(db=db, task_paths=opts.task_paths)
+    opts.snapshots = new_snapshots(db=db, tasks=tasks, cfg=opts.config)
+    window = ChangeWindow(tasks, opts.config.serve.change_limit_seconds)
+    srv = server.Server(
+        cfg=opts.config,
+        process=lambda name: execute_event(name, tasks, opts, window),
+        workers=opts.config.workers,
+    )
+    srv.start()
+    log.info(
+        "Listening for events address=%s port=%d",
+        opts.config.serve.address,
+        srv.port,
+    )
+    if deadline is None:
+        deadline = Deadline()
+
+    with _cancel_on_sigterm(deadline):
+        try:
+            # Wake up regularly to let the main thread handle KeyboardInterrupt.
+            while deadline.wait(1.0) is False:
+                pass
+        except KeyboardInterrupt:
+            pass
+
+    log.info("Stopping server - finishing repositories already started")
+    srv.stop()
+    return success
+
+
+def execute_event(
+    name: str,
+    tasks: list[task.TaskWrapper],
+    opts: Options,
+    window: Optional[ChangeWindow] = None,
+) -> None:
+    if window is not None:
+        window.check()
+
+    repository = create_repository(name, opts)
+    if repository is None:
+        log.warning("Repository of event not found repository=%s", name)
+        return
+
+    log.info("Processing repository of event repository=%s", name)
+    execute_repository(repository=repository, tasks=tasks, opts=opts)
+
+
+def create_repository(name: str, opts: Options) -> Optional[source.Repository]:
+    """
+    Creates a repository from its full name, e.g. "github.com/wndhydrnt/rcmt". Each
+    Source only creates repositories whose name starts with its host.
+
+    :return: `None` if no Source knows the repository.
+    """
+    for s in opts.sources.values():
+        repository = s.create_from_name(name=name)
+        if repository is not None:
+            return repository
+
+    return None
+
+
+def prune_failures(
+    db: database.Database, failures: dict[str, set[str]], tasks: list[str]
+) -> dict[str, set[str]]:
+    """
+    Deletes the failures of Tasks that are not in `tasks`.
+
+    :return: Failures of the Tasks in `tasks`, keyed by name of the repository.
+    """
+    count = db.delete_failures_of_other_tasks(tasks)
+    if count > 0:
+        log.info("Deleted failures of unknown tasks count=%d", count)
+
+    result: dict[str, set[str]] = {}
+    for repository, failed in failures.items():
+        known = failed.intersection(tasks)
+        if len(known) > 0:
+            result[repository] = known
+
+    return result
+
+
+def find_failed_repositories(
+    db: database.Database, names: Iterable[str], opts: Options
+) -> Iterator[source.Repository]:
+    """
+    Creates the repositories that Tasks have failed to process. Forgets the failures
+    of repositories that do not exist anymore.
+    """
+    for name in names:
+        repository = create_repository(name, opts)
+        if repository is None:
+            log.info("Failed repository does not exist anymore repository=%s", name)
+            db.delete_failures(name)
+            continue
+
+        yield repository
+
+
+def execute_repositories(
+    repositories: Iterator[source.Repository],
+    tasks: list[task.TaskWrapper],
+    opts: Options,
+    checkpoints: Optional[Checkpoints] = None,
+    watermarks: Optional[Watermarks] = None,
+) -> tuple[int, bool]:
+    """
+    Applies every Task to each repository. Passes repositories through a PipelineRun
+    if `workers` is greater than 1. Each Task works in its own work tree of the
+    repository. The PipelineRun applies up to `pipeline.task_workers` Tasks of a
+    repository at the same time. Otherwise, the Tasks of a repository are applied one
+    after another.
+
+    :return: Number of repositories processed and if all Tasks succeeded.
+    """
+    repositories = until_change_limits_reached(repositories, tasks)
+    if opts.config.workers > 1:
+        return PipelineRun(
+            opts=opts, tasks=tasks, checkpoints=checkpoints, watermarks=watermarks
+        ).execute(repositories)
+
+    repository_count: int = 0
+    success = True
+    for repository in repositories:
+        repository_count += 1
+        if (
+            execute_repository(repository, tasks, opts, checkpoints, watermarks)
+            is False
+        ):
+            success = False
+
+    return repository_count, success
+
+
+def until_change_limits_reached(
+    repositories: Iterator[source.Repository], tasks: list[task.TaskWrapper]
+) -> Iterator[source.Repository]:
+    """
+    Stops reading from `repositories` once every Task has reached its change limit.
+    Sources list repositories lazily. Stopping early avoids paging through the rest of
+    the repositories of a Source.
+    """
+    for repository in repositories:
+        yield repository
+        if len(tasks) > 0 and all(t.has_reached_change_limit() for t in tasks):
             log.info(
-                "Limit of changes reached for task limit=%d", task_wrapper.change_limit
+                "All tasks have reached their change limit - stop reading repositories"
             )
-            return success
+            return
+
+
+def execute_repository(
+    repository: source.Repository,
+    tasks: list[task.TaskWrapper],
+    opts: Options,
+    checkpoints: Optional[Checkpoints] = None,
+    watermarks: Optional[Watermarks] = None,
+) -> bool:
+    if watermarks is not None:
+        tasks = watermarks.pending(repository, tasks)
+
+    if checkpoints is not None:
+        tasks = checkpoints.pending(repository, tasks)
 
+    if len(tasks) == 0:
+        return True
+
+    success = True
+    failed: list[task.TaskWrapper] = []
+    succeeded: list[task.TaskWrapper] = []
+    checkout = new_checkout(tasks=tasks, opts=opts)
+    try:
+        for task_ in tasks:
+            rcmt.log.clear_contextvars()
+            rcmt.log.bind_contextvars(repository=repository.full_name, task=task_.name)
+            task_success = execute_task(task_, repository, opts, checkout=checkout)
+            rcmt.log.clear_contextvars()
+            if task_success is False:
+                task_.add_failure()
+                failed.append(task_)
+                success = False
+            else:
+                succeeded.append(task_)
+    finally:
+        checkout.close()
+
+    if checkpoints is not None:
+        checkpoints.save(repository, succeeded, failed)
+
+    return success
+
+
+def execute_task(
+    task_wrapper: task.TaskWrapper,
+    repo: source.Repository,
+    opts: Options,
+    checkout: Optional[git.Checkout] = None,
+) -> bool:
+    g = new_git(task_wrapper, opts, checkout)
+    runner = RepoRun(g, opts)
+    success = True
+    try:
         ctx = context.Context(repo, custom_config=opts.config.custom)
-        if task_wrapper.filter(ctx) is False:
-            log.debug("Repository does not match task")
+        if match_task(task_wrapper, ctx) is False:
             return success
 
-        log.info("Task matched repository")
-        result: RunResult = runner.execute(ctx=ctx, matcher=task_wrapper.task)
-        if result == RunResult.PR_CREATED or result == RunResult.PR_MERGED:
-            task_wrapper.changes_total += 1
+        changed = False
+        try:
+            result: RunResult = runner.execute(ctx=ctx, matcher=task_wrapper.task)
+            changed = result == RunResult.PR_CREATED or result == RunResult.PR_MERGED
+        finally:
+            task_wrapper.release_change(changed=changed)
 
     except Exception as e:
         log.exception("Task failed", exc_info=e)
         success = False
+    finally:
+        g.close()
 
     return success
 
 
+def match_task(task_wrapper: task.TaskWrapper, ctx: context.Context) -> bool:
+    """
+    Checks if a Task processes the repository in `ctx`. Acquires a change of the Task
+    if it does. The caller needs to release the change after the Task has processed the
+    repository.
+    """
+    if task_wrapper.has_reached_change_limit():
+        log.info(
+            "Limit of changes reached for task limit=%d", task_wrapper.change_limit
+        )
+        return False
+
+    if task_wrapper.filter(ctx) is False:
+        log.debug("Repository does not match task")
+        return False
+
+    log.info("Task matched repository")
+    if task_wrapper.acquire_change() is False:
+        log.info(
+            "Limit of changes reached for task limit=%d", task_wrapper.change_limit
+        )
+        return False
+
+    return True
+
+
+def new_git(
+    task_wrapper: task.TaskWrapper,
+    opts: Options,
+    checkout: Optional[git.Checkout] = None,
+) -> git.Git:
+    return git.Git(
+        task_wrapper.branch(opts.config.git.branch_prefix),
+        opts.config.git.clone_options,
+        opts.config.git.data_dir,
+        opts.config.git.user_name,
+        opts.config.git.user_email,
+        checkout=checkout,
+        paths=task_wrapper.task.paths,
+        fsmonitor=opts.config.git.fsmonitor,
+    )
+
+
+class TaskRun:
+    """
+    TaskRun tracks a Task that processes a repository in a PipelineRun.
+    """
+
+    def __init__(
+        self,
+        ctx: context.Context,
+        runner: RepoRun,
+        state: RunState,
+        task_wrapper: task.TaskWrapper,
+    ):
+        self.ctx = ctx
+        self.runner = runner
+        self.state = state
+        self.task_wrapper = task_wrapper
+        self.done = False
+
+
+class RepositoryRun:
+    """
+    RepositoryRun is the item that moves through the stages of a PipelineRun.
+    """
+
+    def __init__(
+        self,
+        repository: source.Repository,
+        checkout: git.Checkout,
+        tasks: list[task.TaskWrapper],
+    ):
+        self.checkout = checkout
+        self.failed_tasks: set[str] = set()
+        self.repository = repository
+        self.success = True
+        self.task_runs: list[TaskRun] = []
+        self.tasks = tasks
+
+
+class PipelineRun:
+    """
+    PipelineRun processes repositories in stages:
+
+    1. plan - calls Task.filter() and queries the state of pull requests.
+    2. fetch - clones or fetches the repository.
+    3. work - prepares branches, applies Tasks and commits changes.
+    4. sync - pushes changes and creates, updates, merges or closes pull requests.
+
+    Each stage runs in its own threads. While one repository gets processed by a Task,
+    the next repository is fetched and the pull requests of the previous repository
+    are updated. Bounded queues between stages limit the number of repositories held
+    in memory.
+    """
+
+    def __init__(
+        self,
+        opts: Options,
+        tasks: list[task.TaskWrapper],
+        checkpoints: Optional[Checkpoints] = None,
+        watermarks: Optional[Watermarks] = None,
+    ):
+        self.checkpoints = checkpoints
+        self.opts = opts
+        self.tasks = tasks
+        self.watermarks = watermarks
+        self._lock = threading.Lock()
+        self._success = True
+
+        workers = opts.config.workers
+        cfg = opts.config.pipeline
+        self.pipeline = pipeline.Pipeline(
+            stages=[
+                pipeline.Stage("plan", self.plan, cfg.filter_workers or workers),
+                pipeline.Stage(
+                    "fetch",
+                    self.fetch,
+                    cfg.fetch_workers or workers,
+                    on_error=self._abort,
+                ),
+                pipeline.Stage("work", self.work, workers, on_error=self._abort),
+                pipeline.Stage(
+                    "sync", self.sync, cfg.sync_workers or workers, on_error=self._abort
+                ),
+            ],
+            queue_size=cfg.queue_size or workers,
+        )
+
+    def execute(self, repositories: Iterator[source.Repository]) -> tuple[int, bool]:
+        """
+        :return: Number of repositories processed and if all Tasks succeeded.
+        """
+        log.debug(
+            "Processing repositories in pipeline workers=%d", self.opts.config.workers
+        )
+        count = self.pipeline.run(repositories)
+        return count, self._success
+
+    def plan(self, repository: source.Repository) -> Optional[RepositoryRun]:
+        tasks = self.tasks
+        if self.watermarks is not None:
+            tasks = self.watermarks.pending(repository, tasks)
+
+        if self.checkpoints is not None:
+            tasks = self.checkpoints.pending(repository, tasks)
+
+        run = RepositoryRun(
+            repository=repository,
+            checkout=new_checkout(tasks, self.opts),
+            tasks=tasks,
+        )
+        try:
+            self._plan_tasks(run)
+        except Exception as e:
+            self._abort(run, e)
+            raise
+
+        if len(run.task_runs) == 0:
+            # No Task needs a checkout of the repository.
+            self._complete(run)
+            return None
+
+        return run
+
+    def _plan_tasks(self, run: RepositoryRun) -> None:
+        repository = run.repository
+        for task_ in run.tasks:
+            with _log_context(repository, task_):
+                runner = RepoRun(new_git(task_, self.opts, run.checkout), self.opts)
+                ctx = context.Context(repository, custom_config=self.opts.config.custom)
+                try:
+                    if match_task(task_, ctx) is False:
+                        continue
+                except Exception as e:
+                    log.exception("Task failed", exc_info=e)
+                    self._fail(run, task_)
+                    continue
+
+                task_run = TaskRun(
+                    ctx=ctx, runner=runner, state=RunState(), task_wrapper=task_
+                )
+                try:
+                    task_run.state = runner.plan(ctx=ctx, matcher=task_.task)
+                except Exception as e:
+                    log.exception("Task failed", exc_info=e)
+                    self._finish(run, task_run, success=False)
+                    continue
+
+                if task_run.state.result is not None:
+                    self._finish(run, task_run)
+                    continue
+
+                run.task_runs.append(task_run)
+
+    def fetch(self, run: RepositoryRun) -> RepositoryRun:
+        if all(task_run.state.unchanged for task_run in run.task_runs):
+            # No Task needs to work on the checkout.
+            return run
+
+        with _log_context(run.repository):
+            try:
+                run.task_runs[0].runner.git.fetch(run.repository)
+            except Exception as e:
+                # prepare() fetches again and handles the error.
+                log.warning("Fetching repository failed", exc_info=e)
+
+        return run
+
+    def work(self, run: RepositoryRun) -> RepositoryRun:
+        task_workers = self.opts.config.pipeline.task_workers
+        if task_workers > 1 and len(run.task_runs) > 1:
+            # Each Task works in its own work tree. Apply the Tasks of the repository
+            # concurrently.
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=task_workers, thread_name_prefix="rcmt-task"
+            ) as executor:
+                list(
+                    executor.map(
+                        lambda task_run: self._work_task(run, task_run), run.task_runs
+                    )
+                )
+        else:
+            for task_run in run.task_runs:
+                self._work_task(run, task_run)
+
+        return run
+
+    def _work_task(self, run: RepositoryRun, task_run: TaskRun) -> None:
+        with _log_context(run.repository, task_run.task_wrapper):
+            try:
+                task_run.runner.work(
+                    ctx=task_run.ctx,
+                    matcher=task_run.task_wrapper.task,
+                    state=task_run.state,
+                )
+            except Exception as e:
+                log.exception("Task failed", exc_info=e)
+                self._finish(run, task_run, success=False)
+                return
+
+            if task_run.state.result is not None:
+                self._finish(run, task_run)
+
+    def sync(self, run: RepositoryRun) -> None:
+        self._push(run)
+        for task_run in run.task_runs:
+            if task_run.done is True:
+                continue
+
+            with _log_context(run.repository, task_run.task_wrapper):
+                try:
+                    result = task_run.runner.sync(
+                        ctx=task_run.ctx,
+                        matcher=task_run.task_wrapper.task,
+                        state=task_run.state,
+                    )
+                except Exception as e:
+                    log.exception("Task failed", exc_info=e)
+                    self._finish(run, task_run, success=False)
+                    continue
+
+                self._finish(
+                    run,
+                    task_run,
+                    changed=result == RunResult.PR_CREATED
+                    or result == RunResult.PR_MERGED,
+                )
+
+        self._complete(run)
+
+    def _push(self, run: RepositoryRun) -> None:
+        """
+        Pushes the branches of all Tasks that have changed the repository in one call
+        to `git push`. sync() of each Task pushes its branch on its own if the batch
+        does not contain it.
+        """
+        if self.opts.config.dry_run is True:
+            return
+
+        task_runs = [
+            task_run
+            for task_run in run.task_runs
+            if task_run.done is False and task_run.state.has_changes is True
+            # sync() closes the pull request instead of pushing if the base branch
+            # contains all changes.
+            and task_run.state.has_changes_base is True
+        ]
+        if len(task_runs) < 2:
+            return
+
+        branches = [task_run.runner.git.branch_name for task_run in task_runs]
+        with _log_context(run.repository):
+            log.debug("Pushing branches count=%d", len(branches))
+            try:
+                results = run.checkout.push(branches)
+            except Exception as e:
+                log.warning("Pushing branches failed", exc_info=e)
+                return
+
+        for task_run, branch in zip(task_runs, branches):
+            task_run.state.push_result = results[branch]
+
+    def _abort(self, run: RepositoryRun, error: Exception) -> None:
+        """
+        Fails all Tasks that have not finished processing a repository because a stage
+        raised `error`. Releases their changes and the Checkout of the repository.
+        """
+        for task_run in run.task_runs:
+            if task_run.done is False:
+                self._finish(run, task_run, success=False)
+
+        self._complete(run)
+
+    def _complete(self, run: RepositoryRun) -> None:
+        run.checkout.close()
+        if self.checkpoints is None:
+            return
+
+        self.checkpoints.save(
+            run.repository,
+            [t for t in run.tasks if t.name not in run.failed_tasks],
+            [t for t in run.tasks if t.name in run.failed_tasks],
+        )
+
+    def _fail(self, run: RepositoryRun, task_wrapper: task.TaskWrapper) -> None:
+        task_wrapper.add_failure()
+        run.failed_tasks.add(task_wrapper.name)
+        run.success = False
+        with self._lock:
+            self._success = False
+
+    def _finish(
+        self,
+        run: RepositoryRun,
+        task_run: TaskRun,
+        changed: bool = False,
+        success: bool = True,
+    ) -> None:
+        task_run.done = True
+        try:
+            task_run.runner.close()
+        finally:
+            task_run.task_wrapper.release_change(changed=changed)
+            if success is False:
+                self._fail(run, task_run.task_wrapper)
+
+
+@contextlib.contextmanager
+def _log_context(
+    repository: source.Repository, task_wrapper: Optional[task.TaskWrapper] = None
+) -> Iterator[None]:
+    rcmt.log.clear_contextvars()
+    if task_wrapper is None:
+        rcmt.log.bind_contextvars(repository=repository.full_name)
+    else:
+        rcmt.log.bind_contextvars(
+            repository=repository.full_name, task=task_wrapper.name
+        )
+
+    try:
+        yield
+    finally:
+        rcmt.log.clear_contextvars()
+
+
+def new_checkout(tasks: list[task.TaskWrapper], opts: Options) -> git.Checkout:
+    """
+    Creates the Checkout shared by all Tasks that process a repository. The Checkout
+    fetches the branches of all Tasks at once.
+    """
+    prefix = opts.config.git.branch_prefix
+    branches = [f"{prefix}*"]
+    for task_ in tasks:
+        branch = task_.branch(prefix)
+        if branch.startswith(prefix) is False:
+            branches.append(branch)
+
+    return git.Checkout(branches=branches)
+
+
 def options_from_config(path: str) -> Options:
     cfg = config.read_config_from_file(path)
     return config_to_options(cfg)
@@ -399,11 +1778,21 @@ def options_from_config(path: str) -> Options:
 def config_to_options(cfg: config.Config) -> Options:
     opts = Options(cfg)
     if cfg.github.access_token != "":
-        source_github = source.Github(cfg.github.access_token, cfg.github.base_url)
+        source_github = source.Github(
+            cfg.github.access_token,
+            cfg.github.base_url,
+            cfg.github.pool_size,
+            ratelimit.new_rate_limiter("github", cfg.github.rate_limit),
+        )
         opts.sources["github"] = source_github
 
     if cfg.gitlab.private_token != "":
-        source_gitlab = source.Gitlab(cfg.gitlab.url, cfg.gitlab.private_token)
+        source_gitlab = source.Gitlab(
+            cfg.gitlab.url,
+            cfg.gitlab.private_token,
+            cfg.gitlab.pool_size,
+            ratelimit.new_rate_limiter("gitlab", cfg.gitlab.rate_limit),
+        )
         opts.sources["gitlab"] = source_gitlab
 
     return opts
@@ -413,28 +1802,60 @@ def list_repositories(
     all_repositories: bool,
     since: datetime.datetime,
     sources: list[source.Base],
+    open_pull_requests: Optional[set[str]] = None,
+    retry: Optional[Iterable[source.Repository]] = None,
 ) -> Iterator[source.Repository]:
-    known_repos: list[str] = []
-    for s in sources:
-        for repository in s.list_repositories(since=since):
-            known_repos.append(str(repository))
-            yield repository
-
-        if all_repositories is False:
+    """
+    Lists repositories updated after `since` and, unless `all_repositories` is set,
+    repositories with open pull requests.
+
+    :param open_pull_requests: Receives the names of repositories with open pull
+                               requests.
+    :param retry: Repositories to list, e.g. because a Task has failed to process them
+                  during the previous run.
+    """
+    known_repos: set[str] = set()
+    if all_repositories is False:
+        # List repositories with open pull requests first. A repository is processed as
+        # soon as it has been listed and Watermarks need to know about its pull
+        # requests by then, even if a Task has failed to process it, too.
+        for s in sources:
             log.debug("Listing repositories with open pull requests")
             for repository in s.list_repositories_with_open_pull_requests():
+                if open_pull_requests is not None:
+                    open_pull_requests.add(repository.full_name)
+
                 if str(repository) in known_repos:
                     continue
 
-                known_repos.append(str(repository))
+                known_repos.add(str(repository))
                 yield repository
 
+    for repository in retry or []:
+        if str(repository) in known_repos:
+            continue
+
+        known_repos.add(str(repository))
+        yield repository
+
+    for s in sources:
+        for repository in s.list_repositories(since=since):
+            if str(repository) in known_repos:
+                continue
+
+            known_repos.add(str(repository))
+            yield repository
+
 
 def read_tasks(
-    db: database.Database, task_paths: list[str]
-) -> tuple[list[task.TaskWrapper], bool, bool]:
+    db: database.Database, task_paths: list[str], shard: Optional[str] = None
+) -> tuple[list[task.TaskWrapper], bool]:
+    """
+    Reads Tasks from files and sets the watermark of each Task.
+
+    :return: Enabled Tasks and if all files could be read.
+    """
     tasks: list[task.TaskWrapper] = []
-    needs_all_repositories: bool = False
     all_reads_succeed: bool = True
     for task_path in task_paths:
         try:
@@ -447,15 +1868,19 @@ def read_tasks(
             continue
 
     for wrapper in task.registry.tasks:
-        task_db = db.get_or_create_task(name=wrapper.name)
+        task_db = db.get_or_create_task(name=wrapper.name, shard=shard)
         if wrapper.task.enabled is False:
-            db.update_task(wrapper.name, wrapper.checksum)
+            db.update_task(wrapper.name, wrapper.checksum, shard=shard)
             log.info("Task disabled task=%s", wrapper.name)
             continue
 
         if wrapper.checksum != task_db.checksum:
-            needs_all_repositories = True
+            # Changed or new Task. Process all repositories.
+            wrapper.since = datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+        elif task_db.since is not None:
+            # Assume UTC because the database stores no timezone.
+            wrapper.since = task_db.since.replace(tzinfo=datetime.timezone.utc)
 
         tasks.append(wrapper)
 
-    return tasks, needs_all_repositories, all_reads_succeed
+    return tasks, all_reads_succeed
@@ -0,0 +1,347 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Mapping, Optional
+from urllib.parse import urlparse
+
+import rcmt.log
+
+from . import config
+from .source.github import github_host
+
+log = rcmt.log.get_logger(__name__)
+
+# Events of GitHub that can change the result of a Task.
+GITHUB_EVENTS = ("check_suite", "pull_request", "push", "status")
+# Events of GitLab that can change the result of a Task.
+GITLAB_EVENTS = ("Merge Request Hook", "Pipeline Hook", "Push Hook")
+# GitHub does not send payloads larger than 25 MB.
+MAX_BODY_SIZE = 25 * 1024 * 1024
+
+
+class InvalidSignatureError(Exception):
+    pass
+
+
+class Debouncer:
+    """
+    Debouncer collects the names of repositories for which events have arrived. It
+    returns a name once no new event for the repository has arrived for `delay`
+    seconds. This turns a burst of events, like a push followed by the events of
+    checks, into one run.
+
+    A repository is not returned again while it is being processed. Events that arrive
+    in the meantime schedule it again after it has been processed.
+
+    :param delay: Number of seconds to wait for more events of a repository.
+    """
+
+    def __init__(self, delay: float, clock: Callable[[], float] = time.monotonic):
+        self.delay = delay
+        self._active: set[str] = set()
+        self._clock = clock
+        self._closed = False
+        self._cond = threading.Condition()
+        self._due: dict[str, float] = {}
+
+    def add(self, name: str) -> None:
+        with self._cond:
+            self._due[name] = self._clock() + self.delay
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def done(self, name: str) -> None:
+        """
+        Marks the processing of a repository returned by next() as done.
+        """
+        with self._cond:
+            self._active.discard(name)
+            self._cond.notify_all()
+
+    def next(self) -> Optional[str]:
+        """
+        Blocks until a repository is due.
+
+        :return: Name of the repository or None if the Debouncer has been closed.
+        """
+        with self._cond:
+            while self._closed is False:
+                now = self._clock()
+                waiting = [
+                    (due, name)
+                    for name, due in self._due.items()
+                    if name not in self._active
+                ]
+                if len(waiting) == 0:
+                    self._cond.wait()
+                    continue
+
+                due, name = min(waiting)
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+
+                del self._due[name]
+                self._active.add(name)
+                return name
+
+            return None
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._due)
+
+
+def github_repository(
+    event: str, payload: Mapping[str, Any], host: str = "github.com"
+) -> Optional[str]:
+    """
+    Returns the name of the repository of an event sent by GitHub.
+
+    :param host: Host of the GitHub installation that has sent the event.
+    :return: Name of the repository or None if the event does not affect Tasks.
+    """
+    if event not in GITHUB_EVENTS:
+        return None
+
+    repository = payload.get("repository") or {}
+    if event == "push" and payload.get("ref") != "refs/heads/" + str(
+        repository.get("default_branch")
+    ):
+        # Only a push to the base branch changes the result of a Task.
+        return None
+
+    full_name = repository.get("full_name")
+    if full_name is None:
+        return None
+
+    return f"{host}/{full_name}"
+
+
+def gitlab_repository(event: str, payload: Mapping[str, Any]) -> Optional[str]:
+    """
+    Returns the name of the repository of an event sent by GitLab.
+
+    :return: Name of the repository or None if the event does not affect Tasks.
+    """
+    if event not in GITLAB_EVENTS:
+        return None
+
+    project = payload.get("project") or {}
+    if event == "Push Hook" and payload.get("ref") != "refs/heads/" + str(
+        project.get("default_branch")
+    ):
+        return None
+
+    web_url = project.get("web_url")
+    path = project.get("path_with_namespace")
+    if web_url is None or path is None:
+        return None
+
+    return f"{urlparse(web_url).netloc}/{path}"
+
+
+def _verify_github(body: bytes, headers: Mapping[str, str], secret: str) -> None:
+    if secret == "":
+        raise InvalidSignatureError("webhook secret of GitHub is not configured")
+
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if hmac.compare_digest(expected, headers.get("x-hub-signature-256", "")) is False:
+        raise InvalidSignatureError("signature of GitHub event does not match")
+
+
+def _verify_gitlab(body: bytes, headers: Mapping[str, str], secret: str) -> None:
+    if secret == "":
+        raise InvalidSignatureError("webhook token of GitLab is not configured")
+
+    if hmac.compare_digest(secret, headers.get("x-gitlab-token", "")) is False:
+        raise InvalidSignatureError("token of GitLab event does not match")
+
+
+def repository_from_event(
+    body: bytes, headers: Mapping[str, str], cfg: config.Config
+) -> Optional[str]:
+    """
+    Validates an event sent by GitHub or GitLab and extracts the name of its
+    repository.
+
+    :return: Name of the repository or None if the event does not affect Tasks.
+    :raises InvalidSignatureError: If the secret of the event does not match or no
+                                   secret has been configured.
+    :raises ValueError: If the body of the event is not valid JSON.
+    """
+    # Names of headers are case-insensitive.
+    headers = {key.lower(): value for key, value in headers.items()}
+    github_event = headers.get("x-github-event")
+    if github_event is not None:
+        _verify_github(body, headers, cfg.github.webhook_secret)
+        return github_repository(
+            github_event, json.loads(body), github_host(cfg.github.base_url)
+        )
+
+    gitlab_event = headers.get("x-gitlab-event")
+    if gitlab_event is not None:
+        _verify_gitlab(body, headers, cfg.gitlab.webhook_token)
+        return gitlab_repository(gitlab_event, json.loads(body))
+
+    return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Handler accepts events at `/webhook` and reports the health of the server at
+    `/healthz`.
+    """
+
+    # Set by new_server().
+    debouncer: Debouncer
+    cfg: config.Config
+
+    def do_GET(self) -> None:
+        if self.path != "/healthz":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self._respond(200, {"pending": self.debouncer.pending()})
+
+    def do_POST(self) -> None:
+        if self.path != "/webhook":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+
+        if length < 0:
+            self._respond(400, {"error": "invalid Content-Length"})
+            return
+
+        if length > MAX_BODY_SIZE:
+            self._respond(413, {"error": "body is too large"})
+            return
+
+        body = self.rfile.read(length)
+        try:
+            name = repository_from_event(body, dict(self.headers.items()), self.cfg)
+        except InvalidSignatureError as e:
+            log.warning("Rejected event reason=%s", str(e))
+            self._respond(401, {"error": str(e)})
+            return
+        except ValueError:
+            self._respond(400, {"error": "body is not valid JSON"})
+            return
+
+        if name is None:
+            self._respond(200, {"queued": None})
+            return
+
+        log.debug("Received event repository=%s", name)
+        self.debouncer.add(name)
+        self._respond(202, {"queued": name})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug("HTTP " + format, *args)
+
+    def _respond(self, status: int, data: Mapping[str, Any]) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def new_server(cfg: config.Config, debouncer: Debouncer) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP server that receives events. Pass port `0` in the configuration
+    to let the operating system choose a free port.
+    """
+    handler = type(
+        "ConfiguredHandler", (Handler,), {"cfg": cfg, "debouncer": debouncer}
+    )
+    server = ThreadingHTTPServer((cfg.serve.address, cfg.serve.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class Server:
+    """
+    Server receives events from GitHub and GitLab via HTTP. It calls `process` with the
+    name of a repository once the events of the repository have settled.
+
+    :param cfg: Configuration of rcmt. Requires the secret of at least one webhook.
+    :param process: Processes a repository. Called concurrently by `workers` threads,
+                    but never concurrently for the same repository.
+    :param workers: Number of repositories to process concurrently.
+    """
+
+    def __init__(
+        self, cfg: config.Config, process: Callable[[str], None], workers: int = 1
+    ):
+        if cfg.github.webhook_secret == "" and cfg.gitlab.webhook_token == "":
+            raise ValueError(
+                "Configure github.webhook_secret or gitlab.webhook_token to verify events"
+            )
+
+        self.debouncer = Debouncer(delay=cfg.serve.debounce_seconds)
+        self.http = new_server(cfg, self.debouncer)
+        self.process = process
+        self.workers = workers
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def port(self) -> int:
+        return self.http.server_address[1]
+
+    def start(self) -> None:
+        self._threads.append(
+            threading.Thread(
+                target=self.http.serve_forever, daemon=True, name="rcmt-http"
+            )
+        )
+        for i in range(self.workers):
+            self._threads.append(
+                threading.Thread(target=self._work, daemon=True, name=f"rcmt-serve-{i}")
+            )
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops accepting events and waits for the repositories being processed.
+        Discards repositories that are waiting for their events to settle.
+        """
+        self.http.shutdown()
+        self.http.server_close()
+        self.debouncer.close()
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while True:
+            name = self.debouncer.next()
+            if name is None:
+                return
+
+            try:
+                self.process(name)
+            except Exception as e:
+                log.exception("Processing repository failed", exc_info=e)
+            finally:
+                self.debouncer.done(name)
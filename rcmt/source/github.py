@@ -6,6 +6,7 @@ import datetime
 import fnmatch
 import io
 from typing import Any, Generator, Iterator, Optional, TextIO, Union
+from urllib.parse import urlparse
 
 import github
 import github.Auth
@@ -14,6 +15,7 @@ import github.Repository
 
 import rcmt.log
 
+from . import ratelimit
 from .source import (
     Base,
     PullRequest,
@@ -26,8 +28,14 @@ log = rcmt.log.get_logger(__name__)
 
 
 class GithubRepository(Repository):
-    def __init__(self, access_token: str, repo: github.Repository.Repository):
+    def __init__(
+        self,
+        access_token: str,
+        repo: github.Repository.Repository,
+        host: str = "github.com",
+    ):
         self.access_token = access_token
+        self.host = host
         self.repo = repo
         self._name = repo.name
         self._project = repo.owner.login
@@ -176,7 +184,7 @@ class GithubRepository(Repository):
 
     @property
     def source(self) -> str:
-        return "github.com"
+        return self.host
 
     def update_pull_request(
         self, pr: github.PullRequest.PullRequest, pr_data: PullRequest
@@ -192,23 +200,51 @@ class GithubRepository(Repository):
             log.debug("Updating PR data pr_id=%s", pr.id)
             pr.edit(title=pr_data.title, body=pr_data.body)
 
+    @property
+    def updated_at(self) -> Optional[datetime.datetime]:
+        return self.repo.updated_at
+
+
+def github_host(base_url: str) -> str:
+    """
+    Returns the host that prefixes the names of repositories of a GitHub installation,
+    e.g. `github.com` for `https://api.github.com` or `github.example.com` for
+    `https://github.example.com/api/v3`.
+    """
+    return urlparse(base_url).netloc.removeprefix("api.")
+
 
 class Github(Base):
-    def __init__(self, access_token: str, base_url: str):
+    def __init__(
+        self,
+        access_token: str,
+        base_url: str,
+        pool_size: Optional[int] = None,
+        rate_limiter: Optional[ratelimit.RateLimiter] = None,
+    ):
         self.access_token = access_token
+        self.host = github_host(base_url)
         self.client = github.Github(
             auth=github.Auth.Token(token=access_token),
             base_url=base_url,
+            pool_size=pool_size,
         )
+        if rate_limiter is not None:
+            ratelimit.mount_github(self.client, rate_limiter)
 
     def create_from_name(self, name: str) -> Optional[Repository]:
-        repo_name = "/".join(name.split("/")[1:])
+        host, _, repo_name = name.partition("/")
+        if host != self.host:
+            return None
+
         try:
             gh_repo = self.client.get_repo(full_name_or_id=repo_name, lazy=False)
         except github.UnknownObjectException:
             return None
 
-        return GithubRepository(access_token=self.access_token, repo=gh_repo)
+        return GithubRepository(
+            access_token=self.access_token, repo=gh_repo, host=self.host
+        )
 
     def list_repositories_with_open_pull_requests(
         self,
@@ -217,7 +253,7 @@ class Github(Base):
         for issue in self.client.search_issues(
             f"is:open is:pr author:{user.login} archived:false"
         ):
-            yield GithubRepository(self.access_token, issue.repository)
+            yield GithubRepository(self.access_token, issue.repository, self.host)
 
     def list_repositories(self, since: datetime.datetime) -> Iterator[Repository]:
         log.debug("Start fetching repositories")
@@ -225,7 +261,7 @@ class Github(Base):
             direction="desc", sort="updated"
         ):
             if gh_repo.updated_at > since:
-                yield GithubRepository(self.access_token, gh_repo)
+                yield GithubRepository(self.access_token, gh_repo, self.host)
             else:
                 break
 
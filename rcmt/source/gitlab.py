@@ -10,6 +10,7 @@ from typing import Any, Generator, Iterator, Optional, TextIO, Union
 from urllib.parse import urlparse
 
 import gitlab
+import requests.adapters
 from gitlab import GitlabGetError
 from gitlab.base import RESTObjectList
 from gitlab.v4.objects import CurrentUser
@@ -18,6 +19,7 @@ from gitlab.v4.objects.merge_requests import ProjectMergeRequest as GitlabMergeR
 
 import rcmt.log
 
+from . import ratelimit
 from .source import (
     Base,
     PullRequest,
@@ -213,10 +215,43 @@ class GitlabRepository(Repository):
             log.debug("Updating merge request data mr_id=%s", pr.get_id())
             pr.save()
 
+    @property
+    def updated_at(self) -> Optional[datetime.datetime]:
+        last_activity_at: Optional[str] = getattr(
+            self._project, "last_activity_at", None
+        )
+        if last_activity_at is None:
+            return None
+
+        corrected = last_activity_at.replace("Z", "")
+        return datetime.datetime.fromisoformat(corrected).replace(
+            tzinfo=datetime.timezone.utc
+        )
+
 
 class Gitlab(Base):
-    def __init__(self, url: str, private_token: str):
+    def __init__(
+        self,
+        url: str,
+        private_token: str,
+        pool_size: Optional[int] = None,
+        rate_limiter: Optional[ratelimit.RateLimiter] = None,
+    ):
         self.client = gitlab.Gitlab(url, private_token=private_token)
+        adapter_args: dict[str, Any] = {}
+        if pool_size is not None:
+            # Keep connections to the API open for all threads that send requests.
+            adapter_args["pool_maxsize"] = pool_size
+
+        if rate_limiter is not None:
+            # python-gitlab retries requests rejected by the rate limit itself.
+            ratelimit.mount(
+                self.client.session, rate_limiter, retry_rejected=False, **adapter_args
+            )
+        elif len(adapter_args) > 0:
+            adapter = requests.adapters.HTTPAdapter(**adapter_args)
+            self.client.session.mount("http://", adapter)
+            self.client.session.mount("https://", adapter)
         self.url = urlparse(url).netloc
 
     def create_from_name(self, name: str) -> Optional[Repository]:
@@ -277,6 +312,8 @@ class Gitlab(Base):
             last_activity_after=since,
             iterator=True,
             min_access_level=30,
+            order_by="last_activity_at",
+            sort="desc",
         )
         for p in projects:
             yield GitlabRepository(
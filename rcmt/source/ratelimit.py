@@ -0,0 +1,264 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+from typing import Any, Callable, Mapping, Optional, Union
+
+import github
+import requests
+import requests.adapters
+from urllib3.util import Retry
+
+import rcmt.log
+from rcmt import config, metric
+
+log = rcmt.log.get_logger(__name__)
+
+# Maximum number of seconds to pause after a rejected request without timing headers.
+MAX_BACKOFF = 60.0
+
+
+class RateLimiter:
+    """
+    RateLimiter schedules the requests that rcmt sends to the API of a Source.
+
+    It reads the rate limit headers of each response. GitHub sends
+    `X-RateLimit-Remaining` and `X-RateLimit-Reset`. GitLab sends `RateLimit-Remaining`
+    and `RateLimit-Reset`. Once less than `spread_below` of the quota remains, the
+    RateLimiter spreads the remaining requests evenly until the quota resets. If the API
+    responds with `Retry-After` or the quota is used up, all threads that send requests
+    pause until the API accepts requests again. If the API rejects a request without
+    telling when to try again, the pause doubles with every rejection in a row, up to
+    `MAX_BACKOFF` seconds.
+
+    :param name: Name of the Source. Used as the label of metrics.
+    :param max_retries: Number of times to retry a request that the API has rejected
+                        because of its rate limit.
+    :param spread_below: Fraction of the quota below which to spread requests.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_retries: int = 3,
+        spread_below: float = 0.1,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_retries = max_retries
+        self.name = name
+        self.spread_below = spread_below
+
+        self._clock = clock
+        self._interval: float = 0.0
+        self._rejections = 0
+        self._lock = threading.Lock()
+        self._next_at: float = 0.0
+        self._paused_until: float = 0.0
+        self._sleep = sleep
+        self._remaining_metric = metric.source_rate_limit_remaining.labels(
+            metric.label_run, name
+        )
+
+    def acquire(self) -> None:
+        """
+        Blocks until the next request can be sent.
+        """
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._paused_until, self._next_at)
+            self._next_at = start + self._interval
+
+        wait = start - now
+        if wait > 0:
+            log.debug("Waiting for rate limit source=%s seconds=%.2f", self.name, wait)
+            self._sleep(wait)
+
+    def update(self, status_code: int, headers: Mapping[str, str]) -> bool:
+        """
+        Updates the schedule from the response to a request.
+
+        :param status_code: HTTP status code of the response.
+        :param headers: Headers of the response. Keys are case-insensitive.
+        :return: True if the API has rejected the request because of its rate limit.
+        """
+        remaining = _header_int(headers, "x-ratelimit-remaining", "ratelimit-remaining")
+        limit = _header_int(headers, "x-ratelimit-limit", "ratelimit-limit")
+        reset = _header_int(headers, "x-ratelimit-reset", "ratelimit-reset")
+        retry_after = _header_int(headers, "retry-after")
+        rejected = status_code == 429 or (
+            status_code == 403 and (retry_after is not None or remaining == 0)
+        )
+
+        with self._lock:
+            now = self._clock()
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            elif rejected and reset is not None:
+                self._paused_until = max(self._paused_until, float(reset))
+
+            if rejected is False:
+                self._rejections = 0
+            else:
+                if self._paused_until <= now:
+                    # Back off instead of retrying right away.
+                    backoff = min(2.0**self._rejections, MAX_BACKOFF)
+                    self._paused_until = now + backoff
+
+                self._rejections += 1
+
+            if remaining is not None:
+                self._remaining_metric.set(remaining)
+                self._interval = self._spread_interval(
+                    now=now, remaining=remaining, limit=limit, reset=reset
+                )
+
+            paused_until = self._paused_until
+
+        if rejected is True and paused_until > now:
+            log.warning(
+                "Rate limit of source reached - pausing requests source=%s seconds=%.0f",
+                self.name,
+                paused_until - now,
+            )
+
+        return rejected
+
+    def _spread_interval(
+        self,
+        now: float,
+        remaining: int,
+        limit: Optional[int],
+        reset: Optional[int],
+    ) -> float:
+        if limit is None or reset is None or limit <= 0:
+            return 0.0
+
+        if remaining >= limit * self.spread_below:
+            return 0.0
+
+        return max(reset - now, 0.0) / max(remaining, 1)
+
+
+class RateLimitAdapter(requests.adapters.HTTPAdapter):
+    """
+    RateLimitAdapter sends every request of a `requests.Session` through a RateLimiter.
+
+    :param limiter: RateLimiter that schedules the requests.
+    :param retry_rejected: Retry requests rejected because of the rate limit. Disable it
+                           if the client of the API retries these requests itself.
+    """
+
+    def __init__(
+        self, limiter: RateLimiter, retry_rejected: bool = True, **kwargs: Any
+    ):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.retry_rejected = retry_rejected
+
+    def send(
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            response = super().send(request, *args, **kwargs)
+            rejected = self.limiter.update(response.status_code, response.headers)
+            if (
+                rejected is False
+                or self.retry_rejected is False
+                or attempt >= self.limiter.max_retries
+            ):
+                return response
+
+            attempt += 1
+            log.debug(
+                "Retrying request rejected by rate limit source=%s attempt=%d",
+                self.limiter.name,
+                attempt,
+            )
+            response.close()
+
+
+def new_rate_limiter(name: str, cfg: config.RateLimit) -> Optional[RateLimiter]:
+    if cfg.enabled is False:
+        return None
+
+    return RateLimiter(
+        name=name, max_retries=cfg.max_retries, spread_below=cfg.spread_below
+    )
+
+
+def mount(session: requests.Session, limiter: RateLimiter, **kwargs: Any) -> None:
+    """
+    Mounts a RateLimitAdapter for HTTP and HTTPS on `session`. `kwargs` are passed to
+    the RateLimitAdapter.
+    """
+    adapter = RateLimitAdapter(limiter=limiter, **kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def mount_github(client: github.Github, limiter: RateLimiter) -> None:
+    """
+    Sends all requests of `client` to its API through `limiter`. Other instances of
+    `github.Github` are not affected.
+    """
+    # PyGithub creates the requests.Session of a Requester lazily from the connection
+    # class of the Requester and offers no public way to set the class of a single
+    # Requester.
+    requester = client.requester
+    connection_class = getattr(requester, "_Requester__connectionClass")
+    setattr(
+        requester,
+        "_Requester__connectionClass",
+        _github_connection_class(connection_class, limiter),
+    )
+
+
+def _github_connection_class(base: type, limiter: RateLimiter) -> type:
+    class RateLimitedConnection(base):  # type: ignore[valid-type,misc]
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(*args, **kwargs)
+            mount(
+                self.session,
+                limiter,
+                max_retries=_transport_retry(self.retry),
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size,
+            )
+
+    return RateLimitedConnection
+
+
+def _transport_retry(retry: Union[int, Retry]) -> Retry:
+    """
+    Returns a Retry that retries failed connections like `retry` does. It leaves
+    responses rejected by the rate limit of GitHub to the RateLimitAdapter, which
+    retries them after all threads have paused. Otherwise PyGithub would retry each
+    attempt of the RateLimitAdapter again.
+    """
+    total = retry.total if isinstance(retry, Retry) else retry
+    return Retry(
+        total=total,
+        raise_on_status=False,
+        respect_retry_after_header=False,
+        status_forcelist=None,
+    )
+
+
+def _header_int(headers: Mapping[str, str], *names: str) -> Optional[int]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+
+        try:
+            return int(float(value))
+        except ValueError:
+            # Retry-After can be an HTTP date. Ignore it.
+            return None
+
+    return None
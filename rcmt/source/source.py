@@ -385,6 +385,18 @@ class Repository:
             "class does not implement Repository.update_pull_request()"
         )
 
+    @property
+    def updated_at(self) -> Optional[datetime.datetime]:
+        """
+        rcmt skips a Task if the repository has not been updated since the Task has
+        last processed all repositories. Returning `None` makes every Task process the
+        repository.
+
+        :return: Date and time of the last update of the repository.
+        :rtype: datetime.datetime, None
+        """
+        return None
+
 
 class Base:
     """
@@ -11,6 +11,7 @@ import os.path
 import random
 import string
 import sys
+import threading
 from typing import Any, Optional
 
 from slugify import slugify
@@ -55,6 +56,16 @@ class Task:
         merge_once: If `True`, rcmt does not create another pull request if it created a
                     pull request for the same branch before and that pull request has
                     been merged.
+        only_actions: If `True`, the Task promises that `apply()` changes files only
+                      via the Actions of rcmt. rcmt then checks and commits only the
+                      files that the Actions have changed instead of scanning the whole
+                      checkout. rcmt still scans the whole checkout if the Task calls
+                      the Action `exec`. Defaults to `False`.
+        paths: Directories that the Task reads and writes, relative to the root of
+               the repository, e.g. `[".github/workflows", "deploy"]`. rcmt checks out
+               only these directories and the files in the root directory of the
+               repository. Speeds up Tasks that modify large repositories.
+               Defaults to ``None`` which checks out all files.
         pr_body: Define a custom body of a pull request.
         pr_title: Set a custom title for a pull request.
 
@@ -94,6 +105,8 @@ class Task:
     delete_branch_after_merge: bool = True
     enabled: bool = True
     merge_once: bool = False
+    only_actions: bool = False
+    paths: Optional[list[str]] = None
     pr_body: str = ""
     pr_title: str = ""
     labels: Optional[list[str]] = None
@@ -104,8 +117,13 @@ class Task:
         """apply contains all logic that modifies files in a repository. The class that
         extends Task needs to override this method and implement the actual logic.
 
-        rcmt calls this method if filter() returned true. It sets the current working
-        directory (`cwd`) to the checkout of the repository.
+        rcmt calls this method if filter() returned true. `ctx.checkout_dir` points to
+        the checkout of the repository. Actions resolve paths relative to it.
+
+        rcmt also sets the current working directory (`cwd`) to the checkout of the
+        repository, unless it processes repositories concurrently (setting `workers`).
+        Custom code should use `ctx.checkout_dir` or `ctx.path()` to work in both
+        modes.
 
         Args:
             ctx: The context that holds the current repository and additional
@@ -183,6 +201,43 @@ class TaskWrapper:
         self.changes_total: int = 0
         self.checksum: str = ""
         self.failure_count: int = 0
+        # The Task has processed all repositories updated before this time.
+        # None if the Task needs to process all repositories.
+        self.since: Optional[datetime.datetime] = None
+
+        self._changes_in_flight: int = 0
+        self._lock = threading.Condition()
+
+    def acquire_change(self) -> bool:
+        """
+        acquire_change reserves one of the changes left until the Task reaches its
+        change limit. Workers that run concurrently call it before they process a
+        repository.
+
+        Blocks while changes reserved by other workers could still use up the limit.
+
+        :return: False if the change limit has been reached.
+        """
+        with self._lock:
+            while True:
+                if self.task.change_limit is None:
+                    return True
+
+                if self.changes_total >= self.task.change_limit:
+                    return False
+
+                if (
+                    self.changes_total + self._changes_in_flight
+                    < self.task.change_limit
+                ):
+                    self._changes_in_flight += 1
+                    return True
+
+                self._lock.wait()
+
+    def add_failure(self) -> None:
+        with self._lock:
+            self.failure_count += 1
 
     def apply(self, ctx: Context) -> None:
         self.task.apply(ctx=ctx)
@@ -202,6 +257,30 @@ class TaskWrapper:
 
         return self.changes_total >= self.task.change_limit
 
+    def release_change(self, changed: bool) -> None:
+        """
+        release_change returns a change reserved by acquire_change.
+
+        :param changed: Indicates if the worker created or merged a pull request.
+        """
+        with self._lock:
+            if changed is True:
+                self.changes_total += 1
+
+            if self.task.change_limit is not None:
+                self._changes_in_flight -= 1
+
+            self._lock.notify_all()
+
+    def reset_changes(self) -> None:
+        """
+        reset_changes sets the number of changes back to zero. Changes that workers have
+        reserved, but not released yet, are kept.
+        """
+        with self._lock:
+            self.changes_total = 0
+            self._lock.notify_all()
+
     @property
     def change_limit(self) -> Optional[int]:
         return self.task.change_limit
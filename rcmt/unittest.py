@@ -166,8 +166,8 @@ class TaskTestCase(TestCase):
                     have been applied.
             after: The repository in the expected state after the Task has modified it.
         """
-        ctx = Context(repo=before)
         with tempfile.TemporaryDirectory() as d:
+            ctx = Context(repo=before, checkout_dir=d)
             for f in before.files:
                 temp_file_path = os.path.join(d, f.path)
                 dirname = os.path.dirname(temp_file_path)
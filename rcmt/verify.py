@@ -55,15 +55,23 @@ def execute(
             opts.config.git.user_email,
         )
 
-        print("🏗️  Preparing git clone", file=out)
-        checkout_dir, has_conflict = gitc.prepare(force_rebase=False, repo=repository)
-        print("🚜 Applying Task", file=out)
-        with fs.in_checkout_dir(checkout_dir):
-            t.apply(ctx=ctx)
-
-        if gitc.has_changes_local(repo_dir=checkout_dir):
-            print(
-                f"😍 Actions modified files - view changes in {checkout_dir}", file=out
+        try:
+            print("🏗️  Preparing git clone", file=out)
+            checkout_dir, has_conflict = gitc.prepare(
+                force_rebase=False, repo=repository
             )
-        else:
-            print("⚠️  No changes after applying Actions", file=out)
+            print("🚜 Applying Task", file=out)
+            ctx.checkout_dir = checkout_dir
+            with fs.in_checkout_dir(checkout_dir):
+                t.apply(ctx=ctx)
+
+            if gitc.has_changes_local(repo_dir=checkout_dir):
+                print(
+                    f"😍 Actions modified files - view changes in {checkout_dir}",
+                    file=out,
+                )
+            else:
+                print("⚠️  No changes after applying Actions", file=out)
+
+        finally:
+            gitc.close()
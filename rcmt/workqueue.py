@@ -0,0 +1,227 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, Optional
+
+import rcmt.log
+
+from . import config, database, source, task
+
+log = rcmt.log.get_logger(__name__)
+
+
+class DatabaseTaskWrapper(task.TaskWrapper):
+    """
+    DatabaseTaskWrapper counts the changes of a Task in the database instead of in
+    memory. This enforces the change limit of the Task across all workers that process
+    the same queue.
+
+    :param wrapper: TaskWrapper to count changes for.
+    :param db: Database that stores the queue.
+    :param item: WorkItem that the worker processes.
+    :param poll_interval: Seconds to wait while changes reserved by other workers could
+                          still use up the limit.
+    """
+
+    def __init__(
+        self,
+        wrapper: task.TaskWrapper,
+        db: database.Database,
+        item: database.WorkItem,
+        poll_interval: float,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        super().__init__(wrapper.task)
+        self.checksum = wrapper.checksum
+        self.db = db
+        self.item = item
+        self.poll_interval = poll_interval
+        self._sleep = sleep
+
+    def acquire_change(self) -> bool:
+        while True:
+            reserved = self.db.reserve_work_change(self.item)
+            if reserved is not None:
+                return reserved
+
+            self._sleep(self.poll_interval)
+
+    def has_reached_change_limit(self) -> bool:
+        return self.db.work_change_limit_reached(self.item)
+
+    def release_change(self, changed: bool) -> None:
+        self.db.release_work_change(self.item, changed)
+
+
+class Heartbeat:
+    """
+    Heartbeat extends the lease of a WorkItem in a background thread while a worker
+    processes it.
+    """
+
+    def __init__(
+        self,
+        db: database.Database,
+        item: database.WorkItem,
+        worker: str,
+        lease: timedelta,
+    ):
+        self.db = db
+        self.item = item
+        self.lease = lease
+        self.worker = worker
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="rcmt-heartbeat"
+        )
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        # Extend well before the lease expires to survive a slow database.
+        interval = self.lease.total_seconds() / 3
+        while self._stop.wait(interval) is False:
+            try:
+                if self.db.extend_lease(self.item, self.worker, self.lease) is False:
+                    log.warning(
+                        "Lease of work item expired repository=%s task=%s",
+                        self.item.repository,
+                        self.item.task,
+                    )
+                    return
+            except Exception as e:
+                log.exception("Extending lease failed", exc_info=e)
+
+
+def enqueue(
+    db: database.Database,
+    repositories: Iterator[source.Repository],
+    tasks: list[task.TaskWrapper],
+    pending: Optional[
+        Callable[[source.Repository, list[task.TaskWrapper]], list[task.TaskWrapper]]
+    ] = None,
+) -> tuple[str, int]:
+    """
+    Creates a new queue and adds a WorkItem for each repository and Task to it.
+
+    :param pending: Returns the Tasks that need to process a repository. Queues all
+                    Tasks if `None`.
+    :return: Identifier of the queue and number of repositories queued.
+    """
+    queue_id = uuid.uuid4().hex
+    db.add_work_tasks(
+        queue_id,
+        [
+            database.WorkTask(
+                change_limit=t.change_limit, checksum=t.checksum, task=t.name
+            )
+            for t in tasks
+        ],
+    )
+    count = 0
+    for repository in repositories:
+        pending_tasks = tasks if pending is None else pending(repository, tasks)
+        if len(pending_tasks) == 0:
+            continue
+
+        count += 1
+        db.add_work_items(
+            queue_id, repository.full_name, {t.name: t.checksum for t in pending_tasks}
+        )
+
+    log.info("Queued repositories queue=%s count=%d", queue_id, count)
+    return queue_id, count
+
+
+def wait(
+    db: database.Database,
+    queue_id: str,
+    cfg: config.Queue,
+    sleep: Callable[[float], None] = time.sleep,
+) -> dict[str, int]:
+    """
+    Blocks until workers have processed all WorkItems of a queue. Requeues the WorkItems
+    of workers that have stopped extending their leases in the meantime.
+
+    :return: Number of failed WorkItems, keyed by name of the Task.
+    """
+    while True:
+        expired = db.requeue_expired_work_items(cfg.max_attempts)
+        if expired > 0:
+            log.warning("Requeued work items with expired lease count=%d", expired)
+
+        open_items = db.count_work_items(
+            [database.WorkItem.STATUS_PENDING, database.WorkItem.STATUS_LEASED],
+            queue_id=queue_id,
+        )
+        if open_items == 0:
+            break
+
+        log.debug("Waiting for workers queue=%s open=%d", queue_id, open_items)
+        sleep(cfg.poll_interval)
+
+    return db.get_work_task_failures(queue_id)
+
+
+def save_failures(db: database.Database, queue_id: str) -> None:
+    """
+    Records the Tasks that have failed to process a repository of a queue. Removes
+    earlier failures of Tasks that have processed a repository successfully. The next
+    run retries failed Tasks.
+    """
+    results: dict[str, tuple[dict[str, str], list[str]]] = {}
+    for item in db.get_finished_work_items(queue_id):
+        checksums, failed = results.setdefault(str(item.repository), ({}, []))
+        if item.status == database.WorkItem.STATUS_DONE:
+            checksums[str(item.task)] = str(item.checksum)
+        else:
+            failed.append(str(item.task))
+
+    for repository, (checksums, failed) in results.items():
+        db.save_checkpoints(repository, checksums, failed=failed)
+
+
+def prune(db: database.Database, cfg: config.Queue) -> None:
+    """
+    Deletes WorkItems of previous runs that have finished more than
+    `cfg.retention_seconds` ago.
+    """
+    finished_before = datetime.now(tz=timezone.utc) - timedelta(
+        seconds=cfg.retention_seconds
+    )
+    count = db.delete_work_items(finished_before)
+    if count > 0:
+        log.debug("Deleted finished work items count=%d", count)
+
+
+def new_worker_name() -> str:
+    return f"rcmt-{uuid.uuid4().hex[:12]}"
+
+
+def lease_duration(cfg: config.Queue) -> timedelta:
+    return timedelta(seconds=cfg.lease_seconds)
+
+
+def claim(
+    db: database.Database,
+    worker: str,
+    tasks: list[task.TaskWrapper],
+    cfg: config.Queue,
+) -> Optional[database.WorkItem]:
+    db.requeue_expired_work_items(cfg.max_attempts)
+    return db.claim_work_item(
+        worker=worker,
+        lease=lease_duration(cfg),
+        checksums={t.name: t.checksum for t in tasks},
+    )
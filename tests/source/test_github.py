@@ -333,22 +333,47 @@ class GithubTest(unittest.TestCase):
         client_mock.get_repo.return_value = repo_mock
         repo_name = "github.com/wndhydrnt/rcmt"
 
-        gh = Github("access_token", "http://localhost")
+        gh = Github("access_token", "https://api.github.com")
         gh.client = client_mock
         result = gh.create_from_name(repo_name)
 
         self.assertIsInstance(result, GithubRepository)
+        self.assertEqual("github.com", result.source)
+        client_mock.get_repo.assert_called_once_with(
+            full_name_or_id="wndhydrnt/rcmt", lazy=False
+        )
+
+    def test_create_from_name__enterprise(self):
+        client_mock = unittest.mock.Mock(spec=github.Github)
+        client_mock.get_repo.return_value = unittest.mock.Mock(spec=Repository)
+
+        gh = Github("access_token", "https://github.example.com/api/v3")
+        gh.client = client_mock
+        result = gh.create_from_name("github.example.com/wndhydrnt/rcmt")
+
+        self.assertIsInstance(result, GithubRepository)
+        self.assertEqual("github.example.com", result.source)
         client_mock.get_repo.assert_called_once_with(
             full_name_or_id="wndhydrnt/rcmt", lazy=False
         )
 
+    def test_create_from_name__other_host(self):
+        client_mock = unittest.mock.Mock(spec=github.Github)
+
+        gh = Github("access_token", "https://api.github.com")
+        gh.client = client_mock
+
+        self.assertIsNone(gh.create_from_name("gitlab.com/group/project"))
+        self.assertIsNone(gh.create_from_name("gitlab.com/group/subgroup/project"))
+        client_mock.get_repo.assert_not_called()
+
     def test_create_from_name__no_repository_found(self):
         client_mock = unittest.mock.Mock(spec=github.Github)
         client_mock.get_repo.side_effect = github.UnknownObjectException(
             data=None, headers=None, status=404
         )
 
-        gh = Github("access_token", "http://localhost")
+        gh = Github("access_token", "https://api.github.com")
         gh.client = client_mock
         result = gh.create_from_name("github.com/wndhydrnt/rcmt")
 
@@ -291,6 +291,26 @@ _This pull request has been created by [rcmt](https://rcmt.readthedocs.io/)._"""
             ),
         )
 
+    def test_updated_at(self):
+        project = unittest.mock.Mock(spec=Project)
+        project.last_activity_at = "2022-08-02T16:07:26.697Z"
+
+        repo = GitlabRepository(project=project, token="", url="")
+
+        self.assertEqual(
+            datetime.datetime(
+                year=2022,
+                month=8,
+                day=2,
+                hour=16,
+                minute=7,
+                second=26,
+                microsecond=697000,
+                tzinfo=datetime.timezone.utc,
+            ),
+            repo.updated_at,
+        )
+
     def test_can_merge_pull_request(self):
         repo = GitlabRepository(
             project=unittest.mock.Mock(spec=Project), token="", url=""
@@ -378,6 +398,12 @@ _This pull request has been created by [rcmt](https://rcmt.readthedocs.io/)._"""
 
 
 class GitlabTest(unittest.TestCase):
+    def test_init__pool_size(self):
+        gl = Gitlab(url="http://localhost", private_token="private_token", pool_size=50)
+
+        adapter = gl.client.session.get_adapter("https://localhost")
+        self.assertEqual(50, adapter._pool_maxsize)  # type: ignore[attr-defined]
+
     def test_create_from_name__return_repository(self):
         project_mock = unittest.mock.Mock(spec=Project)
         projects_mock = unittest.mock.Mock(spec=ProjectManager)
@@ -444,7 +470,12 @@ class GitlabTest(unittest.TestCase):
             self.assertEqual(gl_repo.url, "localhost")
 
         projects_mock.list.assert_called_once_with(
-            archived=False, last_activity_after=now, iterator=True, min_access_level=30
+            archived=False,
+            last_activity_after=now,
+            iterator=True,
+            min_access_level=30,
+            order_by="last_activity_at",
+            sort="desc",
         )
 
     def test_list_repositories_with_open_pull_requests(self):
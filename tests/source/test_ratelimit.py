@@ -0,0 +1,226 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import unittest
+import unittest.mock
+
+import github
+import requests
+import requests.adapters
+from github.GithubRetry import GithubRetry
+from requests.structures import CaseInsensitiveDict
+
+from rcmt.source import Github, Gitlab
+from rcmt.source.ratelimit import RateLimitAdapter, RateLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(
+            name="unit-test", clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def test_acquire__quota_available(self):
+        rejected = self.limiter.update(
+            200,
+            CaseInsensitiveDict(
+                {
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Remaining": "4000",
+                    "X-RateLimit-Reset": "4600",
+                }
+            ),
+        )
+        self.limiter.acquire()
+        self.limiter.acquire()
+
+        self.assertFalse(rejected)
+        self.assertEqual([], self.clock.sleeps, "Should not wait")
+
+    def test_acquire__spread_requests(self):
+        self.limiter.update(
+            200,
+            CaseInsensitiveDict(
+                {
+                    "RateLimit-Limit": "100",
+                    "RateLimit-Remaining": "5",
+                    "RateLimit-Reset": "1010",
+                }
+            ),
+        )
+        self.limiter.acquire()
+        self.limiter.acquire()
+        self.limiter.acquire()
+
+        self.assertEqual(
+            [2.0, 2.0],
+            self.clock.sleeps,
+            "Should spread remaining requests until the quota resets",
+        )
+
+    def test_update__retry_after(self):
+        rejected = self.limiter.update(429, CaseInsensitiveDict({"Retry-After": "30"}))
+        self.limiter.acquire()
+        self.limiter.acquire()
+
+        self.assertTrue(rejected)
+        self.assertEqual([30.0], self.clock.sleeps, "Should pause once")
+
+    def test_update__quota_exhausted(self):
+        rejected = self.limiter.update(
+            403,
+            CaseInsensitiveDict(
+                {
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": "1060",
+                }
+            ),
+        )
+        self.limiter.acquire()
+
+        self.assertTrue(rejected)
+        self.assertEqual([60.0], self.clock.sleeps, "Should wait until reset")
+
+    def test_update__no_timing_headers(self):
+        for _ in range(8):
+            self.assertTrue(self.limiter.update(429, CaseInsensitiveDict()))
+            self.limiter.acquire()
+
+        self.assertEqual(
+            [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0],
+            self.clock.sleeps,
+            "Should back off exponentially",
+        )
+
+        self.limiter.update(200, CaseInsensitiveDict())
+        self.limiter.update(429, CaseInsensitiveDict())
+        self.limiter.acquire()
+
+        self.assertEqual(1.0, self.clock.sleeps[-1], "Should reset the backoff")
+
+    def test_update__forbidden(self):
+        rejected = self.limiter.update(
+            403, CaseInsensitiveDict({"X-RateLimit-Remaining": "10"})
+        )
+
+        self.assertFalse(rejected, "Should not retry other errors")
+
+
+class RateLimitAdapterTest(unittest.TestCase):
+    @unittest.mock.patch.object(requests.adapters.HTTPAdapter, "send")
+    def test_send__retry(self, send_mock: unittest.mock.MagicMock):
+        rejected = requests.Response()
+        rejected.raw = unittest.mock.Mock()
+        rejected.status_code = 429
+        rejected.headers = CaseInsensitiveDict({"Retry-After": "5"})
+        ok = requests.Response()
+        ok.status_code = 200
+        send_mock.side_effect = [rejected, ok]
+        clock = FakeClock()
+        adapter = RateLimitAdapter(
+            limiter=RateLimiter(name="unit-test", clock=clock, sleep=clock.sleep)
+        )
+
+        response = adapter.send(unittest.mock.Mock(spec=requests.PreparedRequest))
+
+        self.assertEqual(ok, response)
+        self.assertEqual(2, send_mock.call_count)
+        self.assertEqual([5.0], clock.sleeps)
+
+    @unittest.mock.patch.object(requests.adapters.HTTPAdapter, "send")
+    def test_send__retry_rejected_disabled(self, send_mock: unittest.mock.MagicMock):
+        rejected = requests.Response()
+        rejected.status_code = 429
+        rejected.headers = CaseInsensitiveDict({"Retry-After": "5"})
+        send_mock.return_value = rejected
+        clock = FakeClock()
+        adapter = RateLimitAdapter(
+            limiter=RateLimiter(name="unit-test", clock=clock, sleep=clock.sleep),
+            retry_rejected=False,
+        )
+
+        response = adapter.send(unittest.mock.Mock(spec=requests.PreparedRequest))
+
+        self.assertEqual(rejected, response)
+        self.assertEqual(1, send_mock.call_count)
+
+    @unittest.mock.patch.object(requests.adapters.HTTPAdapter, "send")
+    def test_send__give_up(self, send_mock: unittest.mock.MagicMock):
+        rejected = requests.Response()
+        rejected.raw = unittest.mock.Mock()
+        rejected.status_code = 429
+        send_mock.return_value = rejected
+        clock = FakeClock()
+        adapter = RateLimitAdapter(
+            limiter=RateLimiter(
+                name="unit-test", max_retries=2, clock=clock, sleep=clock.sleep
+            )
+        )
+
+        response = adapter.send(unittest.mock.Mock(spec=requests.PreparedRequest))
+
+        self.assertEqual(rejected, response)
+        self.assertEqual(3, send_mock.call_count)
+        self.assertEqual([1.0, 2.0], clock.sleeps, "Should back off before each retry")
+
+
+class SourceTest(unittest.TestCase):
+    def test_github(self):
+        limiter = RateLimiter(name="github")
+        gh = Github("access_token", "https://github.test", rate_limiter=limiter)
+        other = github.Github(base_url="https://github.test")
+
+        connection = gh.client.requester._Requester__connectionClass(  # type: ignore[attr-defined]
+            "github.test", 443, retry=GithubRetry(total=5)
+        )
+        other_connection = other.requester._Requester__connectionClass(  # type: ignore[attr-defined]
+            "github.test", 443
+        )
+
+        adapter = connection.session.get_adapter("https://github.test")
+        self.assertIsInstance(adapter, RateLimitAdapter)
+        self.assertEqual(limiter, adapter.limiter)
+        self.assertTrue(adapter.retry_rejected)
+        self.assertNotIsInstance(
+            adapter.max_retries,
+            GithubRetry,
+            "Should not retry responses rejected by the rate limit twice",
+        )
+        self.assertEqual(5, adapter.max_retries.total)
+        self.assertNotIsInstance(
+            other_connection.session.get_adapter("https://github.test"),
+            RateLimitAdapter,
+            "Should not change other clients",
+        )
+
+    def test_gitlab(self):
+        limiter = RateLimiter(name="gitlab")
+        gl = Gitlab(
+            url="https://gitlab.test",
+            private_token="private_token",
+            pool_size=20,
+            rate_limiter=limiter,
+        )
+
+        adapter = gl.client.session.get_adapter("https://gitlab.test")
+        self.assertIsInstance(adapter, RateLimitAdapter)
+        self.assertFalse(
+            adapter.retry_rejected, "Should leave retries to python-gitlab"
+        )
+        self.assertEqual(20, adapter._pool_maxsize)  # type: ignore[attr-defined]
@@ -45,6 +45,66 @@ class AbsentTest(unittest.TestCase):
             self.assertFalse(os.path.isdir(to_delete_path))
 
 
+class CheckoutDirTest(unittest.TestCase):
+    def test_actions__do_not_change_working_directory(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d:
+            ctx = context.Context(
+                repo=unittest.mock.Mock(spec=source.Repository), checkout_dir=d
+            )
+            with open(os.path.join(d, "test.txt"), "w+") as test_file:
+                test_file.write("abc\n")
+
+            with fs.use_checkout_dir(d):
+                own(ctx=ctx, content="owned", target="sub/owned.txt")
+                line_in_file(line="foobar", target="test.txt")
+                replace_in_line(ctx=ctx, search="abc", replace="xyz", target="*.txt")
+                absent("sub")
+
+            self.assertEqual(cwd, os.getcwd())
+            self.assertFalse(os.path.exists(os.path.join(cwd, "sub")))
+            self.assertFalse(os.path.exists(os.path.join(d, "sub")))
+            with open(os.path.join(d, "test.txt")) as test_file:
+                self.assertEqual("xyz\nfoobar\n", test_file.read())
+
+
+class ChangedPathsTest(unittest.TestCase):
+    def test_actions__record_changed_paths(self):
+        with tempfile.TemporaryDirectory() as d:
+            ctx = context.Context(
+                repo=unittest.mock.Mock(spec=source.Repository), checkout_dir=d
+            )
+            with open(os.path.join(d, "test.txt"), "w+") as test_file:
+                test_file.write("abc\n")
+
+            with context.use_context(ctx), fs.use_checkout_dir(d):
+                own(ctx=ctx, content="owned", target="sub/owned.txt")
+                seed(ctx=ctx, content="seeded", target="test.txt")
+                line_in_file(line="foobar", target="test.txt")
+                delete_line_in_file(search="nothing", target="test.txt")
+                absent("missing")
+                absent("sub/owned.txt")
+
+            self.assertSetEqual({"sub/owned.txt", "test.txt"}, ctx.changed_paths)
+
+    @mock.patch("subprocess.run")
+    def test_exec__unknown_changes(self, subprocess_run: mock.MagicMock):
+        subprocess_run.return_value = mock.Mock(returncode=0)
+        with tempfile.TemporaryDirectory() as d:
+            ctx = context.Context(
+                repo=unittest.mock.Mock(spec=source.Repository), checkout_dir=d
+            )
+            with context.use_context(ctx), fs.use_checkout_dir(d):
+                own(ctx=ctx, content="owned", target="owned.txt")
+                exec(executable="/tmp/foo")
+                own(ctx=ctx, content="owned", target="other.txt")
+
+            self.assertIsNone(
+                ctx.changed_paths,
+                "Should require a scan of the whole checkout after exec",
+            )
+
+
 class ExecTest(unittest.TestCase):
     @mock.patch("subprocess.run")
     def test_exec(self, subprocess_run: mock.MagicMock):
@@ -75,6 +135,15 @@ class ExecTest(unittest.TestCase):
                 timeout=120,
             )
 
+    @mock.patch("subprocess.run")
+    def test_exec__use_checkout_dir(self, subprocess_run: mock.MagicMock):
+        subprocess_run.return_value = mock.Mock(returncode=0)
+        with tempfile.TemporaryDirectory() as d:
+            with fs.use_checkout_dir(d):
+                exec(executable="/tmp/foo")
+
+            self.assertEqual(os.path.abspath(d), subprocess_run.call_args.kwargs["cwd"])
+
 
 class LineInFileTest(unittest.TestCase):
     def test_apply_line_does_not_exist(self):
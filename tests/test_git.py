@@ -0,0 +1,638 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import fcntl
+import multiprocessing
+import os.path
+import subprocess
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from typing import Any, Optional
+
+from git.exc import GitCommandError
+
+from rcmt import git, source
+
+
+def new_git() -> git.Git:
+    return git.Git(
+        branch_name="rcmt/unit-test",
+        clone_opts={},
+        data_dir="/tmp",
+        user_name="rcmt",
+        user_email="rcmt@example.com",
+    )
+
+
+class HasConflictTest(unittest.TestCase):
+    def test_has_conflict(self):
+        git_repo = unittest.mock.MagicMock()
+        git_repo.git.merge_tree.side_effect = [
+            "abc123",
+            GitCommandError("merge-tree", 1),
+        ]
+        g = new_git()
+
+        self.assertFalse(g.has_conflict(git_repo, "origin/main"))
+        self.assertTrue(g.has_conflict(git_repo, "origin/main"))
+        git_repo.git.merge_tree.assert_called_with(
+            "origin/main", "rcmt/unit-test", write_tree=True
+        )
+        git_repo.git.merge.assert_not_called()
+
+    def test_has_conflict__old_git(self):
+        git_repo = unittest.mock.MagicMock()
+        git_repo.git.merge_tree.side_effect = GitCommandError("merge-tree", 129)
+        git_repo.git.merge.side_effect = [GitCommandError("merge", 1), ""]
+        g = new_git()
+
+        self.assertTrue(
+            g.has_conflict(git_repo, "origin/main"),
+            "Should merge in the work tree if git does not support --write-tree",
+        )
+        git_repo.git.checkout.assert_called_once_with("origin/main", detach=True)
+        git_repo.git.merge.assert_has_calls(
+            [
+                unittest.mock.call("rcmt/unit-test", no_ff=True, no_commit=True),
+                unittest.mock.call(abort=True),
+            ]
+        )
+
+
+class ParsePushPorcelainTest(unittest.TestCase):
+    def test_parse_push_porcelain(self):
+        output = """To https://github.com/wndhydrnt/rcmt-test.git
++\trefs/heads/rcmt/one:refs/heads/rcmt/one\t39b5e92...ee10bd3 (forced update)
+*\trefs/heads/rcmt/two:refs/heads/rcmt/two\t[new branch]
+=\trefs/heads/rcmt/three:refs/heads/rcmt/three\t[up to date]
+Done"""
+
+        results = git.parse_push_porcelain(output)
+
+        self.assertCountEqual(["rcmt/one", "rcmt/two", "rcmt/three"], results.keys())
+        self.assertTrue(all(r.pushed for r in results.values()))
+        self.assertEqual("[new branch]", results["rcmt/two"].summary)
+
+    def test_parse_push_porcelain__rejected(self):
+        output = """To https://github.com/wndhydrnt/rcmt-test.git
+!\trefs/heads/rcmt/one:refs/heads/rcmt/one\t[rejected] (atomic push failed)
+!\trefs/heads/rcmt/two:refs/heads/rcmt/two\t[rejected] (stale info)
+Done"""
+
+        results = git.parse_push_porcelain(output)
+
+        self.assertFalse(results["rcmt/one"].pushed)
+        self.assertFalse(
+            results["rcmt/one"].rejected,
+            "Should not mark a branch as rejected if another branch caused the failure",
+        )
+        self.assertFalse(results["rcmt/two"].pushed)
+        self.assertTrue(results["rcmt/two"].rejected)
+
+
+class CommitChangesTest(unittest.TestCase):
+    def test_commit_changes__targets(self):
+        git_repo = unittest.mock.MagicMock()
+        git_repo.working_dir = "/tmp"
+        g = new_git()
+        g.repo = git_repo
+
+        g.commit_changes("/tmp", "Applied actions", targets={"b.txt", "a*.txt"})
+
+        git_repo.git.add.assert_called_once_with(
+            "--", ":(literal)a*.txt", ":(literal)b.txt", all=True
+        )
+        git_repo.git.commit.assert_called_once_with(message="Applied actions")
+
+
+class HasChangesOriginTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.git_repo = unittest.mock.MagicMock()
+        self.git_repo.working_dir = "/tmp"
+        self.g = new_git()
+        self.g.repo = self.git_repo
+
+    def test_has_changes_origin(self):
+        self.git_repo.git.rev_parse.side_effect = ["abc\nabc\n--", "abc\ndef\n--"]
+
+        self.assertFalse(self.g.has_changes_origin("main", "/tmp"))
+        self.assertTrue(self.g.has_changes_origin("main", "/tmp"))
+        self.git_repo.git.rev_parse.assert_called_with(
+            "HEAD^{tree}", "origin/main^{tree}", "--"
+        )
+
+    def test_has_changes_origin__no_remote_branch(self):
+        self.git_repo.git.rev_parse.side_effect = GitCommandError(
+            "rev-parse", 128, "fatal: bad revision 'origin/rcmt/unit-test^{tree}'"
+        )
+
+        self.assertTrue(self.g.has_changes_origin("rcmt/unit-test", "/tmp"))
+
+
+class PushTest(unittest.TestCase):
+    def test_push__rejected(self):
+        g = new_git()
+        g.checkout = unittest.mock.Mock(spec=git.Checkout)
+        g.checkout.push.return_value = {
+            "rcmt/unit-test": git.PushResult(
+                branch="rcmt/unit-test",
+                pushed=False,
+                rejected=True,
+                summary="[rejected] (stale info)",
+            )
+        }
+
+        with self.assertRaises(RuntimeError) as e:
+            g.push("/tmp")
+
+        g.checkout.push.assert_called_once_with(["rcmt/unit-test"])
+        self.assertEqual(
+            "Pushing branch rcmt/unit-test failed: [rejected] (stale info)",
+            str(e.exception),
+        )
+
+
+class StatusTest(unittest.TestCase):
+    def test_status(self):
+        cmd = unittest.mock.Mock()
+        cmd.status.return_value = "\0".join(
+            [
+                "1 .M N... 100644 100644 100644 3b18e51 3b18e51 README.md",
+                "1 A. N... 000000 100644 100644 0000000 e69de29 docs/new file.md",
+                "2 R. N... 100644 100644 100644 e69de29 e69de29 R100 src/new.py",
+                "src/old.py",
+                "u UU N... 100644 100644 100644 100644 1a2b3c4 5d6e7f8 9a8b7c6 setup.cfg",
+                "? untracked.txt",
+                "",
+            ]
+        )
+
+        paths = git.status(cmd)
+
+        self.assertSetEqual(
+            {
+                "README.md",
+                "docs/new file.md",
+                "src/new.py",
+                "src/old.py",
+                "setup.cfg",
+                "untracked.txt",
+            },
+            paths,
+        )
+        cmd.status.assert_called_once_with(
+            porcelain="v2", z=True, untracked_files="all"
+        )
+
+    def test_status__targets(self):
+        cmd = unittest.mock.Mock()
+        cmd.status.return_value = "? docs/new.md\0"
+
+        self.assertSetEqual({"docs/new.md"}, git.status(cmd, {"docs"}))
+        cmd.status.assert_called_once_with(
+            "--", ":(literal)docs", porcelain="v2", z=True, untracked_files="all"
+        )
+
+        cmd.reset_mock()
+        self.assertSetEqual(set(), git.status(cmd, set()))
+        cmd.status.assert_not_called()
+
+
+def run_git(
+    *args: str, cwd: Optional[str] = None, email: str = "other@example.com"
+) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=other", "-c", f"user.email={email}", *args],
+        capture_output=True,
+        check=True,
+        cwd=cwd,
+        text=True,
+    ).stdout.strip()
+
+
+class Remote:
+    """
+    Remote is a bare repository that a test clones via a `file://` URL. Commits to the
+    remote through a separate clone.
+    """
+
+    def __init__(self, root: str):
+        self.bare_dir = os.path.join(root, "remote.git")
+        self.work_dir = os.path.join(root, "work")
+        run_git("init", "--quiet", "--bare", "--initial-branch=main", self.bare_dir)
+        run_git("clone", "--quiet", self.bare_dir, self.work_dir)
+        run_git("checkout", "--quiet", "-b", "main", cwd=self.work_dir)
+
+    def commit(
+        self, branch: str, files: dict[str, str], email: str = "other@example.com"
+    ) -> str:
+        """
+        Commits `files` to `branch` and pushes the branch.
+
+        :param email: E-mail of the author of the commit.
+
+        :return: The new commit.
+        """
+        run_git("fetch", "--quiet", "origin", cwd=self.work_dir)
+        if branch in run_git("ls-remote", "--heads", "origin", cwd=self.work_dir):
+            run_git(
+                "checkout",
+                "--quiet",
+                "-B",
+                branch,
+                f"origin/{branch}",
+                cwd=self.work_dir,
+            )
+        else:
+            run_git("checkout", "--quiet", "-B", branch, cwd=self.work_dir)
+
+        for path, content in files.items():
+            file_path = os.path.join(self.work_dir, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as f:
+                f.write(content)
+
+        run_git("add", "--all", cwd=self.work_dir)
+        run_git(
+            "commit",
+            "--quiet",
+            "--message",
+            "Remote change",
+            cwd=self.work_dir,
+            email=email,
+        )
+        run_git("push", "--quiet", "origin", branch, cwd=self.work_dir)
+        return run_git("rev-parse", "HEAD", cwd=self.work_dir)
+
+    def delete_branch(self, branch: str) -> None:
+        run_git("push", "--quiet", "origin", "--delete", branch, cwd=self.work_dir)
+
+    def head(self, branch: str) -> str:
+        return run_git("rev-parse", f"refs/heads/{branch}", cwd=self.bare_dir)
+
+    def show(self, branch: str, path: str) -> str:
+        return run_git("show", f"refs/heads/{branch}:{path}", cwd=self.bare_dir)
+
+    def repository(self) -> source.Repository:
+        repo = unittest.mock.Mock(spec=source.Repository)
+        repo.base_branch = "main"
+        repo.clone_url = f"file://{self.bare_dir}"
+        repo.name = "repo"
+        repo.project = "project"
+        repo.source = "local"
+        return repo
+
+
+class RemoteTestCase(unittest.TestCase):
+    """
+    RemoteTestCase runs git against a local remote instead of mocks.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.data_dir = os.path.join(tmp_dir.name, "data")
+        self.remote = Remote(tmp_dir.name)
+        self.remote.commit("main", {"README.md": "Hello\n"})
+        self.repo = self.remote.repository()
+
+    def new_git(
+        self,
+        branch_name: str = "rcmt/unit-test",
+        checkout: Optional[git.Checkout] = None,
+        paths: Optional[list[str]] = None,
+    ) -> git.Git:
+        g = git.Git(
+            branch_name=branch_name,
+            clone_opts={},
+            data_dir=self.data_dir,
+            user_name="rcmt",
+            user_email="rcmt@example.com",
+            checkout=checkout,
+            paths=paths,
+        )
+        self.addCleanup(g.close)
+        return g
+
+
+class OpenTest(RemoteTestCase):
+    def test_open__reuses_handle(self):
+        g = self.new_git()
+        with unittest.mock.patch.object(
+            git.git, "Repo", wraps=git.git.Repo
+        ) as repo_class:
+            checkout_dir, _ = g.prepare(repo=self.repo, force_rebase=False)
+            handle = g.repo
+            with open(os.path.join(checkout_dir, "README.md"), "w") as f:
+                f.write("Changed\n")
+
+            self.assertTrue(g.has_changes_local(checkout_dir))
+            g.commit_changes(checkout_dir, "Applied actions")
+            self.assertTrue(g.has_changes_origin(g.branch_name, checkout_dir))
+            g.head_sha(checkout_dir)
+
+        repo_class.assert_called_once_with(path=checkout_dir)
+        self.assertIs(handle, g.open(checkout_dir))
+
+    def test_close(self):
+        g = self.new_git()
+        g.prepare(repo=self.repo, force_rebase=False)
+
+        g.close()
+
+        self.assertIsNone(g.repo)
+        self.assertIsNone(g.checkout.mirror)
+
+
+class ListRefsTest(RemoteTestCase):
+    def test_list_refs(self):
+        base = self.remote.head("main")
+        branch = self.remote.commit(
+            "rcmt/unit-test", {"README.md": "Changed\n"}, email="rcmt@example.com"
+        )
+        g = self.new_git()
+        checkout_dir, _ = g.prepare(repo=self.repo, force_rebase=False)
+
+        refs = git.list_refs(g.open(checkout_dir).git)
+
+        self.assertDictEqual(
+            {
+                "refs/heads/main": base,
+                # prepare() resets the branch of the Task to the base branch.
+                "refs/heads/rcmt/unit-test": base,
+                "refs/remotes/origin/main": base,
+                "refs/remotes/origin/rcmt/unit-test": branch,
+            },
+            refs,
+        )
+
+    def test_prepare__lists_refs_once(self):
+        self.remote.commit(
+            "rcmt/unit-test", {"README.md": "Changed\n"}, email="rcmt@example.com"
+        )
+        g = self.new_git()
+        commands: list[str] = []
+        execute = git.git.cmd.Git.execute
+
+        def record(cmd, command, *args, **kwargs):
+            commands.append(command[1])
+            return execute(cmd, command, *args, **kwargs)
+
+        with unittest.mock.patch.object(
+            git.git.cmd.Git, "execute", autospec=True, side_effect=record
+        ):
+            g.prepare(repo=self.repo, force_rebase=False)
+
+        self.assertEqual(1, commands.count("for-each-ref"))
+        self.assertNotIn("show-ref", commands)
+
+
+class SparseCheckoutTest(RemoteTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.remote.commit(
+            "main",
+            {
+                "deploy/app.yaml": "app\n",
+                "docs/index.md": "Docs\n",
+                "src/main.py": "print()\n",
+            },
+        )
+
+    def test_prepare__paths(self):
+        checkout = git.Checkout(["rcmt/docs", "rcmt/all"])
+        docs = self.new_git("rcmt/docs", checkout=checkout, paths=["docs"])
+        docs_dir, _ = docs.prepare(repo=self.repo, force_rebase=False)
+        all_files = self.new_git("rcmt/all", checkout=checkout)
+        all_dir, _ = all_files.prepare(repo=self.repo, force_rebase=False)
+
+        self.assertTrue(os.path.isfile(os.path.join(docs_dir, "README.md")))
+        self.assertTrue(os.path.isfile(os.path.join(docs_dir, "docs", "index.md")))
+        self.assertFalse(os.path.exists(os.path.join(docs_dir, "deploy")))
+        self.assertFalse(os.path.exists(os.path.join(docs_dir, "src")))
+        for path in ["README.md", "deploy/app.yaml", "docs/index.md", "src/main.py"]:
+            self.assertTrue(os.path.isfile(os.path.join(all_dir, path)), path)
+
+        # git stores the sparse checkout in the configuration of each work tree.
+        self.assertEqual("true", run_git("config", "core.sparseCheckout", cwd=docs_dir))
+        self.assertEqual("true", run_git("config", "index.sparse", cwd=docs_dir))
+        self.assertEqual(["docs"], git.sparse_checkout_paths(docs.open(docs_dir)))
+        self.assertIsNone(git.sparse_checkout_paths(all_files.open(all_dir)))
+        mirror_dir = docs.mirror_dir(self.repo)
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_git("config", "--file", "config", "core.sparseCheckout", cwd=mirror_dir)
+
+    def test_prepare__paths_removed(self):
+        with_paths = self.new_git(paths=["docs"])
+        checkout_dir, _ = with_paths.prepare(repo=self.repo, force_rebase=False)
+        with_paths.close()
+        self.assertFalse(os.path.exists(os.path.join(checkout_dir, "src")))
+
+        without_paths = self.new_git()
+        checkout_dir, _ = without_paths.prepare(repo=self.repo, force_rebase=False)
+
+        for path in ["README.md", "deploy/app.yaml", "docs/index.md", "src/main.py"]:
+            self.assertTrue(os.path.isfile(os.path.join(checkout_dir, path)), path)
+
+        self.assertIsNone(git.sparse_checkout_paths(without_paths.open(checkout_dir)))
+
+    def test_commit_changes__paths(self):
+        g = self.new_git(paths=["docs"])
+        checkout_dir, _ = g.prepare(repo=self.repo, force_rebase=False)
+        with open(os.path.join(checkout_dir, "docs", "index.md"), "w") as f:
+            f.write("Changed\n")
+
+        g.commit_changes(checkout_dir, "Applied actions")
+        g.push(checkout_dir)
+
+        self.assertEqual("Changed", self.remote.show("rcmt/unit-test", "docs/index.md"))
+        self.assertEqual("print()", self.remote.show("rcmt/unit-test", "src/main.py"))
+
+
+class CheckoutDirTest(unittest.TestCase):
+    def test_checkout_dir(self):
+        repo = unittest.mock.Mock(spec=source.Repository)
+        repo.name = "rcmt"
+        repo.project = "wndhydrnt"
+        repo.source = "github.com"
+        dirs = set()
+        for branch in ["rcmt/foo", "rcmt-foo", "rcmt/foo/bar", "rcmt/foo-bar"]:
+            g = new_git()
+            g.branch_name = branch
+            checkout_dir = g.checkout_dir(repo)
+            self.assertEqual(
+                "/tmp/worktrees/github.com/wndhydrnt/rcmt",
+                os.path.dirname(checkout_dir),
+            )
+            dirs.add(checkout_dir)
+
+        self.assertEqual(4, len(dirs))
+
+
+class PrepareTest(RemoteTestCase):
+    def run_task(
+        self,
+        files: dict[str, str],
+        branch_name: str = "rcmt/unit-test",
+        checkout: Optional[git.Checkout] = None,
+        paths: Optional[list[str]] = None,
+        force_rebase: bool = False,
+    ) -> bool:
+        """
+        Prepares the work tree, writes `files` and pushes the changes like a run of
+        rcmt does.
+
+        :return: `True` if the branch has been pushed.
+        """
+        g = self.new_git(branch_name, checkout=checkout, paths=paths)
+        checkout_dir, _ = g.prepare(repo=self.repo, force_rebase=force_rebase)
+        for path, content in files.items():
+            with open(os.path.join(checkout_dir, path), "w") as f:
+                f.write(content)
+
+        if len(g.local_changes(checkout_dir)) == 0:
+            return False
+
+        g.commit_changes(checkout_dir, "Applied actions")
+        if g.has_changes_origin(branch_name, checkout_dir) is False:
+            return False
+
+        g.push(checkout_dir)
+        return True
+
+    def test_prepare__first_push(self):
+        self.assertTrue(self.run_task({"task.txt": "one\n"}))
+
+        self.assertEqual("one", self.remote.show("rcmt/unit-test", "task.txt"))
+        self.assertEqual(
+            self.remote.head("main"),
+            run_git("rev-parse", "rcmt/unit-test^", cwd=self.remote.bare_dir),
+        )
+
+    def test_prepare__no_diff(self):
+        self.run_task({"task.txt": "one\n"})
+        head = self.remote.head("rcmt/unit-test")
+
+        self.assertFalse(self.run_task({"task.txt": "one\n"}))
+
+        self.assertEqual(head, self.remote.head("rcmt/unit-test"))
+
+    def test_prepare__base_branch_advanced(self):
+        self.run_task({"task.txt": "one\n"})
+        base = self.remote.commit("main", {"base.txt": "base\n"})
+
+        self.assertTrue(self.run_task({"task.txt": "one\n"}))
+
+        self.assertEqual(
+            base, run_git("rev-parse", "rcmt/unit-test^", cwd=self.remote.bare_dir)
+        )
+        self.assertEqual("base", self.remote.show("rcmt/unit-test", "base.txt"))
+        self.assertEqual("one", self.remote.show("rcmt/unit-test", "task.txt"))
+
+    def test_prepare__remote_branch_deleted(self):
+        self.run_task({"task.txt": "one\n"})
+        self.remote.delete_branch("rcmt/unit-test")
+
+        self.assertTrue(self.run_task({"task.txt": "one\n"}))
+
+        self.assertEqual("one", self.remote.show("rcmt/unit-test", "task.txt"))
+
+    def test_prepare__foreign_commit(self):
+        self.run_task({"task.txt": "one\n"})
+        foreign = self.remote.commit("rcmt/unit-test", {"other.txt": "other\n"})
+
+        with self.assertRaises(git.BranchModifiedError) as e:
+            self.run_task({"task.txt": "one\n"})
+
+        self.assertEqual([foreign], e.exception.checksums)
+        self.assertEqual(foreign, self.remote.head("rcmt/unit-test"))
+
+        self.assertTrue(self.run_task({"task.txt": "one\n"}, force_rebase=True))
+        self.assertNotEqual(foreign, self.remote.head("rcmt/unit-test"))
+
+    def test_prepare__concurrent_tasks(self):
+        self.remote.commit(
+            "main", {"docs/index.md": "Docs\n", "src/main.py": "print()\n"}
+        )
+        checkout = git.Checkout(["rcmt/docs", "rcmt/src"])
+        tasks = [
+            ("rcmt/docs", {"docs/index.md": "Changed docs\n"}, ["docs"]),
+            ("rcmt/src", {"src/main.py": "print('changed')\n"}, ["src"]),
+        ]
+        results: dict[str, bool] = {}
+
+        def run(branch_name: str, files: dict[str, str], paths: list[str]) -> None:
+            results[branch_name] = self.run_task(
+                files, branch_name=branch_name, checkout=checkout, paths=paths
+            )
+
+        threads = [threading.Thread(target=run, args=task) for task in tasks]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        self.assertDictEqual({"rcmt/docs": True, "rcmt/src": True}, results)
+        self.assertEqual("Changed docs", self.remote.show("rcmt/docs", "docs/index.md"))
+        self.assertEqual("print()", self.remote.show("rcmt/docs", "src/main.py"))
+        self.assertEqual("Docs", self.remote.show("rcmt/src", "docs/index.md"))
+        self.assertEqual(
+            "print('changed')", self.remote.show("rcmt/src", "src/main.py")
+        )
+
+
+def prepare_in_process(
+    data_dir: str, branch_name: str, repo: source.Repository, start: Any
+) -> None:
+    start.wait()
+    g = git.Git(
+        branch_name=branch_name,
+        clone_opts={},
+        data_dir=data_dir,
+        user_name="rcmt",
+        user_email="rcmt@example.com",
+    )
+    try:
+        g.prepare(repo=repo, force_rebase=False)
+    finally:
+        g.close()
+
+
+class FileLockTest(RemoteTestCase):
+    def test_file_lock(self):
+        path = os.path.join(self.data_dir, "unit-test.lock")
+        with git.file_lock(path):
+            with open(path) as f:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with open(path) as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_prepare__processes_share_data_dir(self):
+        mp = multiprocessing.get_context("fork")
+        start = mp.Event()
+        children = [
+            mp.Process(
+                target=prepare_in_process,
+                args=(self.data_dir, f"rcmt/task-{i}", self.repo, start),
+            )
+            for i in range(4)
+        ]
+        for child in children:
+            child.start()
+
+        start.set()
+        for child in children:
+            child.join(30)
+
+        self.assertListEqual([0, 0, 0, 0], [child.exitcode for child in children])
+        for i in range(4):
+            g = self.new_git(f"rcmt/task-{i}")
+            self.assertTrue(
+                os.path.isfile(os.path.join(g.checkout_dir(self.repo), "README.md"))
+            )
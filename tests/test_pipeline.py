@@ -0,0 +1,103 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import threading
+import unittest
+from typing import Iterator
+
+from rcmt.pipeline import Pipeline, Stage
+
+
+class PipelineTest(unittest.TestCase):
+    def test_run(self):
+        results: list[int] = []
+        lock = threading.Lock()
+
+        def collect(item: int) -> None:
+            with lock:
+                results.append(item)
+
+        p = Pipeline(
+            stages=[
+                Stage("double", lambda item: item * 2, workers=3),
+                Stage("drop-odd", lambda item: item if item % 4 == 0 else None),
+                Stage("collect", collect, workers=2),
+            ],
+            queue_size=2,
+        )
+
+        count = p.run(range(10))
+
+        self.assertEqual(10, count)
+        self.assertCountEqual([0, 4, 8, 12, 16], results)
+
+    def test_run__stage_raises_exception(self):
+        results: list[int] = []
+
+        def fail(item: int) -> int:
+            if item == 1:
+                raise RuntimeError("unit test")
+
+            return item
+
+        p = Pipeline(stages=[Stage("fail", fail), Stage("collect", results.append)])
+
+        count = p.run(range(3))
+
+        self.assertEqual(3, count)
+        self.assertEqual([0, 2], results)
+
+    def test_run__on_error(self):
+        failed: list[tuple[int, str]] = []
+
+        def fail(item: int) -> None:
+            raise RuntimeError(f"unit test {item}")
+
+        p = Pipeline(
+            stages=[
+                Stage(
+                    "fail",
+                    fail,
+                    on_error=lambda item, e: failed.append((item, str(e))),
+                )
+            ]
+        )
+
+        p.run(range(2))
+
+        self.assertEqual([(0, "unit test 0"), (1, "unit test 1")], failed)
+
+    def test_run__backpressure(self):
+        read = 0
+        release = threading.Event()
+
+        def items() -> Iterator[int]:
+            nonlocal read
+            for i in range(100):
+                read += 1
+                yield i
+
+        def block(item: int) -> None:
+            release.wait()
+
+        p = Pipeline(
+            stages=[Stage("pass", lambda item: item), Stage("block", block)],
+            queue_size=1,
+        )
+        t = threading.Thread(target=p.run, args=(items(),))
+        t.start()
+        try:
+            # Wait until the pipeline is full.
+            for _ in range(50):
+                if release.wait(0.01):
+                    break
+
+            # 1 in each queue, 1 in each worker, 1 waiting to be put into the
+            # first queue.
+            self.assertLessEqual(read, 5)
+        finally:
+            release.set()
+            t.join()
+
+        self.assertEqual(100, read)
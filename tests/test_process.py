@@ -0,0 +1,88 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import os
+import tempfile
+import time
+import unittest
+
+import git
+
+from rcmt import Context, Task
+from rcmt.action import own
+from rcmt.process import ApplyPool
+from rcmt.unittest import Repository
+
+
+class OwnTask(Task):
+    name = "own"
+
+    def apply(self, ctx: Context) -> None:
+        own(ctx=ctx, content="changed", target="existing.txt")
+        own(ctx=ctx, content="new", target="dir/new.txt")
+        ctx.set_template_key("applied", True)
+
+
+class ExceptionTask(Task):
+    name = "exception"
+
+    def apply(self, ctx: Context) -> None:
+        raise KeyError("unit-test")
+
+
+class SleepTask(Task):
+    name = "sleep"
+
+    def apply(self, ctx: Context) -> None:
+        time.sleep(30)
+
+
+class ApplyPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        repo = git.Repo.init(self.dir.name)
+        with repo.config_writer() as cw:
+            cw.set_value("user", "email", "unit-test@localhost")
+            cw.set_value("user", "name", "unit-test")
+
+        with open(os.path.join(self.dir.name, "existing.txt"), "w+") as f:
+            f.write("existing")
+
+        repo.git.add(all=True)
+        repo.index.commit("init")
+        self.ctx = Context(
+            repo=Repository("github.com/wndhydrnt/rcmt"), checkout_dir=self.dir.name
+        )
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_apply(self):
+        pool = ApplyPool(timeout=30)
+
+        result = pool.apply(task=OwnTask(), ctx=self.ctx)
+
+        self.assertSetEqual({"existing.txt", "dir/new.txt"}, result)
+        self.assertTrue(
+            self.ctx.template_data["applied"],
+            "Should copy template data modified in the child process",
+        )
+
+    def test_apply__exception(self):
+        pool = ApplyPool(timeout=30)
+
+        with self.assertRaises(RuntimeError) as e:
+            pool.apply(task=ExceptionTask(), ctx=self.ctx)
+
+        self.assertIn("KeyError: 'unit-test'", str(e.exception))
+
+    def test_apply__timeout(self):
+        pool = ApplyPool(timeout=1)
+
+        with self.assertRaises(RuntimeError) as e:
+            pool.apply(task=SleepTask(), ctx=self.ctx)
+
+        self.assertEqual(
+            "Applying task did not finish within 1 seconds", str(e.exception)
+        )
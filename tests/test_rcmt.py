@@ -3,37 +3,59 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 import datetime
+import os
+import signal
+import threading
 import unittest
 import unittest.mock
-from typing import Any, Union
+from typing import Any, Iterator, Optional, Union
 from unittest.mock import call
 
 from git.exc import GitCommandError
 from sqlalchemy import select
 
-from rcmt import config, context, database, git, source
-from rcmt.config import Config
+from rcmt import config, context, database, git, metric, process, source
+from rcmt.config import Apply, Config
 from rcmt.config import Database as DatabaseConfig
 from rcmt.database import Database, Execution, Run
 from rcmt.git import BranchModifiedError
 from rcmt.rcmt import (
     TEMPLATE_BRANCH_MODIFIED,
+    ChangeWindow,
+    Deadline,
     Options,
+    PipelineRun,
     RepoRun,
     RunResult,
+    RunState,
+    Shard,
+    Snapshots,
+    Watermarks,
     execute,
     execute_task,
+    list_repositories,
+    new_checkout,
+    new_git,
+    until_change_limits_reached,
 )
 from rcmt.source import Base
 from rcmt.task import Task, TaskWrapper, registry
 
 
 class RepositoryMock(source.Repository):
-    def __init__(self, name: str, project: str, src: str, has_file=True):
+    def __init__(
+        self,
+        name: str,
+        project: str,
+        src: str,
+        has_file=True,
+        updated_at: Optional[datetime.datetime] = None,
+    ):
         self._has_file = has_file
         self._name = name
         self._project = project
         self._source = src
+        self._updated_at = updated_at
 
     @property
     def base_branch(self) -> str:
@@ -70,6 +92,10 @@ class RepositoryMock(source.Repository):
     def source(self) -> str:
         return self._source
 
+    @property
+    def updated_at(self) -> Optional[datetime.datetime]:
+        return self._updated_at
+
 
 def create_git_mock(
     branch_name: str,
@@ -112,6 +138,48 @@ class RepoRunTest(unittest.TestCase):
         repo_mock.create_pull_request.assert_not_called()
         repo_mock.merge_pull_request.assert_not_called()
 
+    def test_apply__concurrent_workers_do_not_change_working_directory(self):
+        cfg = config.Config(workers=2)
+        opts = Options(cfg)
+        git_mock = create_git_mock("rcmt", "/tmp", False, False)
+        runner = RepoRun(git_mock, opts)
+        cwd_during_apply: list[str] = []
+        task = Task()
+        task.apply = unittest.mock.Mock(
+            side_effect=lambda ctx: cwd_during_apply.append(os.getcwd())
+        )
+        task.name = "testrun"
+        repo_mock = unittest.mock.Mock(spec=source.Repository)
+        repo_mock.find_pull_request.return_value = None
+        ctx = context.Context(repo_mock)
+
+        runner.execute(ctx=ctx, matcher=task)
+
+        self.assertListEqual([os.getcwd()], cwd_during_apply)
+        self.assertEqual("/tmp", ctx.checkout_dir)
+
+    def test_apply__isolated(self):
+        cfg = config.Config()
+        opts = Options(cfg)
+        opts.apply_pool = unittest.mock.Mock(spec=process.ApplyPool)
+        opts.apply_pool.apply.return_value = {"test.txt"}
+        git_mock = create_git_mock("rcmt", "/tmp", False, True)
+        runner = RepoRun(git_mock, opts)
+        task = Task()
+        task.apply = unittest.mock.Mock(return_value=None)
+        task.name = "testrun"
+        repo_mock = unittest.mock.Mock(spec=source.Repository)
+        repo_mock.find_pull_request.return_value = None
+        ctx = context.Context(repo_mock)
+
+        result = runner.execute(ctx=ctx, matcher=task)
+
+        self.assertEqual(RunResult.PR_CREATED, result)
+        opts.apply_pool.apply.assert_called_once_with(task=task, ctx=ctx)
+        task.apply.assert_not_called()
+        git_mock.has_changes_local.assert_not_called()
+        git_mock.commit_changes.assert_called_once_with("/tmp", "Applied actions")
+
     def test_new_changes(self):
         cfg = config.Config()
         opts = Options(cfg)
@@ -149,6 +217,57 @@ class RepoRunTest(unittest.TestCase):
         repo_mock.merge_pull_request.assert_not_called()
         task.on_pr_created.assert_called_once_with(ctx=ctx)
 
+    def test_apply__only_actions(self):
+        opts = Options(config.Config())
+        git_mock = create_git_mock("rcmt", "/tmp", False, True)
+        git_mock.local_changes.return_value = {"test.txt"}
+        runner = RepoRun(git_mock, opts)
+        task = Task()
+        task.apply = unittest.mock.Mock(
+            side_effect=lambda ctx: ctx.add_changed_path("test.txt")
+        )
+        task.name = "testrun"
+        task.only_actions = True
+        repo_mock = unittest.mock.Mock(spec=source.Repository)
+        repo_mock.find_pull_request.return_value = None
+        ctx = context.Context(repo_mock)
+
+        result = runner.execute(ctx=ctx, matcher=task)
+
+        self.assertEqual(RunResult.PR_CREATED, result)
+        git_mock.has_changes_local.assert_not_called()
+        git_mock.local_changes.assert_called_once_with("/tmp", {"test.txt"})
+        git_mock.commit_changes.assert_called_once_with(
+            "/tmp", "Applied actions", targets={"test.txt"}
+        )
+
+    def test_sync__pushed_with_other_branches(self):
+        git_mock = create_git_mock("rcmt", "/tmp", True, True)
+        runner = RepoRun(git_mock, Options(config.Config()))
+        task = Task()
+        task.name = "testrun"
+        repo_mock = unittest.mock.Mock(spec=source.Repository)
+        repo_mock.is_pr_open.return_value = False
+        ctx = context.Context(repo_mock)
+        state = RunState()
+        state.has_changes = True
+        state.work_dir = "/tmp"
+
+        state.push_result = git.PushResult("rcmt", True, False, "[new branch]")
+        result = runner.sync(ctx=ctx, matcher=task, state=state)
+
+        self.assertEqual(RunResult.PR_CREATED, result)
+        git_mock.push.assert_not_called()
+
+        state.push_result = git.PushResult("rcmt", False, True, "[rejected]")
+        with self.assertRaises(RuntimeError):
+            runner.sync(ctx=ctx, matcher=task, state=state)
+
+        # Another branch has caused the batch to fail. Push the branch on its own.
+        state.push_result = git.PushResult("rcmt", False, False, "push failed")
+        runner.sync(ctx=ctx, matcher=task, state=state)
+        git_mock.push.assert_called_once_with("/tmp")
+
     def test_auto_merge_pr(self):
         cfg = config.Config()
         opts = Options(cfg)
@@ -553,6 +672,7 @@ class ExecuteTaskTest(unittest.TestCase):
         repo_run = unittest.mock.Mock(spec=RepoRun)
         repo_run_class.return_value = repo_run
         task = unittest.mock.Mock(spec=Task)
+        task.paths = None
         task.change_limit = None
         task.name = "test"
         task.filter.return_value = True
@@ -585,6 +705,7 @@ class ExecuteTaskTest(unittest.TestCase):
         repo_run = unittest.mock.Mock(spec=RepoRun)
         repo_run_class.return_value = repo_run
         task = unittest.mock.Mock(spec=Task)
+        task.paths = None
         task.change_limit = None
         task.filter.return_value = False
         task.name = "test"
@@ -604,6 +725,7 @@ class ExecuteTaskTest(unittest.TestCase):
         repo_run.execute.side_effect = RuntimeError
         repo_run_class.return_value = repo_run
         task = unittest.mock.Mock(spec=Task)
+        task.paths = None
         task.filter.return_value = True
         task.name = "test"
         repository = unittest.mock.Mock(spec=source.Repository)
@@ -620,6 +742,7 @@ class ExecuteTaskTest(unittest.TestCase):
         repo_run = unittest.mock.Mock(spec=RepoRun)
         repo_run_class.return_value = repo_run
         task = unittest.mock.Mock(spec=Task)
+        task.paths = None
         task.filter.side_effect = RuntimeError
         task.name = "test"
         wrapper = TaskWrapper(t=task)
@@ -636,6 +759,7 @@ class ExecuteTaskTest(unittest.TestCase):
         repo_run_class.return_value = repo_run
         repo_run.execute.return_value = RunResult.PR_CREATED
         task = unittest.mock.Mock(spec=Task)
+        task.paths = None
         task.change_limit = 1
         task.name = "unittest"
         task.filter.return_value = True
@@ -674,6 +798,551 @@ class ExecuteTaskTest(unittest.TestCase):
         self.assertEqual(task, task_call)
 
 
+class SnapshotsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db: Database = database.new_database(DatabaseConfig())
+        task_ = Task()
+        task_.name = "unit-test"
+        self.task_wrapper = TaskWrapper(task_)
+        self.task_wrapper.checksum = "abc"
+        self.heads = {"main": "1111", "rcmt/unit-test": "2222"}
+
+    def test_unchanged(self):
+        snapshots = Snapshots(db=self.db, tasks=[self.task_wrapper], cfg=Config())
+        snapshots.save(
+            repository="github.com/wndhydrnt/unit-test",
+            task_name="unit-test",
+            base_branch="main",
+            branch="rcmt/unit-test",
+            heads=self.heads,
+            result=RunResult.PR_OPEN,
+        )
+
+        def unchanged(s: Snapshots, heads: dict[str, str]) -> bool:
+            return s.unchanged(
+                repository="github.com/wndhydrnt/unit-test",
+                task_name="unit-test",
+                base_branch="main",
+                branch="rcmt/unit-test",
+                heads=heads,
+            )
+
+        self.assertTrue(unchanged(snapshots, self.heads))
+        self.assertFalse(
+            unchanged(snapshots, {"main": "3333", "rcmt/unit-test": "2222"}),
+            "Should not skip if the base branch has changed",
+        )
+        self.assertFalse(
+            unchanged(snapshots, {"main": "1111"}),
+            "Should not skip if the branch has been deleted",
+        )
+        self.assertFalse(
+            unchanged(
+                Snapshots(
+                    db=self.db,
+                    tasks=[self.task_wrapper],
+                    cfg=Config(custom={"key": "value"}),
+                ),
+                self.heads,
+            ),
+            "Should not skip if the configuration has changed",
+        )
+
+        self.task_wrapper.checksum = "def"
+        self.assertFalse(
+            unchanged(
+                Snapshots(db=self.db, tasks=[self.task_wrapper], cfg=Config()),
+                self.heads,
+            ),
+            "Should not skip if the Task has changed",
+        )
+
+    def test_unchanged__result(self):
+        snapshots = Snapshots(db=self.db, tasks=[self.task_wrapper], cfg=Config())
+        snapshots.save(
+            repository="github.com/wndhydrnt/unit-test",
+            task_name="unit-test",
+            base_branch="main",
+            branch="rcmt/unit-test",
+            heads=self.heads,
+            result=RunResult.CHECKS_FAILED,
+        )
+
+        self.assertFalse(
+            snapshots.unchanged(
+                repository="github.com/wndhydrnt/unit-test",
+                task_name="unit-test",
+                base_branch="main",
+                branch="rcmt/unit-test",
+                heads=self.heads,
+            )
+        )
+
+    def test_repo_run__skip_checkout(self):
+        task_ = self.task_wrapper.task
+        task_.apply = unittest.mock.Mock(return_value=None)
+        opts = Options(Config())
+        opts.snapshots = Snapshots(db=self.db, tasks=[self.task_wrapper], cfg=Config())
+        git_mock = create_git_mock("rcmt/unit-test", "/tmp", False, False)
+        git_mock.remote_heads.return_value = self.heads
+        repo_mock = RepositoryMock(
+            name="unit-test", project="wndhydrnt", src="github.com"
+        )
+        ctx = context.Context(repo_mock)
+
+        first = RepoRun(git_mock, opts).execute(ctx=ctx, matcher=task_)
+        second = RepoRun(git_mock, opts).execute(ctx=ctx, matcher=task_)
+
+        self.assertEqual(RunResult.NO_CHANGES, first)
+        self.assertEqual(RunResult.NO_CHANGES, second)
+        git_mock.prepare.assert_called_once()
+        task_.apply.assert_called_once_with(ctx=ctx)
+        self.assertEqual(2, git_mock.remote_heads.call_count)
+
+
+class PipelineRunTest(unittest.TestCase):
+    @unittest.mock.patch("rcmt.rcmt.RepoRun")
+    def test_execute(self, repo_run_class):
+        def plan(ctx: context.Context, matcher: Task) -> RunState:
+            state = RunState()
+            if ctx.repo.name == "closed":
+                state.result = RunResult.PR_CLOSED_BEFORE
+
+            return state
+
+        repo_run = unittest.mock.Mock()
+        repo_run.plan.side_effect = plan
+        repo_run.sync.return_value = RunResult.PR_CREATED
+        repo_run_class.return_value = repo_run
+        task = unittest.mock.Mock(spec=Task)
+        task.paths = None
+        task.change_limit = 1
+        task.name = "test"
+        task.filter.side_effect = lambda ctx: ctx.repo.name != "no-match"
+        task_wrapper = TaskWrapper(t=task)
+        repositories = [
+            RepositoryMock(name=name, project="wndhydrnt", src="github.com")
+            for name in ["no-match", "closed", "changed", "limit"]
+        ]
+
+        # A single worker in the plan stage keeps the order of repositories.
+        cfg = Config(workers=2, pipeline=config.Pipeline(filter_workers=1))
+
+        count, success = PipelineRun(opts=Options(cfg), tasks=[task_wrapper]).execute(
+            iter(repositories)
+        )
+
+        self.assertEqual(4, count)
+        self.assertTrue(success)
+        self.assertEqual(
+            1,
+            repo_run.git.fetch.call_count,
+            "Should fetch only the repository that needs to be changed",
+        )
+        repo_run.sync.assert_called_once()
+        self.assertEqual(repositories[2], repo_run.sync.call_args.kwargs["ctx"].repo)
+        self.assertTrue(
+            task_wrapper.has_reached_change_limit(),
+            "Should count the change and release all other changes",
+        )
+
+    @unittest.mock.patch("rcmt.rcmt.RepoRun")
+    def test_execute__task_workers(self, repo_run_class):
+        # Fails if the Tasks do not work on the repository at the same time.
+        barrier = threading.Barrier(2, timeout=5.0)
+        repo_run = unittest.mock.Mock()
+        repo_run.plan.return_value = RunState()
+        repo_run.work.side_effect = lambda ctx, matcher, state: barrier.wait()
+        repo_run.sync.return_value = RunResult.PR_CREATED
+        repo_run_class.return_value = repo_run
+        task_wrappers = []
+        for name in ["one", "two"]:
+            task = unittest.mock.Mock(spec=Task)
+            task.paths = None
+            task.change_limit = None
+            task.name = name
+            task.filter.return_value = True
+            task_wrappers.append(TaskWrapper(t=task))
+
+        cfg = Config(workers=2, pipeline=config.Pipeline(task_workers=2))
+
+        count, success = PipelineRun(opts=Options(cfg), tasks=task_wrappers).execute(
+            iter(
+                [
+                    RepositoryMock(
+                        name="rcmt-test", project="wndhydrnt", src="github.com"
+                    )
+                ]
+            )
+        )
+
+        self.assertEqual(1, count)
+        self.assertTrue(success)
+        self.assertEqual(2, repo_run.sync.call_count)
+        self.assertEqual(2, repo_run.close.call_count)
+
+    @unittest.mock.patch("rcmt.rcmt.PipelineRun._push")
+    @unittest.mock.patch("rcmt.rcmt.RepoRun")
+    def test_execute__stage_exception(self, repo_run_class, push):
+        push.side_effect = [RuntimeError("unit test"), None]
+        repo_run = unittest.mock.Mock()
+        repo_run.plan.return_value = RunState()
+        repo_run.sync.return_value = RunResult.PR_CREATED
+        repo_run_class.return_value = repo_run
+        task = unittest.mock.Mock(spec=Task)
+        task.paths = None
+        task.change_limit = 1
+        task.name = "test"
+        task.filter.return_value = True
+        task_wrapper = TaskWrapper(t=task)
+        repositories = [
+            RepositoryMock(name=name, project="wndhydrnt", src="github.com")
+            for name in ["fails", "changed"]
+        ]
+        cfg = Config(
+            workers=2, pipeline=config.Pipeline(filter_workers=1, sync_workers=1)
+        )
+
+        count, success = PipelineRun(opts=Options(cfg), tasks=[task_wrapper]).execute(
+            iter(repositories)
+        )
+
+        self.assertEqual(2, count)
+        self.assertFalse(success)
+        self.assertEqual(1, task_wrapper.failure_count)
+        self.assertEqual(
+            2,
+            repo_run.close.call_count,
+            "Should close the runner of the repository that failed",
+        )
+        repo_run.sync.assert_called_once()
+        self.assertEqual(repositories[1], repo_run.sync.call_args.kwargs["ctx"].repo)
+        self.assertTrue(
+            task_wrapper.has_reached_change_limit(),
+            "Should release the change of the repository that failed",
+        )
+
+    @unittest.mock.patch("rcmt.git.Checkout.push")
+    @unittest.mock.patch("rcmt.rcmt.RepoRun")
+    def test_execute__push(self, repo_run_class, push):
+        def work(ctx: context.Context, matcher: Task, state: RunState) -> None:
+            state.has_changes = matcher.name != "unchanged"
+
+        push.return_value = {
+            "rcmt/one": git.PushResult("rcmt/one", True, False, "[new branch]"),
+            "rcmt/two": git.PushResult("rcmt/two", False, True, "[rejected]"),
+        }
+        runners = {}
+
+        def new_repo_run(g: git.Git, opts: Options) -> unittest.mock.Mock:
+            runner = unittest.mock.Mock()
+            runner.git.branch_name = g.branch_name
+            runner.plan.return_value = RunState()
+            runner.work.side_effect = work
+            runner.sync.return_value = RunResult.PR_CREATED
+            runners[g.branch_name] = runner
+            return runner
+
+        repo_run_class.side_effect = new_repo_run
+        task_wrappers = []
+        for name in ["one", "two", "unchanged"]:
+            task = unittest.mock.Mock(spec=Task)
+            task.paths = None
+            task.change_limit = None
+            task.name = name
+            task.branch_name = ""
+            task.filter.return_value = True
+            task_wrappers.append(TaskWrapper(t=task))
+
+        PipelineRun(opts=Options(Config(workers=2)), tasks=task_wrappers).execute(
+            iter(
+                [
+                    RepositoryMock(
+                        name="rcmt-test", project="wndhydrnt", src="github.com"
+                    )
+                ]
+            )
+        )
+
+        push.assert_called_once_with(["rcmt/one", "rcmt/two"])
+        state_one = runners["rcmt/one"].sync.call_args.kwargs["state"]
+        self.assertTrue(state_one.push_result.pushed)
+        state_two = runners["rcmt/two"].sync.call_args.kwargs["state"]
+        self.assertTrue(state_two.push_result.rejected)
+        state_unchanged = runners["rcmt/unchanged"].sync.call_args.kwargs["state"]
+        self.assertIsNone(state_unchanged.push_result)
+
+
+class WatermarksTest(unittest.TestCase):
+    def test_pending(self):
+        since = datetime.datetime.fromtimestamp(2934000, tz=datetime.timezone.utc)
+        task_full = Task()
+        task_full.name = "full"
+        wrapper_full = TaskWrapper(task_full)
+        task_since = Task()
+        task_since.name = "since"
+        wrapper_since = TaskWrapper(task_since)
+        wrapper_since.since = since
+        tasks = [wrapper_full, wrapper_since]
+        watermarks = Watermarks()
+        watermarks.open_pull_requests.add("github.com/wndhydrnt/pr")
+
+        def new_repository(name: str, updated_at: Optional[datetime.datetime]):
+            return RepositoryMock(
+                name=name, project="wndhydrnt", src="github.com", updated_at=updated_at
+            )
+
+        old = since - datetime.timedelta(seconds=1)
+        self.assertEqual(
+            [wrapper_full], watermarks.pending(new_repository("old", old), tasks)
+        )
+        self.assertEqual(tasks, watermarks.pending(new_repository("pr", old), tasks))
+        self.assertEqual(
+            tasks,
+            watermarks.pending(
+                new_repository("new", since + datetime.timedelta(seconds=1)), tasks
+            ),
+        )
+        self.assertEqual(
+            tasks, watermarks.pending(new_repository("unknown", None), tasks)
+        )
+
+
+class ListRepositoriesTest(unittest.TestCase):
+    def test_list_repositories__retry_with_open_pull_request(self):
+        since = datetime.datetime.fromtimestamp(2934000, tz=datetime.timezone.utc)
+        old = since - datetime.timedelta(seconds=1)
+        failed_repository = RepositoryMock(
+            name="failed", project="wndhydrnt", src="github.com", updated_at=old
+        )
+        other_repository = RepositoryMock(
+            name="other", project="wndhydrnt", src="github.com", updated_at=old
+        )
+        source_mock = unittest.mock.Mock(spec=Base)
+        source_mock.list_repositories_with_open_pull_requests.return_value = [
+            failed_repository
+        ]
+        source_mock.list_repositories.return_value = [other_repository]
+        task_failed = Task()
+        task_failed.name = "failed"
+        wrapper_failed = TaskWrapper(task_failed)
+        wrapper_failed.since = since
+        task_pr = Task()
+        task_pr.name = "pr"
+        wrapper_pr = TaskWrapper(task_pr)
+        wrapper_pr.since = since
+        tasks = [wrapper_failed, wrapper_pr]
+        watermarks = Watermarks(failures={failed_repository.full_name: {"failed"}})
+
+        repositories = list_repositories(
+            all_repositories=False,
+            since=since,
+            sources=[source_mock],
+            open_pull_requests=watermarks.open_pull_requests,
+            retry=iter([failed_repository]),
+        )
+        first = next(repositories)
+
+        self.assertEqual(failed_repository, first)
+        self.assertEqual(
+            tasks,
+            watermarks.pending(first, tasks),
+            "Should let all Tasks process the open pull requests of a failed repository",
+        )
+        self.assertEqual([other_repository], list(repositories))
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_expired(self):
+        now = 0.0
+        deadline = Deadline(max_duration=100, clock=lambda: now)
+
+        self.assertFalse(deadline.expired(repositories_started=0))
+        now = 60.0
+        self.assertFalse(deadline.expired(repositories_started=2))
+        self.assertFalse(deadline.stopped)
+        self.assertTrue(
+            deadline.expired(repositories_started=1),
+            "Should stop if the next repository would exceed the budget",
+        )
+        self.assertTrue(deadline.stopped)
+
+    def test_expired__no_max_duration(self):
+        deadline = Deadline()
+
+        self.assertFalse(deadline.expired(repositories_started=100))
+
+        deadline.cancel()
+        self.assertTrue(deadline.expired(repositories_started=100))
+
+
+class ChangeWindowTest(unittest.TestCase):
+    def test_check(self):
+        now = 0.0
+        task_one = unittest.mock.Mock(spec=TaskWrapper)
+        task_two = unittest.mock.Mock(spec=TaskWrapper)
+        window = ChangeWindow([task_one, task_two], seconds=60, clock=lambda: now)
+
+        now = 59.0
+        window.check()
+        task_one.reset_changes.assert_not_called()
+
+        now = 60.0
+        window.check()
+        window.check()
+        task_one.reset_changes.assert_called_once_with()
+        task_two.reset_changes.assert_called_once_with()
+
+        now = 120.0
+        window.check()
+        self.assertEqual(2, task_one.reset_changes.call_count)
+
+    def test_check__disabled(self):
+        now = 0.0
+        task_one = unittest.mock.Mock(spec=TaskWrapper)
+        window = ChangeWindow([task_one], seconds=0, clock=lambda: now)
+
+        now = 1000000.0
+        window.check()
+
+        task_one.reset_changes.assert_not_called()
+
+
+class UntilChangeLimitsReachedTest(unittest.TestCase):
+    def test_until_change_limits_reached(self):
+        read: list[str] = []
+
+        def repositories() -> Iterator[source.Repository]:
+            for i in range(10):
+                name = f"unit-test-{i}"
+                read.append(name)
+                yield RepositoryMock(name=name, project="wndhydrnt", src="github.com")
+
+        task_limit = Task()
+        task_limit.change_limit = 2
+        task_limit.name = "limit"
+        wrapper_limit = TaskWrapper(t=task_limit)
+        task_other = Task()
+        task_other.change_limit = 1
+        task_other.name = "other"
+        wrapper_other = TaskWrapper(t=task_other)
+        wrapper_other.changes_total = 1
+
+        for _ in until_change_limits_reached(
+            repositories(), [wrapper_limit, wrapper_other]
+        ):
+            wrapper_limit.changes_total += 1
+
+        self.assertEqual(
+            ["unit-test-0", "unit-test-1"],
+            read,
+            "Should stop reading once every Task has reached its change limit",
+        )
+
+    def test_until_change_limits_reached__no_limit(self):
+        task_ = Task()
+        task_.name = "no-limit"
+
+        result = list(
+            until_change_limits_reached(
+                iter(
+                    [
+                        RepositoryMock(name=name, project="wndhydrnt", src="github.com")
+                        for name in ["one", "two"]
+                    ]
+                ),
+                [TaskWrapper(t=task_)],
+            )
+        )
+
+        self.assertEqual(2, len(result))
+
+
+class ShardTest(unittest.TestCase):
+    def test_from_string(self):
+        shard = Shard.from_string("1/3")
+
+        self.assertEqual(1, shard.index)
+        self.assertEqual(3, shard.count)
+        self.assertEqual("1/3", str(shard))
+        self.assertEqual(["0/3", "1/3", "2/3"], shard.names())
+
+    def test_from_string__invalid(self):
+        for value in ["1", "a/3", "3/3", "0/0", "-1/2"]:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                Shard.from_string(value)
+
+    def test_contains(self):
+        shards = [Shard(index=i, count=3) for i in range(3)]
+        for i in range(50):
+            repository = RepositoryMock(
+                name=f"unit-test-{i}", project="wndhydrnt", src="github.com"
+            )
+            with self.subTest(repository=repository.full_name):
+                self.assertEqual(
+                    1,
+                    len([s for s in shards if s.contains(repository)]),
+                    "Should assign each repository to exactly one shard",
+                )
+
+
+class NewCheckoutTest(unittest.TestCase):
+    def test_new_checkout(self):
+        task_default = Task()
+        task_default.name = "default"
+        task_custom = Task()
+        task_custom.name = "custom"
+        task_custom.branch_name = "feature/custom"
+        opts = Options(cfg=Config())
+
+        checkout = new_checkout(
+            tasks=[TaskWrapper(task_default), TaskWrapper(task_custom)], opts=opts
+        )
+
+        self.assertListEqual(
+            [
+                "+refs/heads/main:refs/remotes/origin/main",
+                "+refs/heads/rcmt/*:refs/remotes/origin/rcmt/*",
+                "+refs/heads/feature/custom*:refs/remotes/origin/feature/custom*",
+            ],
+            checkout.refspecs(base_branch="main"),
+        )
+
+
+class NewGitTest(unittest.TestCase):
+    def test_new_git(self):
+        task = Task()
+        task.name = "unit-test"
+        task.paths = ["/.github/workflows/", "deploy", "deploy/"]
+        checkout = git.Checkout(branches=["rcmt/*"])
+
+        g = new_git(TaskWrapper(task), Options(cfg=Config()), checkout)
+
+        self.assertEqual("rcmt/unit-test", g.branch_name)
+        self.assertIs(checkout, g.checkout)
+        self.assertListEqual([".github/workflows", "deploy"], g.paths)
+
+    def test_new_git__checkout_dir(self):
+        task = Task()
+        task.name = "unit-test"
+        repository = RepositoryMock(
+            name="rcmt-test", project="wndhydrnt", src="github.com"
+        )
+
+        g = new_git(TaskWrapper(task), Options(cfg=Config()))
+
+        self.assertIsNone(g.paths)
+        self.assertEqual(
+            "/tmp/rcmt/data/mirrors/github.com/wndhydrnt/rcmt-test.git",
+            g.mirror_dir(repository),
+        )
+        self.assertEqual(
+            "/tmp/rcmt/data/worktrees/github.com/wndhydrnt/rcmt-test/rcmt-unit-test-dc5fe687637d",
+            g.checkout_dir(repository),
+            "Should add a work tree per branch",
+        )
+
+
 class ExecuteTest(unittest.TestCase):
     def setUp(self) -> None:
         self.db: Database = database.new_database(DatabaseConfig())
@@ -842,6 +1511,75 @@ class ExecuteTest(unittest.TestCase):
             "Should pass the options to 'execute_run'",
         )
 
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__watermark(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        since = datetime.datetime.fromtimestamp(2934000, tz=datetime.timezone.utc)
+        self.db.get_or_create_task(name="unit-test")
+        self.db.update_task(
+            name="unit-test", checksum="9263296cd50d42b5fa23855f68824528", since=since
+        )
+        self.db.get_or_create_task(name="other")
+        self.db.update_task(name="other", checksum="outdated", since=since)
+
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        before = since - datetime.timedelta(days=1)
+        after = since + datetime.timedelta(days=1)
+        repo_old = RepositoryMock(
+            name="old", project="wndhydrnt", src="github.com", updated_at=before
+        )
+        repo_new = RepositoryMock(
+            name="new", project="wndhydrnt", src="github.com", updated_at=after
+        )
+        repo_pr = RepositoryMock(
+            name="pr", project="wndhydrnt", src="github.com", updated_at=before
+        )
+        source_mock.list_repositories.return_value = [repo_old, repo_new, repo_pr]
+        source_mock.list_repositories_with_open_pull_requests.return_value = [repo_pr]
+
+        other = Task()
+        other.name = "other"
+        other_wrapper = TaskWrapper(other)
+        other_wrapper.checksum = "changed"
+        registry.tasks.append(other_wrapper)
+        opts = Options(Config())
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+        execute_task_mock.return_value = True
+
+        result = execute(opts)
+
+        self.assertTrue(result)
+        source_mock.list_repositories.assert_called_once_with(
+            since=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+        )
+        self.assertCountEqual(
+            [
+                ("other", "old"),
+                ("other", "new"),
+                ("other", "pr"),
+                ("unit-test", "new"),
+                ("unit-test", "pr"),
+            ],
+            [
+                (c.args[0].name, c.args[1].name)
+                for c in execute_task_mock.call_args_list
+            ],
+            "Should apply the changed Task to all repositories and the unchanged Task only to updated repositories or repositories with open pull requests",
+        )
+        watermark = self.db.get_or_create_task(name="unit-test").since
+        assert watermark is not None
+        self.assertLess(
+            since,
+            watermark.replace(tzinfo=datetime.timezone.utc),
+            "Should advance the watermark",
+        )
+
     @unittest.mock.patch("rcmt.database.new_database")
     @unittest.mock.patch("rcmt.rcmt.execute_task")
     def test_execute__deduplicate_repositories(
@@ -948,6 +1686,349 @@ class ExecuteTest(unittest.TestCase):
         )
         execute_task_mock.assert_not_called()
 
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.match_task")
+    @unittest.mock.patch("rcmt.rcmt.RepoRun")
+    def test_execute__concurrent_workers(
+        self,
+        repo_run_class: unittest.mock.MagicMock,
+        match_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        repositories = [
+            RepositoryMock(name=f"unit-test-{i}", project="wndhydrnt", src="github.com")
+            for i in range(5)
+        ]
+        source_mock.list_repositories.return_value = repositories
+        match_task_mock.side_effect = lambda t, ctx: ctx.repo.name != "unit-test-4"
+
+        def work(ctx: context.Context, matcher: Task, state: RunState) -> None:
+            if ctx.repo.name == "unit-test-3":
+                raise RuntimeError("unit test")
+
+        repo_run = unittest.mock.Mock()
+        repo_run.plan.return_value = RunState()
+        repo_run.work.side_effect = work
+        repo_run.sync.return_value = RunResult.PR_CREATED
+        repo_run_class.return_value = repo_run
+
+        opts = Options(Config(workers=2))
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+
+        result = execute(opts)
+
+        self.assertFalse(result, msg="Should fail because one repository failed")
+        self.assertEqual(
+            5,
+            match_task_mock.call_count,
+            "Should match the Task against each repository",
+        )
+        self.assertCountEqual(
+            repositories[:4],
+            [c.kwargs["ctx"].repo for c in repo_run.work.call_args_list],
+            "Should apply the Task to each matching repository",
+        )
+        self.assertCountEqual(
+            repositories[:3],
+            [c.kwargs["ctx"].repo for c in repo_run.sync.call_args_list],
+            "Should sync pull requests of each repository that did not fail",
+        )
+        self.assertEqual(1, registry.tasks[0].failure_count)
+        self.assertEqual(
+            {"github.com/wndhydrnt/unit-test-3": {"unit-test"}},
+            self.db.get_failures(),
+            "Should record the failure to retry it during the next run",
+        )
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__retry_failed_repositories(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        repositories = [
+            RepositoryMock(
+                name=f"unit-test-{i}",
+                project="wndhydrnt",
+                src="github.com",
+                updated_at=now - datetime.timedelta(days=1),
+            )
+            for i in range(3)
+        ]
+        source_mock = unittest.mock.Mock(spec=Base)
+        source_mock.list_repositories.return_value = repositories
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        source_mock.create_from_name.side_effect = lambda name: next(
+            (r for r in repositories if r.full_name == name), None
+        )
+        opts = Options(Config())
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+        execute_task_mock.side_effect = (
+            lambda t, repo, o, **kwargs: repo.name != "unit-test-1"
+        )
+
+        self.assertFalse(execute(opts))
+
+        self.assertEqual(
+            "9263296cd50d42b5fa23855f68824528",
+            self.db.get_or_create_task(name="unit-test").checksum,
+            "Should update the checksum because the failure has been recorded",
+        )
+
+        registry.tasks = []
+        execute_task_mock.reset_mock(side_effect=True)
+        execute_task_mock.return_value = True
+        # The Source lists no repository because none has been updated.
+        source_mock.list_repositories.return_value = []
+
+        self.assertTrue(execute(opts))
+
+        self.assertEqual(
+            ["unit-test-1"],
+            [c.args[1].name for c in execute_task_mock.call_args_list],
+            "Should retry only the repository that failed",
+        )
+        self.assertEqual({}, self.db.get_failures())
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__prune_failures_of_removed_tasks(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        self.db.save_checkpoints(
+            "github.com/wndhydrnt/removed", {}, failed=["removed-task"]
+        )
+        self.db.save_checkpoints(
+            "github.com/wndhydrnt/known", {}, failed=["removed-task", "unit-test"]
+        )
+        source_mock = unittest.mock.Mock(spec=Base)
+        source_mock.list_repositories.return_value = []
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        source_mock.create_from_name.side_effect = lambda name: RepositoryMock(
+            name=name.split("/")[-1], project="wndhydrnt", src="github.com"
+        )
+        execute_task_mock.return_value = True
+        opts = Options(Config())
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+
+        self.assertTrue(execute(opts))
+
+        source_mock.create_from_name.assert_called_once_with(
+            name="github.com/wndhydrnt/known"
+        )
+        self.assertEqual({}, self.db.get_failures())
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__resume(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        repositories = [
+            RepositoryMock(name=f"unit-test-{i}", project="wndhydrnt", src="github.com")
+            for i in range(4)
+        ]
+        source_mock.list_repositories.return_value = repositories
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        opts = Options(Config())
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+
+        def crash(t: TaskWrapper, repo: source.Repository, o: Options, **kwargs):
+            if repo.name == "unit-test-2":
+                # Simulate the process getting killed
+                raise KeyboardInterrupt()
+
+            return True
+
+        execute_task_mock.side_effect = crash
+        with self.assertRaises(KeyboardInterrupt):
+            execute(opts)
+
+        registry.tasks = []
+        execute_task_mock.reset_mock(side_effect=True)
+        execute_task_mock.return_value = True
+        opts.resume = True
+
+        result = execute(opts)
+
+        self.assertTrue(result)
+        self.assertEqual(
+            ["unit-test-2", "unit-test-3"],
+            [c.args[1].name for c in execute_task_mock.call_args_list],
+            "Should skip repositories processed by the previous run",
+        )
+
+        registry.tasks = []
+        execute_task_mock.reset_mock()
+
+        execute(opts)
+
+        self.assertEqual(
+            4,
+            execute_task_mock.call_count,
+            "Should process all repositories because the previous run has finished",
+        )
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__sigterm(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        repositories = [
+            RepositoryMock(name=f"unit-test-{i}", project="wndhydrnt", src="github.com")
+            for i in range(4)
+        ]
+        source_mock.list_repositories.return_value = repositories
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        opts = Options(Config())
+        opts.max_duration = 3600
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+
+        def terminate(t: TaskWrapper, repo: source.Repository, o: Options, **kwargs):
+            if repo.name == "unit-test-1":
+                os.kill(os.getpid(), signal.SIGTERM)
+
+            return True
+
+        execute_task_mock.side_effect = terminate
+
+        result = execute(opts)
+
+        self.assertTrue(result)
+        self.assertEqual(
+            ["unit-test-0", "unit-test-1"],
+            [c.args[1].name for c in execute_task_mock.call_args_list],
+            "Should finish the repository in progress and not start new ones",
+        )
+        self.assertEqual(
+            datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc),
+            self.db.get_last_execution().executed_at,
+            "Should not save the Execution of a run that has stopped early",
+        )
+        self.assertEqual("", self.db.get_or_create_task(name="unit-test").checksum)
+
+        registry.tasks = []
+        execute_task_mock.reset_mock(side_effect=True)
+        execute_task_mock.return_value = True
+
+        execute(opts)
+
+        self.assertEqual(
+            ["unit-test-2", "unit-test-3"],
+            [c.args[1].name for c in execute_task_mock.call_args_list],
+            "Should continue where the previous run stopped",
+        )
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__sigterm_task_failed(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        source_mock.list_repositories.return_value = [
+            RepositoryMock(name=f"unit-test-{i}", project="wndhydrnt", src="github.com")
+            for i in range(2)
+        ]
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        opts = Options(Config())
+        opts.max_duration = 3600
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+
+        def terminate(t: TaskWrapper, repo: source.Repository, o: Options, **kwargs):
+            os.kill(os.getpid(), signal.SIGTERM)
+            return False
+
+        execute_task_mock.side_effect = terminate
+        metric.run_error.set(0)
+
+        result = execute(opts)
+
+        self.assertFalse(result)
+        self.assertEqual(
+            1.0,
+            metric.run_error._value.get(),  # type: ignore[attr-defined]
+            "Should report the error of a run that has stopped early",
+        )
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__shard(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ) -> None:
+        new_database_mock.return_value = self.db
+        source_mock = unittest.mock.Mock(spec=Base)
+        repositories = [
+            RepositoryMock(name=f"unit-test-{i}", project="wndhydrnt", src="github.com")
+            for i in range(10)
+        ]
+        source_mock.list_repositories.return_value = repositories
+        execute_task_mock.return_value = True
+        opts = Options(Config())
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+        opts.sources = {"mock": source_mock}
+        processed: list[source.Repository] = []
+
+        opts.shard = Shard(index=0, count=2)
+        execute(opts)
+
+        processed.extend([c.args[1] for c in execute_task_mock.call_args_list])
+        self.assertEqual(
+            "",
+            self.db.get_or_create_task(name="unit-test").checksum,
+            "Should not update the checksum before all shards have finished",
+        )
+        self.assertEqual(
+            datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc),
+            self.db.get_last_execution().executed_at,
+            "Should not save the Execution before all shards have finished",
+        )
+
+        registry.tasks = []
+        execute_task_mock.reset_mock()
+        opts.shard = Shard(index=1, count=2)
+        execute(opts)
+
+        processed.extend([c.args[1] for c in execute_task_mock.call_args_list])
+        self.assertCountEqual(
+            repositories, processed, "Should process each repository exactly once"
+        )
+        self.assertEqual(
+            "9263296cd50d42b5fa23855f68824528",
+            self.db.get_or_create_task(name="unit-test").checksum,
+            "Should update the checksum after all shards have finished",
+        )
+        self.assertEqual(
+            self.db.get_last_execution(shard="0/2").executed_at,
+            self.db.get_last_execution().executed_at,
+            "Should save the time of the oldest Execution of all shards",
+        )
+
     @unittest.mock.patch("rcmt.database.new_database")
     @unittest.mock.patch("rcmt.rcmt.execute_task")
     def test_execute__no_sources(
@@ -967,6 +2048,17 @@ class ExecuteTest(unittest.TestCase):
             "No Source has been configured. Configure access credentials for GitHub or GitLab.",
         )
 
+    def test_execute__isolate_with_workers(self) -> None:
+        opts = Options(Config(apply=Apply(isolate=True), workers=2))
+        opts.sources = {"mock": unittest.mock.Mock(spec=Base)}
+
+        with self.assertRaises(RuntimeError) as ee:
+            execute(opts)
+
+        self.assertEqual(
+            "Setting apply.isolate requires workers to be 1, got 2", str(ee.exception)
+        )
+
     @unittest.mock.patch("rcmt.database.new_database")
     @unittest.mock.patch("rcmt.rcmt.execute_task")
     def test_execute__repository_from_opts(
@@ -0,0 +1,265 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import hashlib
+import hmac
+import http.client
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from typing import Any
+
+from rcmt import server
+from rcmt.config import Config, Github, Gitlab, Serve
+
+GITHUB_PUSH = {
+    "ref": "refs/heads/main",
+    "repository": {"default_branch": "main", "full_name": "wndhydrnt/rcmt-test"},
+}
+
+GITLAB_MERGE_REQUEST = {
+    "object_kind": "merge_request",
+    "project": {
+        "default_branch": "main",
+        "path_with_namespace": "wandhydrant/rcmt-test",
+        "web_url": "https://gitlab.com/wandhydrant/rcmt-test",
+    },
+}
+
+
+def github_headers(event: str, body: bytes, secret: str = "secret") -> dict[str, str]:
+    signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return {"X-GitHub-Event": event, "X-Hub-Signature-256": "sha256=" + signature}
+
+
+class DebouncerTest(unittest.TestCase):
+    def test_next(self):
+        now = [0.0]
+        debouncer = server.Debouncer(delay=10.0, clock=lambda: now[0])
+        debouncer.add("github.com/wndhydrnt/one")
+        now[0] = 5.0
+        debouncer.add("github.com/wndhydrnt/two")
+        now[0] = 6.0
+        debouncer.add("github.com/wndhydrnt/one")
+        now[0] = 16.5
+
+        self.assertEqual(
+            "github.com/wndhydrnt/two",
+            debouncer.next(),
+            "Should reset the delay of a repository on each event",
+        )
+        self.assertEqual("github.com/wndhydrnt/one", debouncer.next())
+        self.assertEqual(0, debouncer.pending())
+
+    def test_next__active(self):
+        debouncer = server.Debouncer(delay=0.0)
+        debouncer.add("github.com/wndhydrnt/one")
+        self.assertEqual("github.com/wndhydrnt/one", debouncer.next())
+
+        debouncer.add("github.com/wndhydrnt/one")
+        result: list[Any] = []
+        thread = threading.Thread(target=lambda: result.append(debouncer.next()))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(
+            thread.is_alive(), "Should not return a repository that is processed"
+        )
+
+        debouncer.done("github.com/wndhydrnt/one")
+        thread.join(1.0)
+        self.assertEqual(["github.com/wndhydrnt/one"], result)
+
+    def test_next__closed(self):
+        debouncer = server.Debouncer(delay=60.0)
+        debouncer.add("github.com/wndhydrnt/one")
+        debouncer.close()
+
+        self.assertIsNone(debouncer.next())
+
+
+class RepositoryFromEventTest(unittest.TestCase):
+    def test_github(self):
+        body = json.dumps(GITHUB_PUSH).encode()
+        signature = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+        cfg = Config(github=Github(webhook_secret="secret"))
+
+        self.assertEqual(
+            "github.com/wndhydrnt/rcmt-test",
+            server.repository_from_event(
+                body,
+                {
+                    "X-GitHub-Event": "push",
+                    "X-Hub-Signature-256": "sha256=" + signature,
+                },
+                cfg,
+            ),
+        )
+        with self.assertRaises(server.InvalidSignatureError):
+            server.repository_from_event(
+                body,
+                {"X-GitHub-Event": "push", "X-Hub-Signature-256": "sha256=invalid"},
+                cfg,
+            )
+
+    def test_github__enterprise(self):
+        body = json.dumps(GITHUB_PUSH).encode()
+        cfg = Config(
+            github=Github(
+                base_url="https://github.example.com/api/v3", webhook_secret="secret"
+            )
+        )
+
+        self.assertEqual(
+            "github.example.com/wndhydrnt/rcmt-test",
+            server.repository_from_event(body, github_headers("push", body), cfg),
+        )
+
+    def test_github__no_secret(self):
+        body = json.dumps(GITHUB_PUSH).encode()
+
+        with self.assertRaises(server.InvalidSignatureError):
+            server.repository_from_event(body, github_headers("push", body), Config())
+
+    def test_github__push_to_other_branch(self):
+        body = json.dumps(dict(GITHUB_PUSH, ref="refs/heads/rcmt/unit-test")).encode()
+        cfg = Config(github=Github(webhook_secret="secret"))
+
+        self.assertIsNone(
+            server.repository_from_event(body, github_headers("push", body), cfg)
+        )
+
+    def test_gitlab(self):
+        body = json.dumps(GITLAB_MERGE_REQUEST).encode()
+        cfg = Config(gitlab=Gitlab(webhook_token="secret"))
+
+        self.assertEqual(
+            "gitlab.com/wandhydrant/rcmt-test",
+            server.repository_from_event(
+                body,
+                {"X-Gitlab-Event": "Merge Request Hook", "X-Gitlab-Token": "secret"},
+                cfg,
+            ),
+        )
+        with self.assertRaises(server.InvalidSignatureError):
+            server.repository_from_event(
+                body, {"X-Gitlab-Event": "Merge Request Hook"}, cfg
+            )
+
+    def test_gitlab__no_secret(self):
+        with self.assertRaises(server.InvalidSignatureError):
+            server.repository_from_event(
+                json.dumps(GITLAB_MERGE_REQUEST).encode(),
+                {"X-Gitlab-Event": "Merge Request Hook"},
+                Config(github=Github(webhook_secret="secret")),
+            )
+
+    def test_unknown_event(self):
+        body = json.dumps({}).encode()
+        cfg = Config(github=Github(webhook_secret="secret"))
+
+        self.assertIsNone(
+            server.repository_from_event(body, github_headers("star", body), cfg)
+        )
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.processed: list[str] = []
+        self.event = threading.Event()
+
+        def process(name: str) -> None:
+            self.processed.append(name)
+            self.event.set()
+
+        self.server = server.Server(
+            cfg=Config(
+                github=Github(webhook_secret="secret"),
+                serve=Serve(debounce_seconds=0.05, port=0),
+            ),
+            process=process,
+        )
+        self.server.start()
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def post(self, event: str, payload: Any) -> tuple[int, Any]:
+        body = json.dumps(payload).encode()
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.server.port}/webhook",
+            data=body,
+            headers=github_headers(event, body),
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_webhook(self):
+        for _ in range(3):
+            status, data = self.post("push", GITHUB_PUSH)
+            self.assertEqual(202, status)
+            self.assertEqual({"queued": "github.com/wndhydrnt/rcmt-test"}, data)
+
+        self.assertTrue(self.event.wait(5.0))
+        self.server.stop()
+        self.assertEqual(
+            ["github.com/wndhydrnt/rcmt-test"],
+            self.processed,
+            "Should process a burst of events once",
+        )
+
+    def test_webhook__ignored_event(self):
+        status, data = self.post("star", GITHUB_PUSH)
+
+        self.assertEqual(200, status)
+        self.assertEqual({"queued": None}, data)
+
+    def test_webhook__invalid_json(self):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.server.port}/webhook",
+            data=b"{",
+            headers=github_headers("push", b"{"),
+            method="POST",
+        )
+        with self.assertRaises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(request)
+
+        self.assertEqual(400, e.exception.code)
+
+    def test_webhook__body_too_large(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port)
+        connection.putrequest("POST", "/webhook")
+        connection.putheader("Content-Length", str(server.MAX_BODY_SIZE + 1))
+        connection.putheader("X-GitHub-Event", "push")
+        connection.endheaders()
+        response = connection.getresponse()
+        connection.close()
+
+        self.assertEqual(413, response.status)
+
+    def test_webhook__invalid_content_length(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port)
+        connection.putrequest("POST", "/webhook")
+        connection.putheader("Content-Length", "abc")
+        connection.putheader("X-GitHub-Event", "push")
+        connection.endheaders()
+        response = connection.getresponse()
+        connection.close()
+
+        self.assertEqual(400, response.status)
+
+    def test_healthz(self):
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{self.server.port}/healthz"
+        ) as response:
+            self.assertEqual(200, response.status)
+
+    def test_init__no_secret(self):
+        with self.assertRaises(ValueError):
+            server.Server(cfg=Config(serve=Serve(port=0)), process=lambda name: None)
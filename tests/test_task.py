@@ -2,6 +2,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import threading
 import unittest
 from unittest import mock
 
@@ -74,6 +75,61 @@ class TaskWrapperTest(unittest.TestCase):
             "Should concat prefix and slugified name of task",
         )
 
+    def test_acquire_change__no_limit(self):
+        task = mock.Mock(spec=Task)
+        task.change_limit = None
+        wrapper = TaskWrapper(t=task)
+
+        self.assertTrue(wrapper.acquire_change())
+        wrapper.release_change(changed=True)
+        self.assertTrue(wrapper.acquire_change())
+        self.assertEqual(1, wrapper.changes_total)
+
+    def test_acquire_change__limit_reached(self):
+        task = mock.Mock(spec=Task)
+        task.change_limit = 1
+        wrapper = TaskWrapper(t=task)
+
+        self.assertTrue(wrapper.acquire_change())
+        wrapper.release_change(changed=True)
+
+        self.assertFalse(
+            wrapper.acquire_change(), "Should not hand out more changes than the limit"
+        )
+        self.assertEqual(1, wrapper.changes_total)
+
+    def test_reset_changes(self):
+        task = mock.Mock(spec=Task)
+        task.change_limit = 1
+        wrapper = TaskWrapper(t=task)
+        self.assertTrue(wrapper.acquire_change())
+        wrapper.release_change(changed=True)
+
+        wrapper.reset_changes()
+
+        self.assertEqual(0, wrapper.changes_total)
+        self.assertTrue(wrapper.acquire_change())
+
+    def test_acquire_change__wait_for_change_in_flight(self):
+        task = mock.Mock(spec=Task)
+        task.change_limit = 1
+        wrapper = TaskWrapper(t=task)
+        results: list[bool] = []
+        self.assertTrue(wrapper.acquire_change())
+        waiting = threading.Thread(
+            target=lambda: results.append(wrapper.acquire_change())
+        )
+        waiting.start()
+
+        wrapper.release_change(changed=False)
+        waiting.join(timeout=5)
+
+        self.assertListEqual(
+            [True],
+            results,
+            "Should hand out the change again because the first worker did not use it",
+        )
+
 
 class TaskRegistryTest(unittest.TestCase):
     def test_register__task_path_not_set(self):
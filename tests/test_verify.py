@@ -69,3 +69,38 @@ class ExecuteTest(unittest.TestCase):
         task_two.filter.assert_called()
         task_two.apply.assert_not_called()
         checkout_dir.cleanup()
+
+    @unittest.mock.patch("rcmt.task.read")
+    @unittest.mock.patch("rcmt.git.Git")
+    def test_execute__prepare_fails(self, git_class_mock, task_read_mock):
+        task_read_mock.return_value = None
+
+        opts = Options(cfg=Config())
+        opts.task_paths = ["/tmp/run.py"]
+
+        repository_mock = unittest.mock.Mock(spec=source.Repository)
+        source_mock = unittest.mock.Mock(spec=source.Base)
+        source_mock.create_from_name.return_value = repository_mock
+        opts.sources["github.com"] = source_mock
+
+        task = unittest.mock.Mock(spec=TaskWrapper)
+        task.name = "one"
+        task.filter.return_value = True
+        registry.tasks.append(task)
+
+        git_mock = unittest.mock.Mock(spec=Git)
+        git_mock.prepare.side_effect = RuntimeError("unit test")
+        git_class_mock.return_value = git_mock
+
+        with open("/dev/null", "w") as f:
+            with self.assertRaises(RuntimeError):
+                execute(
+                    directory="/tmp/repository",
+                    opts=opts,
+                    out=f,
+                    repo_name="github.com/wndhydrnt/rcmt",
+                    task_name="",
+                )
+
+        task.apply.assert_not_called()
+        git_mock.close.assert_called_once_with()
@@ -0,0 +1,302 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import threading
+import unittest
+import unittest.mock
+from datetime import datetime, timedelta, timezone
+
+from rcmt import database, workqueue
+from rcmt.config import Config
+from rcmt.config import Database as DatabaseConfig
+from rcmt.config import Queue
+from rcmt.database import Database, WorkItem
+from rcmt.rcmt import Options, Watermarks, execute, execute_worker
+from rcmt.source import Base
+from rcmt.task import Task, TaskWrapper, registry
+
+
+def new_repository(name: str) -> unittest.mock.Mock:
+    repository = unittest.mock.Mock()
+    repository.full_name = f"github.com/wndhydrnt/{name}"
+    repository.name = name
+    repository.updated_at = datetime.now(tz=timezone.utc)
+    return repository
+
+
+def new_task_wrapper(name: str, checksum: str, change_limit=None) -> TaskWrapper:
+    t = Task()
+    t.name = name
+    t.change_limit = change_limit
+    wrapper = TaskWrapper(t)
+    wrapper.checksum = checksum
+    return wrapper
+
+
+class DatabaseQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db: Database = database.new_database(DatabaseConfig())
+        self.queue_id, _ = workqueue.enqueue(
+            db=self.db,
+            repositories=iter([new_repository("one"), new_repository("two")]),
+            tasks=[new_task_wrapper("unit-test", "abc", change_limit=1)],
+        )
+
+    def test_claim_work_item(self):
+        first = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        second = self.db.claim_work_item(
+            "worker-2", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        third = self.db.claim_work_item(
+            "worker-3", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+
+        assert first is not None and second is not None
+        self.assertEqual("github.com/wndhydrnt/one", first.repository)
+        self.assertEqual("worker-1", first.leased_by)
+        self.assertEqual("github.com/wndhydrnt/two", second.repository)
+        self.assertIsNone(third, "Should not lease an item twice")
+
+    def test_claim_work_item__other_checksum(self):
+        item = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"unit-test": "other"}
+        )
+
+        self.assertIsNone(item, "Should not lease items of another version of a Task")
+
+    def test_delete_work_items(self):
+        item = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        assert item is not None
+        self.db.complete_work_item(item, "worker-1", True)
+        now = datetime.now(tz=timezone.utc)
+
+        self.assertEqual(0, self.db.delete_work_items(now - timedelta(days=1)))
+        self.assertEqual(
+            1,
+            self.db.delete_work_items(now + timedelta(seconds=1)),
+            "Should delete only finished items",
+        )
+        self.assertEqual(
+            1, self.db.count_work_items([WorkItem.STATUS_PENDING], self.queue_id)
+        )
+        self.assertEqual(
+            {"unit-test": 0},
+            self.db.get_work_task_failures(self.queue_id),
+            "Should keep the WorkTasks of a queue with items left",
+        )
+
+        other = self.db.claim_work_item(
+            "worker-2", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        assert other is not None
+        self.db.complete_work_item(other, "worker-2", False)
+        self.db.delete_work_items(now + timedelta(seconds=1))
+
+        self.assertEqual({}, self.db.get_work_task_failures(self.queue_id))
+
+    def test_enqueue__pending(self):
+        one = new_repository("one")
+        two = new_repository("two")
+        watermarks = Watermarks(failures={two.full_name: {"failed"}})
+        failed = new_task_wrapper("failed", "abc")
+        failed.since = datetime.now(tz=timezone.utc) + timedelta(minutes=1)
+        updated = new_task_wrapper("updated", "abc")
+
+        queue_id, count = workqueue.enqueue(
+            db=self.db,
+            repositories=iter([one, two]),
+            tasks=[failed, updated],
+            pending=watermarks.pending,
+        )
+
+        self.assertEqual(2, count)
+        one_item = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"failed": "abc"}
+        )
+        assert one_item is not None
+        self.assertEqual(
+            (two.full_name, queue_id), (one_item.repository, one_item.queue_id)
+        )
+        self.assertIsNone(
+            self.db.claim_work_item(
+                "worker-1", timedelta(minutes=5), {"failed": "abc"}
+            ),
+            "Should not queue a Task for a repository not updated since its last run",
+        )
+        self.assertEqual(
+            2,
+            self.db.count_work_items([WorkItem.STATUS_PENDING], queue_id),
+            "Should queue a Task for repositories updated since its last run",
+        )
+
+    def test_save_failures(self):
+        self.db.save_checkpoints(
+            "github.com/wndhydrnt/one", {}, failed=["unit-test", "other"]
+        )
+        first = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        second = self.db.claim_work_item(
+            "worker-2", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        assert first is not None and second is not None
+        self.db.complete_work_item(first, "worker-1", True)
+        self.db.complete_work_item(second, "worker-2", False)
+
+        workqueue.save_failures(self.db, self.queue_id)
+
+        self.assertDictEqual(
+            {
+                "github.com/wndhydrnt/one": {"other"},
+                "github.com/wndhydrnt/two": {"unit-test"},
+            },
+            self.db.get_failures(),
+        )
+
+    def test_requeue_expired_work_items(self):
+        item = self.db.claim_work_item(
+            "worker-1", timedelta(seconds=-1), {"unit-test": "abc"}
+        )
+        assert item is not None
+        self.assertTrue(self.db.reserve_work_change(item))
+
+        self.assertEqual(1, self.db.requeue_expired_work_items(max_attempts=3))
+
+        self.assertFalse(
+            self.db.complete_work_item(item, "worker-1", True),
+            "Should not complete an item after its lease has expired",
+        )
+        requeued = self.db.claim_work_item(
+            "worker-2", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        assert requeued is not None
+        self.assertEqual(item.id, requeued.id)
+        self.assertEqual(1, requeued.attempts)
+        self.assertTrue(
+            self.db.reserve_work_change(requeued),
+            "Should release the change reserved by the expired lease",
+        )
+
+    def test_requeue_expired_work_items__max_attempts(self):
+        item = self.db.claim_work_item(
+            "worker-1", timedelta(seconds=-1), {"unit-test": "abc"}
+        )
+        assert item is not None
+
+        self.db.requeue_expired_work_items(max_attempts=1)
+
+        self.assertEqual(
+            1, self.db.count_work_items([WorkItem.STATUS_FAILED], self.queue_id)
+        )
+        self.assertEqual(
+            {"unit-test": 1}, self.db.get_work_task_failures(self.queue_id)
+        )
+
+    def test_reserve_work_change(self):
+        first = self.db.claim_work_item(
+            "worker-1", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        second = self.db.claim_work_item(
+            "worker-2", timedelta(minutes=5), {"unit-test": "abc"}
+        )
+        assert first is not None and second is not None
+
+        self.assertTrue(self.db.reserve_work_change(first))
+        self.assertIsNone(
+            self.db.reserve_work_change(second),
+            "Should wait while the change of the other worker is in flight",
+        )
+
+        self.db.release_work_change(first, changed=False)
+        self.assertTrue(self.db.reserve_work_change(second))
+        self.db.release_work_change(second, changed=True)
+
+        self.assertFalse(self.db.reserve_work_change(first))
+        self.assertTrue(self.db.work_change_limit_reached(first))
+
+
+class DatabaseTaskWrapperTest(unittest.TestCase):
+    def test_acquire_change(self):
+        db = unittest.mock.Mock(spec=Database)
+        db.reserve_work_change.side_effect = [None, None, True]
+        sleep = unittest.mock.Mock()
+        wrapper = workqueue.DatabaseTaskWrapper(
+            wrapper=new_task_wrapper("unit-test", "abc", change_limit=1),
+            db=db,
+            item=WorkItem(),
+            poll_interval=0.5,
+            sleep=sleep,
+        )
+
+        self.assertTrue(wrapper.acquire_change())
+        self.assertEqual(2, sleep.call_count)
+        self.assertEqual("abc", wrapper.checksum)
+
+
+class WorkerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db: Database = database.new_database(DatabaseConfig())
+        registry.task_path = None
+        registry.tasks = []
+
+    @unittest.mock.patch("rcmt.database.new_database")
+    @unittest.mock.patch("rcmt.rcmt.execute_task")
+    def test_execute__enqueue(
+        self,
+        execute_task_mock: unittest.mock.MagicMock,
+        new_database_mock: unittest.mock.MagicMock,
+    ):
+        new_database_mock.return_value = self.db
+        repositories = [new_repository(f"unit-test-{i}") for i in range(4)]
+        source_mock = unittest.mock.Mock(spec=Base)
+        source_mock.list_repositories.return_value = repositories
+        source_mock.list_repositories_with_open_pull_requests.return_value = []
+        source_mock.create_from_name.side_effect = lambda name: next(
+            r for r in repositories if r.full_name == name
+        )
+        execute_task_mock.side_effect = lambda t, repo, o: repo.name != "unit-test-3"
+        opts = Options(Config(queue=Queue(poll_interval=0.01)))
+        opts.enqueue = True
+        opts.sources = {"mock": source_mock}
+        opts.task_paths = ["tests/fixtures/test_rcmt/ExecuteTest/task.py"]
+
+        results: list[bool] = []
+        coordinator = threading.Thread(target=lambda: results.append(execute(opts)))
+        coordinator.start()
+        for _ in range(500):
+            if self.db.count_work_items([WorkItem.STATUS_PENDING]) == 4:
+                break
+
+            threading.Event().wait(0.01)
+
+        registry.tasks = []
+        worker_result = execute_worker(opts, idle_timeout=0)
+        coordinator.join()
+
+        self.assertFalse(worker_result)
+        self.assertEqual([False], results)
+        execute_task_mock.assert_called()
+        self.assertCountEqual(
+            repositories, [c.args[1] for c in execute_task_mock.call_args_list]
+        )
+        self.assertTrue(
+            all(
+                isinstance(c.args[0], workqueue.DatabaseTaskWrapper)
+                for c in execute_task_mock.call_args_list
+            )
+        )
+        self.assertDictEqual(
+            {"github.com/wndhydrnt/unit-test-3": {"unit-test"}},
+            self.db.get_failures(),
+            "Should record the failure so that the next run retries it",
+        )
+        self.assertNotEqual(
+            "",
+            self.db.get_or_create_task(name="unit-test").checksum,
+            "Should update the checksum of a Task once its failures are recorded",
+        )